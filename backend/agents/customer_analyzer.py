@@ -1,22 +1,42 @@
-import openai
 import os
 import logging
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
 from dotenv import load_dotenv
 
+from backend.agents.customer_context import activity_count, build_customer_context
+from backend.agents.prompts import ANALYSIS_PROMPT, context_blocks
+from backend.agents.structured_output import parse_llm_json
+from backend.api.models import AnalysisOutput
+from backend.services.model_router import get_model_router
+from backend.services.token_budget import FittedPrompt, fit_prompt
+
 # Load environment variables
 load_dotenv()
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# Filled in for fields a partial analysis response leaves out
+ANALYSIS_DEFAULTS = {
+    "analysis": {},
+    "pain_points": [],
+    "opportunities": [],
+    "confidence_score": 0.7
+}
+
 class CustomerAnalyzer:
     """AI-powered customer analysis using OpenAI GPT-4"""
     
+    # Part of every cache key, changes whenever the prompt template does
+    PROMPT_VERSION = ANALYSIS_PROMPT.version
+    
     def __init__(self):
-        """Initialize the customer analyzer with OpenAI client"""
-        self.client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        self.model = "gpt-4"
+        """Initialize the customer analyzer with the shared model router"""
+        self.router = get_model_router()
+        # Cascade tried cheapest first, see ModelRouter
+        self.models = self.router.models("analysis")
+        # Completion allowance (ANALYSIS_MAX_TOKENS); the prompt gets the rest of the context window
+        self.max_tokens = int(os.getenv("ANALYSIS_MAX_TOKENS", 1500))
         
     async def analyze_customer(self, customer_data: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -29,11 +49,8 @@ class CustomerAnalyzer:
             Dictionary with analysis results
         """
         try:
-            # Prepare customer data for analysis
-            customer_context = self._prepare_customer_context(customer_data)
-            
-            # Create analysis prompt
-            prompt = self._create_analysis_prompt(customer_context)
+            # Create analysis prompt within the token budget
+            prompt = self._build_prompt(customer_data).prompt
             
             # Get AI analysis
             analysis_response = await self._get_ai_analysis(prompt)
@@ -48,91 +65,44 @@ class CustomerAnalyzer:
             # Return fallback analysis
             return self._get_fallback_analysis(customer_data)
     
-    def _prepare_customer_context(self, customer_data: Dict[str, Any]) -> str:
-        """Prepare customer data as context for AI analysis"""
-        company = customer_data.get("company", {})
-        contact = customer_data.get("contact", {})
-        behavioral = customer_data.get("behavioral_data", {})
-        engagement = customer_data.get("engagement_history", {})
-        
-        context = f"""
-        Company Information:
-        - Name: {company.get('name', 'N/A')}
-        - Industry: {company.get('industry', 'N/A')}
-        - Size: {company.get('size', 'N/A')}
-        - Location: {company.get('location', 'N/A')}
-        - Website: {company.get('website', 'N/A')}
-        
-        Contact Information:
-        - Name: {contact.get('name', 'N/A')}
-        - Role: {contact.get('role', 'N/A')}
-        - Email: {contact.get('email', 'N/A')}
-        - Phone: {contact.get('phone', 'N/A')}
-        
-        Behavioral Data:
-        - Recent Activities: {', '.join(behavioral.get('recent_activities', []))}
-        - Pain Points: {', '.join(behavioral.get('pain_points', []))}
-        - Budget Range: {behavioral.get('budget_range', 'N/A')}
-        - Decision Timeline: {behavioral.get('decision_timeline', 'N/A')}
-        
-        Engagement History:
-        - Last Contact: {engagement.get('last_contact', 'N/A')}
-        - Interaction Frequency: {engagement.get('interaction_frequency', 'N/A')}
-        - Preferred Communication: {engagement.get('preferred_communication', 'N/A')}
-        - Previous Purchases: {', '.join(engagement.get('previous_purchases', []))}
-        """
-        
-        return context
+    def estimate_tokens(self, customer_data: Dict[str, Any]) -> int:
+        """Upper bound of tokens one analysis spends (prompt plus completion allowance)"""
+        return self._build_prompt(customer_data).tokens + self.max_tokens
+    
+    def _build_prompt(self, customer_data: Dict[str, Any]) -> FittedPrompt:
+        """Render the analysis prompt within the token budget, dropping older activities if needed"""
+        return fit_prompt(
+            lambda activities, _: self._create_analysis_prompt(self._prepare_customer_context(customer_data, activities)),
+            ANALYSIS_PROMPT.system, self.models[0], self.router.prompt_budget("analysis", self.max_tokens),
+            activities=activity_count(customer_data)
+        )
+    
+    def _prepare_customer_context(self, customer_data: Dict[str, Any], max_activities: Optional[int] = None) -> str:
+        """Prepare customer data as context for AI analysis (memoized per customer version)"""
+        return context_blocks.get(
+            customer_data, ("customer", max_activities),
+            lambda: build_customer_context(customer_data, max_activities=max_activities)
+        )
     
     def _create_analysis_prompt(self, customer_context: str) -> str:
         """Create the AI analysis prompt"""
-        prompt = f"""
-        You are an expert sales analyst specializing in B2B customer analysis. Analyze the following customer data and provide insights for a promotional products company.
-
-        Customer Data:
-        {customer_context}
-
-        Please provide a comprehensive analysis in the following JSON format:
-        {{
-            "analysis": {{
-                "company_profile": "Brief analysis of the company's profile and position in their industry",
-                "decision_making_factors": "Key factors that influence their purchasing decisions",
-                "budget_analysis": "Analysis of their budget range and spending patterns",
-                "timeline_insights": "Insights about their decision timeline and urgency",
-                "communication_preferences": "Analysis of their preferred communication methods",
-                "previous_purchase_insights": "What their previous purchases reveal about their needs"
-            }},
-            "pain_points": [
-                "List 3-5 specific pain points this customer is facing",
-                "Focus on areas where promotional products could help"
-            ],
-            "opportunities": [
-                "List 3-5 specific sales opportunities",
-                "Include specific product categories or use cases"
-            ],
-            "confidence_score": 0.85
-        }}
-
-        Focus on actionable insights that would help a sales team understand how to approach this customer and what products to recommend.
-        """
-        
-        return prompt
+        return ANALYSIS_PROMPT.render(customer_context=customer_context)
     
     async def _get_ai_analysis(self, prompt: str) -> str:
-        """Get analysis from OpenAI API"""
+        """Get analysis from OpenAI API, escalating to a larger model on invalid or low-confidence output"""
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
+            return await self.router.complete(
+                "analysis",
                 messages=[
-                    {"role": "system", "content": "You are an expert sales analyst. Provide detailed, actionable insights in the requested JSON format."},
+                    {"role": "system", "content": ANALYSIS_PROMPT.system},
                     {"role": "user", "content": prompt}
                 ],
+                output_model=AnalysisOutput,
                 temperature=0.3,
-                max_tokens=1500
+                max_tokens=self.max_tokens,
+                confidence=lambda output: output.confidence_score
             )
             
-            return response.choices[0].message.content
-            
         except Exception as e:
             logger.error(f"Error getting AI analysis: {e}")
             raise
@@ -140,24 +110,17 @@ class CustomerAnalyzer:
     def _parse_analysis_response(self, ai_response: str, customer_data: Dict[str, Any]) -> Dict[str, Any]:
         """Parse the AI response into structured format"""
         try:
-            # Try to extract JSON from the response
-            import json
-            import re
-            
-            # Find JSON in the response
-            json_match = re.search(r'\{.*\}', ai_response, re.DOTALL)
-            if json_match:
-                parsed = json.loads(json_match.group())
+            # Find the JSON object in the response and validate it
+            output = parse_llm_json(ai_response, AnalysisOutput, defaults=ANALYSIS_DEFAULTS)
+            if output is not None:
+                parsed = output.dict()
             else:
                 # Fallback parsing
                 parsed = self._fallback_parsing(ai_response)
             
             # Ensure all required fields are present
             structured_response = {
-                "analysis": parsed.get("analysis", {}),
-                "pain_points": parsed.get("pain_points", []),
-                "opportunities": parsed.get("opportunities", []),
-                "confidence_score": parsed.get("confidence_score", 0.7)
+                field: parsed.get(field, default) for field, default in ANALYSIS_DEFAULTS.items()
             }
             
             return structured_response
@@ -0,0 +1,77 @@
+from typing import Dict, List, Any, Optional, Sequence, Tuple
+
+# Section name -> (heading, [(label, source, field, is_list)])
+CUSTOMER_SECTIONS: Dict[str, Tuple[str, List[Tuple[str, str, str, bool]]]] = {
+    "company": ("Company Information", [
+        ("Name", "company", "name", False),
+        ("Industry", "company", "industry", False),
+        ("Size", "company", "size", False),
+        ("Location", "company", "location", False),
+        ("Website", "company", "website", False),
+    ]),
+    "contact": ("Contact Information", [
+        ("Name", "contact", "name", False),
+        ("Role", "contact", "role", False),
+        ("Email", "contact", "email", False),
+        ("Phone", "contact", "phone", False),
+    ]),
+    "needs": ("Behavioral Data", [
+        ("Recent Activities", "behavioral_data", "recent_activities", True),
+        ("Pain Points", "behavioral_data", "pain_points", True),
+        ("Budget Range", "behavioral_data", "budget_range", False),
+        ("Decision Timeline", "behavioral_data", "decision_timeline", False),
+    ]),
+    "engagement": ("Engagement History", [
+        ("Last Contact", "engagement_history", "last_contact", False),
+        ("Interaction Frequency", "engagement_history", "interaction_frequency", False),
+        ("Preferred Communication", "engagement_history", "preferred_communication", False),
+        ("Previous Purchases", "engagement_history", "previous_purchases", True),
+    ]),
+}
+
+ALL_SECTIONS = ("company", "contact", "needs", "engagement")
+
+def activity_count(customer_data: Dict[str, Any]) -> int:
+    """Number of recent activities of a customer"""
+    return len(customer_data.get("behavioral_data", {}).get("recent_activities", []))
+
+def build_customer_context(customer_data: Dict[str, Any], sections: Sequence[str] = ALL_SECTIONS,
+                           max_activities: Optional[int] = None) -> str:
+    """
+    Build the customer context block shared by all agent prompts
+
+    Args:
+        customer_data: Dictionary containing customer information
+        sections: Sections to include, in order (see CUSTOMER_SECTIONS)
+        max_activities: Keep only this many of the most recent activities (listed oldest first)
+
+    Returns:
+        Context text with one heading and bullet list per section
+    """
+    blocks = []
+    for section in sections:
+        heading, fields = CUSTOMER_SECTIONS[section]
+        lines = [f"{heading}:"]
+        for label, source, field, is_list in fields:
+            value = customer_data.get(source, {}).get(field, [] if is_list else "N/A")
+            if field == "recent_activities" and max_activities is not None:
+                value = value[max(len(value) - max_activities, 0):]
+            lines.append(f"- {label}: {', '.join(value) if is_list else value}")
+        blocks.append("\n".join(lines))
+
+    return "\n\n".join(blocks)
+
+def build_analysis_context(analysis: Optional[Dict[str, Any]]) -> str:
+    """Build a context block from a previous customer analysis, empty if there is none"""
+    if not analysis:
+        return ""
+
+    lines = ["AI Analysis Insights:"]
+    for key, value in analysis.get("analysis", {}).items():
+        lines.append(f"- {key.replace('_', ' ').title()}: {value}")
+    if analysis.get("pain_points"):
+        lines.append(f"- Identified Pain Points: {'; '.join(analysis['pain_points'])}")
+    if analysis.get("opportunities"):
+        lines.append(f"- Sales Opportunities: {'; '.join(analysis['opportunities'])}")
+
+    return "\n".join(lines)
@@ -1,22 +1,135 @@
-import openai
+import asyncio
 import os
 import logging
-from typing import Dict, List, Any, Optional
+import re
+from typing import AsyncIterator, Dict, List, Any, Optional, Tuple
 from dotenv import load_dotenv
 
+from backend.agents.customer_context import activity_count, build_customer_context
+from backend.agents.prompts import (
+    EMAIL_OPTIMIZATION_PROMPT, EMAIL_PRODUCT_BLOCK, EMAIL_PROMPT, EMAIL_VARIATIONS_PROMPT, context_blocks
+)
+from backend.agents.structured_output import parse_llm_json
+from backend.api.models import EmailOutput, EmailVariationsOutput
+from backend.services.model_router import get_model_router
+from backend.services.token_budget import FittedPrompt, fit_prompt
+
 # Load environment variables
 load_dotenv()
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# Style-specific instructions
+STYLE_GUIDES = {
+    "formal": "Use professional, business-like language with formal greetings and closings. Focus on facts and data.",
+    "casual": "Use friendly, conversational tone with casual greetings. Be approachable and personable.",
+    "consultative": "Use expert, advisory tone with questions and insights. Position as a trusted consultant.",
+    "enthusiastic": "Use energetic, positive language with exclamation points. Show excitement and urgency."
+}
+
+DEFAULT_STYLE_GUIDE = "Use professional but friendly tone."
+
+# Filled in for fields a partial email response leaves out
+EMAIL_DEFAULTS = {
+    "subject": "Custom Solutions for Your Business",
+    "body": "Thank you for your interest in our products.",
+    "personalization_score": 0.7,
+    "call_to_action": "Please let me know if you have any questions.",
+    "key_points": []
+}
+
+EMAIL_STYLES = tuple(STYLE_GUIDES)
+
+_JSON_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+class EmailStreamParser:
+    """Incrementally decode string fields (e.g. subject and body) from a streamed JSON email"""
+
+    def __init__(self, fields: Tuple[str, ...] = ("subject", "body")):
+        self.text = ""
+        self._fields = {field: re.compile(r'"%s"\s*:\s*"' % field) for field in fields}
+        # Field -> position of the next undecoded character, or None once the string is closed
+        self._positions: Dict[str, Optional[int]] = {}
+
+    def feed(self, chunk: str) -> List[Tuple[str, str]]:
+        """
+        Add a streamed chunk
+
+        Args:
+            chunk: Next fragment of the model output
+
+        Returns:
+            (field, decoded text) pairs completed by this chunk, in stream order
+        """
+        self.text += chunk
+        updates = []
+        for field, pattern in self._fields.items():
+            if field not in self._positions:
+                match = pattern.search(self.text)
+                if not match:
+                    continue
+                self._positions[field] = match.end()
+
+            position = self._positions[field]
+            if position is None:
+                continue
+
+            decoded, position, closed = self._decode(position)
+            self._positions[field] = None if closed else position
+            if decoded:
+                updates.append((field, decoded))
+
+        return updates
+
+    def _decode(self, position: int) -> Tuple[str, int, bool]:
+        """Decode a JSON string from position up to its closing quote or the last complete character"""
+        text = self.text
+        decoded = []
+        while position < len(text):
+            char = text[position]
+            if char == '"':
+                return "".join(decoded), position + 1, True
+            if char != "\\":
+                decoded.append(char)
+                position += 1
+                continue
+
+            # Wait for the rest of an escape sequence split across chunks
+            if position + 1 >= len(text):
+                break
+            escape = text[position + 1]
+            if escape == "u":
+                if position + 6 > len(text):
+                    break
+                try:
+                    decoded.append(chr(int(text[position + 2:position + 6], 16)))
+                except ValueError:
+                    pass
+                position += 6
+            else:
+                decoded.append(_JSON_ESCAPES.get(escape, escape))
+                position += 2
+
+        return "".join(decoded), position, False
+
 class EmailGenerator:
     """AI-powered email generation system"""
     
+    # Part of every cache key, changes whenever the prompt or product block template does
+    PROMPT_VERSION = f"{EMAIL_PROMPT.version}+{EMAIL_VARIATIONS_PROMPT.version}+{EMAIL_PRODUCT_BLOCK.version}"
+    
     def __init__(self):
-        """Initialize the email generator with OpenAI client"""
-        self.client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        self.model = "gpt-4"
+        """Initialize the email generator with the shared model router"""
+        self.router = get_model_router()
+        # Cascade tried cheapest first, see ModelRouter
+        self.models = self.router.models("email")
+        # Completion allowance (EMAIL_MAX_TOKENS); the prompt gets the rest of the context window
+        self.max_tokens = int(os.getenv("EMAIL_MAX_TOKENS", 2000))
+        # Completion allowance per style when all variations share one completion (EMAIL_VARIATION_MAX_TOKENS)
+        self.variation_max_tokens = int(os.getenv("EMAIL_VARIATION_MAX_TOKENS", 800))
+        # Variations generated at once (EMAIL_VARIATION_CONCURRENCY)
+        self.variation_concurrency = int(os.getenv("EMAIL_VARIATION_CONCURRENCY", 4))
         
     async def generate_email(self, customer_data: Dict[str, Any], products: List[Dict[str, Any]], 
                            email_style: str, template: Optional[Dict[str, Any]] = None, 
@@ -35,12 +148,8 @@ class EmailGenerator:
             Dictionary with generated email content
         """
         try:
-            # Prepare customer and product data
-            customer_context = self._prepare_customer_context(customer_data)
-            product_context = self._prepare_product_context(products)
-            
-            # Create email generation prompt
-            prompt = self._create_email_prompt(customer_context, product_context, email_style, template, custom_message)
+            # Create email generation prompt within the token budget
+            prompt = self._build_prompt(customer_data, products, email_style, template, custom_message).prompt
             
             # Get AI-generated email
             email_response = await self._get_ai_email(prompt)
@@ -55,182 +164,187 @@ class EmailGenerator:
             # Return fallback email
             return self._get_fallback_email(customer_data, products, email_style, template)
     
-    def _prepare_customer_context(self, customer_data: Dict[str, Any]) -> str:
-        """Prepare customer data as context for email generation"""
-        company = customer_data.get("company", {})
-        contact = customer_data.get("contact", {})
-        behavioral = customer_data.get("behavioral_data", {})
-        engagement = customer_data.get("engagement_history", {})
-        
-        context = f"""
-        Customer Information:
-        - Company: {company.get('name', 'N/A')}
-        - Industry: {company.get('industry', 'N/A')}
-        - Company Size: {company.get('size', 'N/A')}
-        - Location: {company.get('location', 'N/A')}
-        - Website: {company.get('website', 'N/A')}
-        
-        Contact Person:
-        - Name: {contact.get('name', 'N/A')}
-        - Role: {contact.get('role', 'N/A')}
-        - Email: {contact.get('email', 'N/A')}
-        - Phone: {contact.get('phone', 'N/A')}
+    async def stream_email(self, customer_data: Dict[str, Any], products: List[Dict[str, Any]],
+                           email_style: str, template: Optional[Dict[str, Any]] = None,
+                           custom_message: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Generate a personalized email, yielding the subject and body as they are written
         
-        Customer Needs:
-        - Pain Points: {', '.join(behavioral.get('pain_points', []))}
-        - Budget Range: {behavioral.get('budget_range', 'N/A')}
-        - Decision Timeline: {behavioral.get('decision_timeline', 'N/A')}
-        - Recent Activities: {', '.join(behavioral.get('recent_activities', []))}
+        Args:
+            customer_data: Dictionary containing customer information
+            products: List of selected products
+            email_style: Style of email (formal, casual, consultative, enthusiastic)
+            template: Optional email template to use
+            custom_message: Optional additional custom message
+            
+        Yields:
+            {"field": "subject" or "body", "delta": text} while the model streams, then
+            {"email": structured email} once the full response is parsed (fallback email on failure)
         
-        Relationship Context:
-        - Last Contact: {engagement.get('last_contact', 'N/A')}
-        - Interaction Frequency: {engagement.get('interaction_frequency', 'N/A')}
-        - Preferred Communication: {engagement.get('preferred_communication', 'N/A')}
-        - Previous Purchases: {', '.join(engagement.get('previous_purchases', []))}
+        The first model of the cascade is streamed. If its output is rejected, the remaining
+        models are tried without streaming, so the final email event may differ from the deltas.
         """
+        parser = EmailStreamParser()
+        try:
+            prompt = self._build_prompt(customer_data, products, email_style, template, custom_message).prompt
+            messages = self._email_messages(prompt)
+            
+            async for chunk in self.router.llm.stream_chat(
+                model=self.models[0], messages=messages, temperature=0.7, max_tokens=self.max_tokens
+            ):
+                for field, delta in parser.feed(chunk):
+                    yield {"field": field, "delta": delta}
+            
+            response = parser.text
+            reason = self.router.rejection_reason("email", response, EmailOutput, self._confidence)
+            if reason is not None and len(self.models) > 1:
+                logger.info(f"Routing email: streamed {self.models[0]} output {reason}, escalating to {self.models[1]}")
+                response = await self._get_ai_email(prompt, models=self.models[1:])
+            
+            email = self._parse_email_response(response, customer_data, products, email_style)
+        except Exception as e:
+            logger.error(f"Error streaming email: {e}")
+            email = self._get_fallback_email(customer_data, products, email_style, template)
         
-        return context
+        yield {"email": email}
+    
+    def _build_prompt(self, customer_data: Dict[str, Any], products: List[Dict[str, Any]], email_style: str,
+                      template: Optional[Dict[str, Any]] = None, custom_message: Optional[str] = None) -> FittedPrompt:
+        """Render the email prompt within the token budget, dropping older activities, then the last products"""
+        return fit_prompt(
+            lambda activities, items: self._create_email_prompt(
+                self._prepare_customer_context(customer_data, activities),
+                self._prepare_product_context(products[:items]),
+                email_style, template, custom_message
+            ),
+            EMAIL_PROMPT.system, self.models[0], self.router.prompt_budget("email", self.max_tokens),
+            activities=activity_count(customer_data), items=len(products)
+        )
+    
+    def _prepare_customer_context(self, customer_data: Dict[str, Any], max_activities: Optional[int] = None) -> str:
+        """Prepare customer data as context for email generation"""
+        return context_blocks.get(
+            customer_data, ("customer", max_activities),
+            lambda: build_customer_context(customer_data, max_activities=max_activities)
+        )
     
     def _prepare_product_context(self, products: List[Dict[str, Any]]) -> str:
-        """Prepare product information for email generation"""
+        """Prepare product information for email generation from per-product blocks memoized by product version"""
         if not products:
             return "No specific products selected"
         
-        product_summaries = []
-        for product in products:
-            summary = f"""
-            Product: {product.get('name', 'N/A')}
-            Category: {product.get('category', 'N/A')}
-            Price Range: {product.get('price_range', 'N/A')}
-            Description: {product.get('description', 'N/A')}
-            Benefits: {', '.join(product.get('benefits', []))}
-            Target Use Cases: {', '.join(product.get('target_audience', {}).get('use_cases', []))}
-            """
-            product_summaries.append(summary)
-        
-        return "\n".join(product_summaries)
+        return "\n\n".join(
+            context_blocks.get(product, "email_product", lambda product=product: self._render_product_block(product))
+            for product in products
+        )
+    
+    def _render_product_block(self, product: Dict[str, Any]) -> str:
+        return EMAIL_PRODUCT_BLOCK.render(
+            name=str(product.get("name", "N/A")),
+            category=str(product.get("category", "N/A")),
+            price_range=str(product.get("price_range", "N/A")),
+            description=str(product.get("description", "N/A")),
+            benefits=", ".join(product.get("benefits", [])),
+            use_cases=", ".join(product.get("target_audience", {}).get("use_cases", []))
+        )
     
     def _create_email_prompt(self, customer_context: str, product_context: str, 
                            email_style: str, template: Optional[Dict[str, Any]] = None, 
                            custom_message: Optional[str] = None) -> str:
         """Create the AI email generation prompt"""
+        template_context, custom_context = self._optional_context(template, custom_message)
         
-        # Style-specific instructions
-        style_instructions = {
-            "formal": "Use professional, business-like language with formal greetings and closings. Focus on facts and data.",
-            "casual": "Use friendly, conversational tone with casual greetings. Be approachable and personable.",
-            "consultative": "Use expert, advisory tone with questions and insights. Position as a trusted consultant.",
-            "enthusiastic": "Use energetic, positive language with exclamation points. Show excitement and urgency."
-        }
-        
-        style_guide = style_instructions.get(email_style, "Use professional but friendly tone.")
+        return EMAIL_PROMPT.render(
+            customer_context=customer_context,
+            product_context=product_context,
+            email_style=email_style,
+            style_guide=STYLE_GUIDES.get(email_style, DEFAULT_STYLE_GUIDE),
+            template_context=template_context,
+            custom_context=custom_context
+        )
+    
+    def _create_variations_prompt(self, customer_context: str, product_context: str, styles: List[str],
+                                  template: Optional[Dict[str, Any]] = None, custom_message: Optional[str] = None) -> str:
+        """Create the prompt asking for one email per style in a single completion"""
+        template_context, custom_context = self._optional_context(template, custom_message)
         
+        return EMAIL_VARIATIONS_PROMPT.render(
+            customer_context=customer_context,
+            product_context=product_context,
+            style_guides="\n".join(f"- {style}: {STYLE_GUIDES.get(style, DEFAULT_STYLE_GUIDE)}" for style in styles),
+            template_context=template_context,
+            custom_context=custom_context
+        )
+    
+    def _optional_context(self, template: Optional[Dict[str, Any]], custom_message: Optional[str]) -> Tuple[str, str]:
+        """Template and custom message sections of a prompt, empty when not given"""
         # Template context
         template_context = ""
         if template:
-            template_context = f"""
-            Email Template to Follow:
-            Subject: {template.get('subject_template', 'Custom Solutions for {company_name}')}
-            Style: {template.get('style', 'professional')}
-            Template Structure: {template.get('template', {})}
-            """
+            template_context = (
+                "\n\nEmail Template to Follow:"
+                f"\nSubject: {template.get('subject_template', 'Custom Solutions for {company_name}')}"
+                f"\nStyle: {template.get('style', 'professional')}"
+                f"\nTemplate Structure: {template.get('template', {})}"
+            )
         
         # Custom message context
         custom_context = ""
         if custom_message:
-            custom_context = f"""
-            Additional Custom Message to Include:
-            {custom_message}
-            """
-        
-        prompt = f"""
-        You are an expert sales professional writing personalized emails for promotional products. Generate a compelling email based on the following information.
-
-        Customer Profile:
-        {customer_context}
-
-        Product Information:
-        {product_context}
-
-        Email Requirements:
-        - Style: {email_style}
-        - Style Guide: {style_guide}
-        {template_context}
-        {custom_context}
-
-        Please generate the email in the following JSON format:
-        {{
-            "subject": "Compelling email subject line",
-            "body": "Complete email body with proper formatting",
-            "personalization_score": 0.95,
-            "call_to_action": "Clear next step or call to action",
-            "key_points": ["List of key points covered in the email"]
-        }}
-
-        Guidelines:
-        1. Personalize using customer's name, company, and specific details
-        2. Address their pain points and recent activities
-        3. Highlight relevant product benefits
-        4. Include a clear call to action
-        5. Match the specified email style
-        6. Keep the email concise but comprehensive
-        7. Use their preferred communication style
-        8. Reference previous interactions if applicable
-
-        Make the email feel personal and relevant to this specific customer.
-        """
+            custom_context = f"\n\nAdditional Custom Message to Include:\n{custom_message}"
         
-        return prompt
+        return template_context, custom_context
     
-    async def _get_ai_email(self, prompt: str) -> str:
-        """Get email from OpenAI API"""
+    async def _get_ai_email(self, prompt: str, task: str = "email", models: Optional[List[str]] = None) -> str:
+        """Get email from OpenAI API, escalating to a larger model on invalid or low-confidence output"""
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are an expert sales professional. Generate compelling, personalized emails in the requested JSON format."},
-                    {"role": "user", "content": prompt}
-                ],
+            return await self.router.complete(
+                task,
+                messages=self._email_messages(prompt),
+                output_model=EmailOutput,
                 temperature=0.7,
-                max_tokens=2000
+                max_tokens=self.max_tokens,
+                confidence=self._confidence,
+                models=models
             )
             
-            return response.choices[0].message.content
-            
         except Exception as e:
             logger.error(f"Error getting AI email: {e}")
             raise
     
+    def _confidence(self, output: EmailOutput) -> float:
+        """The model's own personalization score"""
+        return output.personalization_score
+    
+    def _email_messages(self, prompt: str) -> List[Dict[str, str]]:
+        """Chat messages for an email generation prompt"""
+        return [
+            {"role": "system", "content": EMAIL_PROMPT.system},
+            {"role": "user", "content": prompt}
+        ]
+    
     def _parse_email_response(self, ai_response: str, customer_data: Dict[str, Any], 
                             products: List[Dict[str, Any]], email_style: str) -> Dict[str, Any]:
         """Parse the AI response into structured email format"""
         try:
-            import json
-            import re
-            
-            # Find JSON in the response
-            json_match = re.search(r'\{.*\}', ai_response, re.DOTALL)
-            if json_match:
-                parsed = json.loads(json_match.group())
+            # Find the JSON object in the response and validate it
+            output = parse_llm_json(ai_response, EmailOutput, defaults=EMAIL_DEFAULTS)
+            if output is not None:
+                parsed = output.dict()
             else:
                 # Fallback parsing
                 parsed = self._fallback_parsing(ai_response, customer_data, products)
             
-            # Ensure all required fields are present
-            structured_email = {
-                "subject": parsed.get("subject", "Custom Solutions for Your Business"),
-                "body": parsed.get("body", "Thank you for your interest in our products."),
-                "personalization_score": parsed.get("personalization_score", 0.7),
-                "call_to_action": parsed.get("call_to_action", "Please let me know if you have any questions."),
-                "key_points": parsed.get("key_points", [])
-            }
-            
-            return structured_email
+            return self._structured_email(parsed)
             
         except Exception as e:
             logger.error(f"Error parsing email response: {e}")
             return self._get_fallback_email(customer_data, products, email_style)
     
+    def _structured_email(self, parsed: Dict[str, Any]) -> Dict[str, Any]:
+        """Ensure all required fields are present"""
+        return {field: parsed.get(field, default) for field, default in EMAIL_DEFAULTS.items()}
+    
     def _fallback_parsing(self, ai_response: str, customer_data: Dict[str, Any], 
                          products: List[Dict[str, Any]]) -> Dict[str, Any]:
         """Fallback parsing when JSON extraction fails"""
@@ -262,7 +376,7 @@ class EmailGenerator:
     
     def _get_fallback_email(self, customer_data: Dict[str, Any], products: List[Dict[str, Any]], 
                            email_style: str, template: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
-        """Provide fallback email when AI fails"""
+        """Provide fallback email when AI fails, marked with "fallback" so it isn't cached"""
         try:
             company = customer_data.get("company", {})
             contact = customer_data.get("contact", {})
@@ -333,6 +447,7 @@ class EmailGenerator:
             body = "\n".join(body_parts)
             
             return {
+                "fallback": True,
                 "subject": subject,
                 "body": body,
                 "personalization_score": 0.7,
@@ -348,6 +463,7 @@ class EmailGenerator:
         except Exception as e:
             logger.error(f"Error in fallback email: {e}")
             return {
+                "fallback": True,
                 "subject": "Custom Solutions for Your Business",
                 "body": "Thank you for your interest in our products. I'd be happy to discuss how we can help your business.",
                 "personalization_score": 0.5,
@@ -356,46 +472,107 @@ class EmailGenerator:
             }
     
     async def generate_email_variations(self, customer_data: Dict[str, Any], products: List[Dict[str, Any]], 
-                                      base_template: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
-        """Generate multiple email variations for A/B testing"""
+                                      base_template: Optional[Dict[str, Any]] = None, styles: Optional[List[str]] = None,
+                                      custom_message: Optional[str] = None, single_completion: bool = False) -> List[Dict[str, Any]]:
+        """
+        Generate multiple email variations for A/B testing
+        
+        Args:
+            customer_data: Dictionary containing customer information
+            products: List of selected products
+            base_template: Optional email template to use
+            styles: Styles to generate, defaults to every style in STYLE_GUIDES
+            custom_message: Optional additional custom message
+            single_completion: Write all styles in one completion instead of one completion
+                per style (at most variation_concurrency at a time)
+            
+        Returns:
+            One email per style, in the order of styles, each with its "style"
+        """
+        styles = list(dict.fromkeys(styles or EMAIL_STYLES))
         try:
-            variations = []
-            styles = ["formal", "casual", "consultative", "enthusiastic"]
+            if single_completion:
+                return await self._generate_variations_together(customer_data, products, styles, base_template, custom_message)
             
-            for style in styles:
-                email = await self.generate_email(customer_data, products, style, base_template)
+            semaphore = asyncio.Semaphore(self.variation_concurrency)
+            
+            async def generate(style: str) -> Dict[str, Any]:
+                async with semaphore:
+                    email = await self.generate_email(customer_data, products, style, base_template, custom_message)
                 email["style"] = style
-                variations.append(email)
+                return email
             
-            return variations
+            return list(await asyncio.gather(*[generate(style) for style in styles]))
             
         except Exception as e:
             logger.error(f"Error generating email variations: {e}")
             return []
     
+    async def _generate_variations_together(self, customer_data: Dict[str, Any], products: List[Dict[str, Any]],
+                                            styles: List[str], template: Optional[Dict[str, Any]] = None,
+                                            custom_message: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Generate every style in one completion; styles missing from the response get the fallback email"""
+        max_tokens = self.variation_max_tokens * len(styles)
+        try:
+            prompt = fit_prompt(
+                lambda activities, items: self._create_variations_prompt(
+                    self._prepare_customer_context(customer_data, activities),
+                    self._prepare_product_context(products[:items]),
+                    styles, template, custom_message
+                ),
+                EMAIL_VARIATIONS_PROMPT.system, self.models[0], self.router.prompt_budget("email_variations", max_tokens),
+                activities=activity_count(customer_data), items=len(products)
+            ).prompt
+            
+            requested = {style.lower() for style in styles}
+            
+            def confidence(output: EmailVariationsOutput) -> float:
+                # Share of the requested styles the response covers
+                return len(requested & {item.style.lower() for item in output.variations}) / len(requested)
+            
+            response = await self.router.complete(
+                "email_variations",
+                messages=[
+                    {"role": "system", "content": EMAIL_VARIATIONS_PROMPT.system},
+                    {"role": "user", "content": prompt}
+                ],
+                output_model=EmailVariationsOutput,
+                temperature=0.7,
+                max_tokens=max_tokens,
+                confidence=confidence
+            )
+            output = parse_llm_json(response, EmailVariationsOutput)
+        except Exception as e:
+            logger.error(f"Error generating email variations in one completion: {e}")
+            output = None
+        
+        by_style = {item.style.lower(): item for item in output.variations} if output is not None else {}
+        emails = []
+        for style in styles:
+            item = by_style.get(style.lower())
+            if item is not None:
+                email = self._structured_email(item.dict(exclude={"style"}))
+            else:
+                email = self._get_fallback_email(customer_data, products, style, template)
+            email["style"] = style
+            emails.append(email)
+        
+        return emails
+    
     async def optimize_email_for_response(self, customer_data: Dict[str, Any], products: List[Dict[str, Any]], 
                                         email_style: str) -> Dict[str, Any]:
         """Optimize email for maximum response rate"""
         try:
             # Add response optimization to the prompt
-            optimization_prompt = f"""
-            Optimize the following email for maximum response rate:
-            
-            Customer: {customer_data.get('company', {}).get('name', 'N/A')}
-            Industry: {customer_data.get('company', {}).get('industry', 'N/A')}
-            Preferred Communication: {customer_data.get('engagement_history', {}).get('preferred_communication', 'N/A')}
-            
-            Focus on:
-            1. Compelling subject line that creates curiosity
-            2. Strong opening that grabs attention
-            3. Clear value proposition
-            4. Specific, actionable call to action
-            5. Social proof or urgency elements
-            6. Personalization that shows research
-            """
+            company = customer_data.get('company', {})
+            optimization_prompt = EMAIL_OPTIMIZATION_PROMPT.render(
+                company_name=str(company.get('name', 'N/A')),
+                industry=str(company.get('industry', 'N/A')),
+                preferred_communication=str(customer_data.get('engagement_history', {}).get('preferred_communication', 'N/A'))
+            )
             
             # Get optimized email
-            optimized_response = await self._get_ai_email(optimization_prompt)
+            optimized_response = await self._get_ai_email(optimization_prompt, task="email_optimization")
             return self._parse_email_response(optimized_response, customer_data, products, email_style)
             
         except Exception as e:
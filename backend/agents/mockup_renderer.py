@@ -0,0 +1,576 @@
+from PIL import Image, ImageDraw, ImageFont
+import os
+import logging
+import multiprocessing
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, Iterable, List, NamedTuple, Optional, Tuple
+
+from backend.services.mockup_store import MockupStore
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Font shipped with the app, so mockups look the same on every host
+BUNDLED_FONT = os.path.join(os.path.dirname(os.path.dirname(__file__)), "assets", "fonts", "DejaVuSans.ttf")
+
+# Fonts tried in order for each family after MOCKUP_FONT_PATH; system fonts are only
+# used if the bundled one is missing. Pillow looks bare file names up in the system
+# font directories
+FONT_CANDIDATES: Dict[str, List[str]] = {
+    "sans": [
+        BUNDLED_FONT,
+        "arial.ttf",
+        "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+        "/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf",
+        "/System/Library/Fonts/Supplemental/Arial.ttf",
+        "DejaVuSans.ttf",
+        "LiberationSans-Regular.ttf",
+    ],
+}
+
+class FontRegistry:
+    """
+    Fonts loaded once per (family, size)
+    
+    A family's file is resolved on first use by trying MOCKUP_FONT_PATH and then the
+    family's candidates; if none loads, Pillow's default font is used for every size.
+    Safe to share between threads.
+    """
+    
+    def __init__(self, font_path: Optional[str] = None):
+        """
+        Args:
+            font_path: TrueType/OpenType file tried before the candidates (MOCKUP_FONT_PATH)
+        """
+        self.font_path = font_path or os.getenv("MOCKUP_FONT_PATH")
+        self._paths: Dict[str, Optional[str]] = {}
+        self._fonts: Dict[Tuple[str, int], Any] = {}
+        self._lock = threading.RLock()
+    
+    def resolve(self, family: str = "sans") -> Optional[str]:
+        """Font file used for a family, or None for Pillow's default font"""
+        with self._lock:
+            if family not in self._paths:
+                candidates = ([self.font_path] if self.font_path else []) + FONT_CANDIDATES.get(family, [])
+                self._paths[family] = None
+                for candidate in candidates:
+                    try:
+                        ImageFont.truetype(candidate, 10)
+                    except OSError:
+                        continue
+                    self._paths[family] = candidate
+                    break
+                
+                if self._paths[family] is None:
+                    logger.warning(
+                        f"No TrueType font found for {family} (tried {', '.join(candidates)}); mockups "
+                        f"fall back to Pillow's bitmap font, set MOCKUP_FONT_PATH to a .ttf file"
+                    )
+                elif candidate != candidates[0]:
+                    logger.warning(f"{candidates[0]} could not be loaded, using {candidate} for {family} text")
+                else:
+                    logger.info(f"Using {self._paths[family]} for {family} text")
+            return self._paths[family]
+    
+    def get(self, size: int, family: str = "sans") -> Any:
+        """Font of a family at a size, loaded on first use"""
+        key = (family, size)
+        with self._lock:
+            font = self._fonts.get(key)
+            if font is None:
+                path = self.resolve(family)
+                try:
+                    font = ImageFont.truetype(path, size) if path else ImageFont.load_default()
+                except OSError as e:
+                    logger.error(f"Error loading font {path}: {e}")
+                    font = ImageFont.load_default()
+                self._fonts[key] = font
+            return font
+    
+    def preload(self, sizes: Iterable[int], family: str = "sans"):
+        """Load a family at the given sizes ahead of rendering"""
+        for size in sizes:
+            self.get(size, family)
+
+class BrandingLayer(NamedTuple):
+    company_name: str
+    logo_placement: str
+    color_scheme: str
+    custom_text: Optional[str] = None
+
+class MockupSpec(NamedTuple):
+    """
+    Everything needed to render one image, sent to a render worker
+    
+    kind is "mockup" (product base with the branding layers composited over it in order),
+    "fallback" or "preview".
+    """
+    kind: str
+    product_name: str
+    product_category: str
+    layers: Tuple[BrandingLayer, ...] = ()
+    company_name: str = ""
+    
+    @classmethod
+    def for_product(cls, kind: str, product_data: Dict[str, Any], layers: Tuple[BrandingLayer, ...] = (),
+                    company_name: str = "") -> "MockupSpec":
+        """Spec carrying only the product fields rendering uses"""
+        return cls(kind, product_data.get("name", ""), product_data.get("category", ""), tuple(layers), company_name)
+
+# Branding overlay cropped to its drawn area, and where it goes on the mockup
+Overlay = Tuple[Image.Image, Tuple[int, int]]
+
+class MockupRenderer:
+    """
+    Synchronous Pillow drawing of product mockups, run inside render workers
+    
+    A mockup is composed of layers: the product artwork, drawn once per size, background
+    and shape, and a transparent RGBA overlay per branding, drawn once per image size and
+    cropped to what it covers. Both are cached, so rendering a variation is usually a copy
+    of the artwork and an alpha composite of the overlay's region.
+    
+    The caches are guarded by a lock, so one renderer can serve concurrent renders when
+    they run on threads (MOCKUP_RENDER_WORKERS=0). Layers are drawn outside the lock; two
+    threads missing the same key may both draw it, and the last one is kept.
+    """
+    
+    def __init__(self, fonts: Optional[FontRegistry] = None, max_overlays: Optional[int] = None):
+        """
+        Args:
+            fonts: Fonts text is drawn with, defaults to a new registry
+            max_overlays: Branding overlays kept before least recently used ones are evicted (MOCKUP_OVERLAY_CACHE_SIZE)
+        """
+        self.default_font_size = 24
+        self.fonts = fonts or FontRegistry()
+        self.max_overlays = max_overlays or int(os.getenv("MOCKUP_OVERLAY_CACHE_SIZE", 256))
+        # Product artwork by (dimensions, background, shape)
+        self._base_images: Dict[Tuple[tuple, tuple, str], Image.Image] = {}
+        # Branding overlays and their offsets by (image size, branding); branding comes from requests, so this is bounded
+        self._overlays: "OrderedDict[Tuple[tuple, BrandingLayer], Optional[Overlay]]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def font_sizes(self) -> List[int]:
+        """Every font size the renderer draws with"""
+        return [self.default_font_size, self.default_font_size - 4, 20, 14, 10]
+    
+    def preload(self, products: Iterable[Tuple[str, str]] = ()):
+        """
+        Load fonts and render product artwork ahead of the first request
+        
+        Args:
+            products: (name, category) of products whose base artwork to render
+        """
+        self.fonts.preload(self.font_sizes())
+        for name, category in products:
+            self._create_base_mockup({"name": name, "category": category})
+    
+    def render(self, spec: MockupSpec) -> Image.Image:
+        """Render the image described by a spec"""
+        product_data = {"name": spec.product_name, "category": spec.product_category}
+        
+        if spec.kind == "fallback":
+            return self._create_fallback_mockup(product_data, spec.company_name)
+        if spec.kind == "preview":
+            return self._create_product_preview(product_data)
+        
+        image = self._create_base_mockup(product_data).copy()
+        for layer in spec.layers:
+            overlay = self._get_branding_overlay(image.size, layer)
+            if overlay is not None:
+                patch, offset = overlay
+                # Using the patch's alpha as the mask composites it over the opaque artwork
+                image.paste(patch, offset, patch)
+        return image
+    
+    def _create_base_mockup(self, product_data: Dict[str, Any]) -> Image.Image:
+        """
+        Create a base mockup image for the product
+        
+        The image is shared by every product with the same dimensions, background and
+        shape, and must not be drawn on; render composites branding onto a copy.
+        """
+        try:
+            # Get product dimensions based on category
+            dimensions = self._get_product_dimensions(product_data.get("category", ""))
+            background = self._get_background_color(product_data)
+            shape = self._get_product_shape(product_data)
+            
+            key = (dimensions, background, shape)
+            with self._lock:
+                base_image = self._base_images.get(key)
+            if base_image is None:
+                # Create base image
+                base_image = Image.new('RGB', dimensions, background)
+                
+                # Add product shape/outline
+                base_image = self._add_product_shape(base_image, shape)
+                
+                with self._lock:
+                    self._base_images[key] = base_image
+            return base_image
+            
+        except Exception as e:
+            logger.error(f"Error creating base mockup: {e}")
+            # Return a simple placeholder
+            return Image.new('RGB', (400, 300), (240, 240, 240))
+    
+    def _get_product_dimensions(self, category: str) -> tuple:
+        """Get appropriate dimensions for different product categories"""
+        dimensions_map = {
+            "Office Supplies": (400, 300),
+            "Lifestyle": (350, 250),
+            "Business Accessories": (450, 350),
+            "Apparel": (300, 400),
+            "Writing Instruments": (200, 150),
+            "Safety & PPE": (400, 300),
+            "Technology": (350, 250),
+            "Kitchen & Dining": (300, 200),
+            "Office Organization": (400, 300),
+            "Outdoor & Recreation": (450, 350),
+            "Health & Wellness": (400, 300),
+            "Business Tools": (450, 350),
+            "Seasonal": (400, 300),
+            "Educational": (350, 250),
+            "Premium Gifts": (500, 400)
+        }
+        
+        return dimensions_map.get(category, (400, 300))
+    
+    def _get_background_color(self, product_data: Dict[str, Any]) -> tuple:
+        """Get background color based on product category"""
+        category = product_data.get("category", "").lower()
+        
+        color_map = {
+            "office": (245, 245, 245),  # Light gray
+            "lifestyle": (240, 248, 255),  # Alice blue
+            "business": (255, 250, 240),  # Floral white
+            "apparel": (255, 240, 245),  # Lavender blush
+            "writing": (248, 248, 255),  # Ghost white
+            "safety": (255, 245, 238),  # Seashell
+            "technology": (240, 255, 240),  # Honeydew
+            "kitchen": (255, 250, 250),  # Misty rose
+            "outdoor": (245, 255, 250),  # Mint cream
+            "health": (240, 255, 255),  # Azure
+            "premium": (250, 235, 215),  # Antique white
+            "seasonal": (255, 248, 220),  # Cornsilk
+            "educational": (248, 255, 248)  # Honeydew
+        }
+        
+        for key, color in color_map.items():
+            if key in category:
+                return color
+        
+        return (245, 245, 245)  # Default light gray
+    
+    def _get_product_shape(self, product_data: Dict[str, Any]) -> str:
+        """Get the outline drawn for a product, from its name and category"""
+        name = product_data.get("name", "").lower()
+        category = product_data.get("category", "").lower()
+        
+        if "notebook" in name or "office" in category:
+            return "notebook"
+        if "bottle" in name or "lifestyle" in category:
+            return "bottle"
+        if "shirt" in name or "apparel" in category:
+            return "shirt"
+        if "pen" in name or "writing" in category:
+            return "pen"
+        return "default"
+    
+    def _add_product_shape(self, image: Image.Image, shape: str) -> Image.Image:
+        """Add product shape/outline to the mockup"""
+        try:
+            draw = ImageDraw.Draw(image)
+            width, height = image.size
+            
+            # Define shape based on category
+            if shape == "notebook":
+                # Rectangle for notebooks, portfolios
+                shape_coords = [width//4, height//4, 3*width//4, 3*height//4]
+                draw.rectangle(shape_coords, outline=(100, 100, 100), width=3, fill=(255, 255, 255))
+                
+            elif shape == "bottle":
+                # Oval for bottles, mugs
+                shape_coords = [width//3, height//4, 2*width//3, 3*height//4]
+                draw.ellipse(shape_coords, outline=(100, 100, 100), width=3, fill=(255, 255, 255))
+                
+            elif shape == "shirt":
+                # T-shirt shape
+                shape_coords = [width//4, height//3, 3*width//4, 4*height//5]
+                draw.rectangle(shape_coords, outline=(100, 100, 100), width=3, fill=(255, 255, 255))
+                
+            elif shape == "pen":
+                # Long rectangle for pens
+                shape_coords = [width//3, height//3, 2*width//3, 2*height//3]
+                draw.rectangle(shape_coords, outline=(100, 100, 100), width=3, fill=(255, 255, 255))
+                
+            else:
+                # Default rectangle
+                shape_coords = [width//4, height//4, 3*width//4, 3*height//4]
+                draw.rectangle(shape_coords, outline=(100, 100, 100), width=3, fill=(255, 255, 255))
+            
+            return image
+            
+        except Exception as e:
+            logger.error(f"Error adding product shape: {e}")
+            return image
+    
+    def _get_branding_overlay(self, size: tuple, layer: BrandingLayer) -> Optional[Overlay]:
+        """Get the branding overlay for an image size, drawing it on first use"""
+        key = (size, layer)
+        with self._lock:
+            if key in self._overlays:
+                self._overlays.move_to_end(key)
+                return self._overlays[key]
+        
+        overlay = self._create_branding_overlay(size, *layer)
+        with self._lock:
+            self._overlays[key] = overlay
+            while len(self._overlays) > self.max_overlays:
+                self._overlays.popitem(last=False)
+        return overlay
+    
+    def _create_branding_overlay(self, size: tuple, company_name: str, logo_placement: str,
+                                 color_scheme: str, custom_text: Optional[str] = None) -> Optional[Overlay]:
+        """
+        Draw branding elements on a transparent layer
+        
+        Returns:
+            The layer cropped to its drawn area and the crop's offset, or None if nothing was drawn
+        """
+        try:
+            overlay = Image.new('RGBA', size, (0, 0, 0, 0))
+            
+            # Get color scheme
+            colors = self._get_color_scheme(color_scheme)
+            
+            # Add company name
+            if company_name:
+                self._add_company_name(overlay, company_name, logo_placement, colors)
+            
+            # Add custom text
+            if custom_text:
+                self._add_custom_text(overlay, custom_text, colors)
+            
+            # Add logo placeholder
+            self._add_logo_placeholder(overlay, logo_placement, colors)
+            
+            box = overlay.getbbox()
+            if box is None:
+                return None
+            return overlay.crop(box), box[:2]
+            
+        except Exception as e:
+            logger.error(f"Error applying branding: {e}")
+            return None
+    
+    def _get_color_scheme(self, color_scheme: str) -> Dict[str, tuple]:
+        """Get color scheme based on preference"""
+        color_schemes = {
+            "blue": {"primary": (0, 102, 204), "secondary": (51, 153, 255), "accent": (0, 51, 102)},
+            "green": {"primary": (0, 128, 0), "secondary": (34, 139, 34), "accent": (0, 100, 0)},
+            "red": {"primary": (204, 0, 0), "secondary": (255, 51, 51), "accent": (153, 0, 0)},
+            "purple": {"primary": (128, 0, 128), "secondary": (147, 112, 219), "accent": (75, 0, 130)},
+            "orange": {"primary": (255, 140, 0), "secondary": (255, 165, 0), "accent": (255, 69, 0)},
+            "gray": {"primary": (128, 128, 128), "secondary": (169, 169, 169), "accent": (105, 105, 105)},
+            "black": {"primary": (0, 0, 0), "secondary": (64, 64, 64), "accent": (32, 32, 32)},
+            "white": {"primary": (255, 255, 255), "secondary": (245, 245, 245), "accent": (220, 220, 220)}
+        }
+        
+        return color_schemes.get(color_scheme.lower(), color_schemes["blue"])
+    
+    def _add_company_name(self, image: Image.Image, company_name: str, logo_placement: str, colors: Dict[str, tuple]):
+        """Add company name to the mockup"""
+        try:
+            draw = ImageDraw.Draw(image)
+            width, height = image.size
+            
+            font = self.fonts.get(self.default_font_size)
+            
+            # Position based on logo placement
+            if logo_placement.lower() in ["front cover", "center front"]:
+                position = (width//2, height//3)
+                anchor = "mm"
+            elif logo_placement.lower() in ["side panel", "left chest"]:
+                position = (width//4, height//2)
+                anchor = "mm"
+            elif logo_placement.lower() in ["back", "back panel"]:
+                position = (width//2, 2*height//3)
+                anchor = "mm"
+            else:
+                position = (width//2, height//2)
+                anchor = "mm"
+            
+            # Draw company name
+            draw.text(position, company_name, fill=colors["primary"], font=font, anchor=anchor)
+            
+        except Exception as e:
+            logger.error(f"Error adding company name: {e}")
+    
+    def _add_custom_text(self, image: Image.Image, custom_text: str, colors: Dict[str, tuple]):
+        """Add custom text to the mockup"""
+        try:
+            draw = ImageDraw.Draw(image)
+            width, height = image.size
+            
+            font = self.fonts.get(self.default_font_size - 4)
+            
+            # Position custom text below company name
+            position = (width//2, 3*height//4)
+            
+            # Draw custom text
+            draw.text(position, custom_text, fill=colors["secondary"], font=font, anchor="mm")
+            
+        except Exception as e:
+            logger.error(f"Error adding custom text: {e}")
+    
+    def _add_logo_placeholder(self, image: Image.Image, logo_placement: str, colors: Dict[str, tuple]):
+        """Add a logo placeholder to the mockup"""
+        try:
+            draw = ImageDraw.Draw(image)
+            width, height = image.size
+            
+            # Create a simple logo placeholder (circle with "LOGO" text)
+            if logo_placement.lower() in ["front cover", "center front"]:
+                center = (width//2, height//4)
+            elif logo_placement.lower() in ["side panel", "left chest"]:
+                center = (width//4, height//3)
+            elif logo_placement.lower() in ["back", "back panel"]:
+                center = (width//2, height//4)
+            else:
+                center = (width//2, height//3)
+            
+            # Draw logo circle
+            logo_size = 40
+            logo_coords = [
+                center[0] - logo_size//2,
+                center[1] - logo_size//2,
+                center[0] + logo_size//2,
+                center[1] + logo_size//2
+            ]
+            
+            draw.ellipse(logo_coords, fill=colors["primary"], outline=colors["accent"], width=2)
+            
+            # Add "LOGO" text
+            font = self.fonts.get(10)
+            
+            draw.text(center, "LOGO", fill=colors["secondary"], font=font, anchor="mm")
+            
+        except Exception as e:
+            logger.error(f"Error adding logo placeholder: {e}")
+    
+    def _create_fallback_mockup(self, product_data: Dict[str, Any], company_name: str) -> Image.Image:
+        """Create a simple mockup with the product and company name"""
+        width, height = self._get_product_dimensions(product_data.get("category", ""))
+        fallback_image = Image.new('RGB', (width, height), (240, 240, 240))
+        
+        # Add basic text
+        draw = ImageDraw.Draw(fallback_image)
+        font = self.fonts.get(20)
+        
+        # Add product name
+        product_name = product_data.get("name") or "Product"
+        draw.text((width//2, height//3), product_name, fill=(100, 100, 100), font=font, anchor="mm")
+        
+        # Add company name
+        if company_name:
+            draw.text((width//2, 2*height//3), company_name, fill=(150, 150, 150), font=font, anchor="mm")
+        
+        return fallback_image
+    
+    def _create_product_preview(self, product_data: Dict[str, Any]) -> Image.Image:
+        """Create a smaller preview image with the product name"""
+        preview_image = Image.new('RGB', (200, 150), (245, 245, 245))
+        draw = ImageDraw.Draw(preview_image)
+        
+        # Add product name
+        font = self.fonts.get(14)
+        
+        product_name = product_data.get("name") or "Product"
+        draw.text((100, 75), product_name, fill=(100, 100, 100), font=font, anchor="mm")
+        
+        return preview_image
+
+# Per-process state of render workers
+_renderer: Optional[MockupRenderer] = None
+_worker_stores: Dict[str, MockupStore] = {}
+# Renders run on threads instead of worker processes when MOCKUP_RENDER_WORKERS=0
+_worker_lock = threading.Lock()
+
+def _start_worker(products: Tuple[Tuple[str, str], ...] = ()) -> int:
+    """Set up a render worker, preloading fonts and the artwork of the given products; returns its pid"""
+    global _renderer
+    with _worker_lock:
+        if _renderer is None:
+            _renderer = MockupRenderer()
+            _renderer.preload(products)
+    return os.getpid()
+
+def render_mockup(spec: MockupSpec, store_directory: str) -> str:
+    """
+    Render a spec and store the image, returns its id
+    
+    Runs in a render worker, so PNG encoding and the file write happen off the event loop
+    as well. Workers keep no images in memory; the API process's store caches them on read.
+    """
+    _start_worker()
+    with _worker_lock:
+        if store_directory not in _worker_stores:
+            _worker_stores[store_directory] = MockupStore(store_directory, max_memory_bytes=0)
+        store = _worker_stores[store_directory]
+    
+    return store.put(_renderer.render(spec))
+
+_render_pool: Optional[ProcessPoolExecutor] = None
+
+def _render_workers() -> int:
+    return int(os.getenv("MOCKUP_RENDER_WORKERS", os.cpu_count() or 1))
+
+def get_render_pool() -> Optional[ProcessPoolExecutor]:
+    """
+    Get the process pool mockups are rendered in
+    
+    Sized by MOCKUP_RENDER_WORKERS (defaults to the number of CPUs). Returns None when it
+    is 0, in which case mockups are rendered in the event loop's thread pool.
+    """
+    global _render_pool
+    if _render_pool is None:
+        workers = _render_workers()
+        if workers <= 0:
+            return None
+        # Spawned rather than forked: the API process runs threads that a fork would copy mid-state
+        _render_pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        logger.info(f"Started mockup render pool with {workers} workers")
+    return _render_pool
+
+def warm_render_pool(products: Iterable[Dict[str, Any]] = ()):
+    """
+    Start the render workers ahead of the first request
+    
+    Args:
+        products: Products whose base artwork each worker renders up front
+    """
+    artwork = tuple(sorted({(product.get("name", ""), product.get("category", "")) for product in products}))
+    pool = get_render_pool()
+    if pool is None:
+        _start_worker(artwork)
+        return
+    
+    for _ in range(_render_workers()):
+        pool.submit(_start_worker, artwork)
+
+def discard_render_pool(pool: ProcessPoolExecutor):
+    """Drop a pool that broke because a worker died, so the next render starts a new one"""
+    global _render_pool
+    if _render_pool is pool:
+        _render_pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def shutdown_render_pool():
+    """Stop the render workers"""
+    global _render_pool
+    pool, _render_pool = _render_pool, None
+    if pool is not None:
+        pool.shutdown(wait=True, cancel_futures=True)
@@ -1,9 +1,18 @@
-import openai
 import os
 import logging
-from typing import Dict, List, Any
+import numpy as np
+from typing import Dict, List, Any, Optional
 from dotenv import load_dotenv
 
+from backend.agents.customer_context import activity_count, build_customer_context, build_analysis_context
+from backend.agents.prompts import RECOMMENDATION_PROMPT, RECOMMENDATION_PRODUCT_BLOCK, context_blocks
+from backend.agents.structured_output import parse_llm_json
+from backend.api.models import RecommendationOutput
+from backend.services.embeddings import get_embedding_index
+from backend.services.model_router import get_model_router
+from backend.services.token_budget import FittedPrompt, fit_prompt
+from backend.services.product_scoring import get_catalog_scorer, rank
+
 # Load environment variables
 load_dotenv()
 
@@ -13,36 +22,52 @@ logger = logging.getLogger(__name__)
 class ProductRecommender:
     """AI-powered product recommendation system"""
     
+    # Part of every cache key, changes whenever the prompt or product block template does
+    PROMPT_VERSION = f"{RECOMMENDATION_PROMPT.version}+{RECOMMENDATION_PRODUCT_BLOCK.version}"
+    
     def __init__(self):
-        """Initialize the product recommender with OpenAI client"""
-        self.client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        self.model = "gpt-4"
+        """Initialize the product recommender with the shared model router"""
+        self.router = get_model_router()
+        # Cascade tried cheapest first, see ModelRouter
+        self.models = self.router.models("recommendation")
+        # Completion allowance (RECOMMENDATION_MAX_TOKENS); the prompt gets the rest of the context window
+        self.max_tokens = int(os.getenv("RECOMMENDATION_MAX_TOKENS", 2000))
+        # Products sent to the LLM for re-ranking (RECOMMENDER_SHORTLIST_SIZE)
+        self.shortlist_size = int(os.getenv("RECOMMENDER_SHORTLIST_SIZE", 12))
+        # Shortlist slots reserved for products semantically close to the pain points (RECOMMENDER_SEMANTIC_CANDIDATES)
+        self.semantic_candidates = int(os.getenv("RECOMMENDER_SEMANTIC_CANDIDATES", 4))
         
-    async def recommend_products(self, customer_data: Dict[str, Any], products: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    async def recommend_products(self, customer_data: Dict[str, Any], products: List[Dict[str, Any]],
+                                 analysis: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
         """
         Recommend products for a customer based on their profile and needs
         
+        The catalog is first narrowed locally to the best-scoring candidates (see
+        shortlist_products); only that shortlist is sent to the LLM for re-ranking.
+        
         Args:
             customer_data: Dictionary containing customer information
             products: List of available products
+            analysis: Optional result of CustomerAnalyzer.analyze_customer to build on
             
         Returns:
-            List of recommended products with match scores
+            List of recommended products with match scores; rule-based recommendations
+            returned when the LLM fails are marked with "fallback"
         """
         try:
-            # Prepare customer and product data
-            customer_context = self._prepare_customer_context(customer_data)
-            product_context = self._prepare_product_context(products)
+            # Retrieve candidate products locally
+            candidates = self.shortlist_products(customer_data, products, analysis)
             
-            # Create recommendation prompt
-            prompt = self._create_recommendation_prompt(customer_context, product_context)
+            # Create recommendation prompt within the token budget; only the candidates kept are parsed
+            fitted = self._build_prompt(customer_data, candidates, analysis)
+            candidates = candidates[:fitted.items]
             
             # Get AI recommendations
-            recommendation_response = await self._get_ai_recommendations(prompt)
+            recommendation_response = await self._get_ai_recommendations(fitted.prompt, candidates)
             
             # Parse and structure the response
             structured_recommendations = self._parse_recommendation_response(
-                recommendation_response, products, customer_data
+                recommendation_response, candidates, customer_data, analysis, catalog=products
             )
             
             return structured_recommendations
@@ -50,134 +75,149 @@ class ProductRecommender:
         except Exception as e:
             logger.error(f"Error recommending products: {e}")
             # Return fallback recommendations
-            return self._get_fallback_recommendations(customer_data, products)
+            return self._get_fallback_recommendations(customer_data, products, analysis)
     
-    def _prepare_customer_context(self, customer_data: Dict[str, Any]) -> str:
-        """Prepare customer data as context for product recommendations"""
-        company = customer_data.get("company", {})
-        behavioral = customer_data.get("behavioral_data", {})
-        engagement = customer_data.get("engagement_history", {})
-        
-        context = f"""
-        Customer Profile:
-        - Company: {company.get('name', 'N/A')}
-        - Industry: {company.get('industry', 'N/A')}
-        - Company Size: {company.get('size', 'N/A')}
-        - Location: {company.get('location', 'N/A')}
+    def shortlist_products(self, customer_data: Dict[str, Any], products: List[Dict[str, Any]],
+                           analysis: Optional[Dict[str, Any]] = None, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Select the products most likely to match a customer
         
-        Customer Needs:
-        - Pain Points: {', '.join(behavioral.get('pain_points', []))}
-        - Budget Range: {behavioral.get('budget_range', 'N/A')}
-        - Decision Timeline: {behavioral.get('decision_timeline', 'N/A')}
-        - Recent Activities: {', '.join(behavioral.get('recent_activities', []))}
+        Products are ranked by the rule-based scores; the best semantic matches for the
+        customer's pain points from the embedding index also get a place, so products
+        whose benefits are worded differently from the pain points are not missed.
         
-        Purchase History:
-        - Previous Purchases: {', '.join(engagement.get('previous_purchases', []))}
-        - Interaction Frequency: {engagement.get('interaction_frequency', 'N/A')}
+        Args:
+            customer_data: Dictionary containing customer information
+            products: List of available products
+            analysis: Optional previous customer analysis
+            limit: Maximum number of products, defaults to the configured shortlist size
+            
+        Returns:
+            Up to limit products, best match first (catalog order on ties)
         """
+        limit = limit or self.shortlist_size
+        if len(products) <= limit:
+            return products
+        
+        signals = self._customer_signals(customer_data, analysis)
+        shortlist = rank(get_catalog_scorer(products).score(signals).scores, limit).tolist()
         
-        return context
+        semantic_count = min(self.semantic_candidates, limit)
+        if semantic_count and signals["pain_points"]:
+            try:
+                similarities = get_embedding_index(products).similarities(signals["pain_points"])
+                semantic = [i for i in rank(similarities, semantic_count).tolist() if similarities[i] > 0]
+                missing = [i for i in semantic if i not in shortlist]
+                shortlist = shortlist[:limit - len(missing)] + missing
+            except Exception as e:
+                logger.error(f"Error retrieving semantic candidates: {e}")
+        
+        return [products[index] for index in shortlist]
     
-    def _prepare_product_context(self, products: List[Dict[str, Any]]) -> str:
-        """Prepare product catalog as context"""
-        product_summaries = []
+    def _build_prompt(self, customer_data: Dict[str, Any], candidates: List[Dict[str, Any]],
+                      analysis: Optional[Dict[str, Any]] = None) -> FittedPrompt:
+        """Render the recommendation prompt within the token budget, dropping older activities, then the lowest-ranked candidates"""
+        return fit_prompt(
+            lambda activities, items: self._create_recommendation_prompt(
+                self._prepare_customer_context(customer_data, analysis, activities),
+                self._prepare_product_context(candidates[:items])
+            ),
+            RECOMMENDATION_PROMPT.system, self.models[0], self.router.prompt_budget("recommendation", self.max_tokens),
+            activities=activity_count(customer_data), items=len(candidates)
+        )
+    
+    def _prepare_customer_context(self, customer_data: Dict[str, Any], analysis: Optional[Dict[str, Any]] = None,
+                                  max_activities: Optional[int] = None) -> str:
+        """Prepare customer data (and a previous analysis, if any) as context for product recommendations"""
+        sections = ("company", "needs", "engagement")
+        context = context_blocks.get(
+            customer_data, ("customer", sections, max_activities),
+            lambda: build_customer_context(customer_data, sections=sections, max_activities=max_activities)
+        )
+        if not analysis:
+            return context
         
-        for product in products:
-            target_audience = product.get("target_audience", {})
-            customization = product.get("customization_options", {})
-            
-            summary = f"""
-            Product ID: {product.get('id')}
-            Name: {product.get('name')}
-            Category: {product.get('category')}
-            Price Range: {product.get('price_range')}
-            Description: {product.get('description')}
-            Target Industries: {', '.join(target_audience.get('industries', []))}
-            Target Company Sizes: {', '.join(target_audience.get('company_size', []))}
-            Use Cases: {', '.join(target_audience.get('use_cases', []))}
-            Benefits: {', '.join(product.get('benefits', []))}
-            Customization Options: {', '.join(customization.get('colors', [])[:3])}
-            """
-            product_summaries.append(summary)
+        analysis_context = context_blocks.get(analysis, "analysis", lambda: build_analysis_context(analysis))
+        return f"{context}\n\n{analysis_context}" if analysis_context else context
+    
+    def _prepare_product_context(self, products: List[Dict[str, Any]]) -> str:
+        """Prepare product catalog as context from per-product blocks memoized by product version"""
+        return "\n\n".join(
+            context_blocks.get(product, "recommendation_product", lambda product=product: self._render_product_block(product))
+            for product in products
+        )
+    
+    def _render_product_block(self, product: Dict[str, Any]) -> str:
+        target_audience = product.get("target_audience", {})
+        customization = product.get("customization_options", {})
         
-        return "\n".join(product_summaries)
+        return RECOMMENDATION_PRODUCT_BLOCK.render(
+            id=str(product.get("id")),
+            name=str(product.get("name")),
+            category=str(product.get("category")),
+            price_range=str(product.get("price_range")),
+            description=str(product.get("description")),
+            industries=", ".join(target_audience.get("industries", [])),
+            company_sizes=", ".join(target_audience.get("company_size", [])),
+            use_cases=", ".join(target_audience.get("use_cases", [])),
+            benefits=", ".join(product.get("benefits", [])),
+            colors=", ".join(customization.get("colors", [])[:3])
+        )
     
     def _create_recommendation_prompt(self, customer_context: str, product_context: str) -> str:
         """Create the AI recommendation prompt"""
-        prompt = f"""
-        You are an expert sales consultant specializing in promotional products. Analyze the customer profile and recommend the best products from the catalog.
-
-        Customer Profile:
-        {customer_context}
-
-        Available Products:
-        {product_context}
-
-        Please provide product recommendations in the following JSON format:
-        {{
-            "recommendations": [
-                {{
-                    "product_id": 1,
-                    "match_score": 0.95,
-                    "reasoning": "Detailed explanation of why this product is a good match",
-                    "customization_suggestions": ["Specific customization recommendations"]
-                }}
-            ]
-        }}
-
-        Consider the following factors:
-        1. Industry alignment
-        2. Company size appropriateness
-        3. Budget compatibility
-        4. Pain point solutions
-        5. Previous purchase patterns
-        6. Use case relevance
-
-        Provide 5-8 recommendations with match scores between 0.0 and 1.0, where 1.0 is a perfect match.
-        Focus on actionable insights and specific customization suggestions.
+        return RECOMMENDATION_PROMPT.render(customer_context=customer_context, product_context=product_context)
+    
+    async def _get_ai_recommendations(self, prompt: str, candidates: List[Dict[str, Any]]) -> str:
         """
+        Get recommendations from OpenAI API, escalating to a larger model on invalid output
+        
+        Confidence is the share of recommendations that name a product from the prompt, so a
+        model inventing product ids is escalated.
+        """
+        candidate_ids = {product["id"] for product in candidates}
+        
+        def confidence(output: RecommendationOutput) -> float:
+            if not output.recommendations:
+                return 0.0
+            return sum(rec.product_id in candidate_ids for rec in output.recommendations) / len(output.recommendations)
         
-        return prompt
-    
-    async def _get_ai_recommendations(self, prompt: str) -> str:
-        """Get recommendations from OpenAI API"""
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
+            return await self.router.complete(
+                "recommendation",
                 messages=[
-                    {"role": "system", "content": "You are an expert sales consultant. Provide detailed product recommendations in the requested JSON format."},
+                    {"role": "system", "content": RECOMMENDATION_PROMPT.system},
                     {"role": "user", "content": prompt}
                 ],
+                output_model=RecommendationOutput,
                 temperature=0.3,
-                max_tokens=2000
+                max_tokens=self.max_tokens,
+                confidence=confidence
             )
             
-            return response.choices[0].message.content
-            
         except Exception as e:
             logger.error(f"Error getting AI recommendations: {e}")
             raise
     
-    def _parse_recommendation_response(self, ai_response: str, products: List[Dict[str, Any]], customer_data: Dict[str, Any]) -> List[Dict[str, Any]]:
-        """Parse the AI response into structured recommendations"""
+    def _parse_recommendation_response(self, ai_response: str, products: List[Dict[str, Any]], customer_data: Dict[str, Any],
+                                       analysis: Optional[Dict[str, Any]] = None,
+                                       catalog: Optional[List[Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+        """Parse the AI response into structured recommendations for the given candidate products of a catalog"""
         try:
-            import json
-            import re
-            
-            # Find JSON in the response
-            json_match = re.search(r'\{.*\}', ai_response, re.DOTALL)
-            if json_match:
-                parsed = json.loads(json_match.group())
-                recommendations = parsed.get("recommendations", [])
+            # Find the JSON object in the response and validate it
+            output = parse_llm_json(ai_response, RecommendationOutput)
+            if output is not None:
+                recommendations = [rec.dict() for rec in output.recommendations]
             else:
                 # Fallback parsing
                 recommendations = self._fallback_parsing(ai_response, products)
             
             # Enrich recommendations with product details
+            products_by_id = {p["id"]: p for p in products}
             enriched_recommendations = []
             for rec in recommendations:
                 product_id = rec.get("product_id")
-                product = next((p for p in products if p["id"] == product_id), None)
+                product = products_by_id.get(product_id)
                 
                 if product:
                     enriched_rec = {
@@ -198,7 +238,7 @@ class ProductRecommender:
             
         except Exception as e:
             logger.error(f"Error parsing recommendation response: {e}")
-            return self._get_fallback_recommendations(customer_data, products)
+            return self._get_fallback_recommendations(customer_data, catalog or products, analysis, candidates=products)
     
     def _fallback_parsing(self, ai_response: str, products: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Fallback parsing when JSON extraction fails"""
@@ -222,59 +262,52 @@ class ProductRecommender:
         
         return recommendations
     
-    def _get_fallback_recommendations(self, customer_data: Dict[str, Any], products: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """Provide fallback recommendations when AI fails"""
+    def _customer_signals(self, customer_data: Dict[str, Any], analysis: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Extract the lower-cased customer attributes used for rule-based product scoring"""
+        company = customer_data.get("company", {})
+        behavioral = customer_data.get("behavioral_data", {})
+        engagement = customer_data.get("engagement_history", {})
+        
+        pain_points = [p.lower() for p in behavioral.get("pain_points", [])]
+        if analysis:
+            pain_points = list(dict.fromkeys(pain_points + [p.lower() for p in analysis.get("pain_points", [])]))
+        
+        return {
+            "industry": company.get("industry", "").lower(),
+            "size": company.get("size", "").lower(),
+            "budget": behavioral.get("budget_range", "").lower(),
+            "pain_points": pain_points,
+            "previous_purchases": [p.lower() for p in engagement.get("previous_purchases", [])]
+        }
+    
+    def _get_fallback_recommendations(self, customer_data: Dict[str, Any], products: List[Dict[str, Any]],
+                                      analysis: Optional[Dict[str, Any]] = None,
+                                      candidates: Optional[List[Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+        """
+        Provide fallback recommendations when AI fails, marked with "fallback" so they aren't cached
+        
+        products is the whole catalog, so its compiled scorer is reused; candidates, if
+        given, limits the recommendations to those products.
+        """
         try:
-            company = customer_data.get("company", {})
-            behavioral = customer_data.get("behavioral_data", {})
-            engagement = customer_data.get("engagement_history", {})
+            # Simple rule-based recommendations, scored against the whole catalog at once
+            result = get_catalog_scorer(products).score(self._customer_signals(customer_data, analysis))
+            capped_scores = np.minimum(result.scores, 0.95)  # Cap at 0.95
             
-            # Simple rule-based recommendations
-            recommendations = []
+            # Only include good matches, sorted by match score
+            eligible = result.scores > 0.6
+            if candidates is not None:
+                candidate_ids = {p["id"] for p in candidates}
+                eligible &= np.array([p["id"] in candidate_ids for p in products], dtype=bool)
+            good_matches = np.flatnonzero(eligible)
+            top_matches = good_matches[rank(capped_scores[good_matches], 8)]
             
-            # Get customer characteristics
-            industry = company.get("industry", "").lower()
-            size = company.get("size", "").lower()
-            budget = behavioral.get("budget_range", "").lower()
-            pain_points = [p.lower() for p in behavioral.get("pain_points", [])]
-            previous_purchases = [p.lower() for p in engagement.get("previous_purchases", [])]
-            
-            for product in products:
-                match_score = 0.5  # Base score
-                reasoning = []
+            recommendations = []
+            for index in top_matches:
+                product = products[index]
+                reasoning = result.reasons(index)
                 customization_suggestions = []
                 
-                # Industry matching
-                target_industries = [i.lower() for i in product.get("target_audience", {}).get("industries", [])]
-                if industry in target_industries or any(ind in industry for ind in target_industries):
-                    match_score += 0.2
-                    reasoning.append("Industry alignment")
-                
-                # Company size matching
-                target_sizes = [s.lower() for s in product.get("target_audience", {}).get("company_size", [])]
-                if size in target_sizes or any(s in size for s in target_sizes):
-                    match_score += 0.15
-                    reasoning.append("Company size appropriate")
-                
-                # Budget matching
-                price_range = product.get("price_range", "")
-                if self._budget_matches(price_range, budget):
-                    match_score += 0.15
-                    reasoning.append("Budget compatible")
-                
-                # Pain point matching
-                benefits = [b.lower() for b in product.get("benefits", [])]
-                for pain_point in pain_points:
-                    if any(benefit in pain_point or pain_point in benefit for benefit in benefits):
-                        match_score += 0.1
-                        reasoning.append(f"Addresses pain point: {pain_point}")
-                
-                # Previous purchase pattern matching
-                for purchase in previous_purchases:
-                    if any(word in purchase for word in product.get("name", "").lower().split()):
-                        match_score += 0.1
-                        reasoning.append("Similar to previous purchases")
-                
                 # Add customization suggestions
                 customization_options = product.get("customization_options", {})
                 if customization_options.get("colors"):
@@ -282,20 +315,18 @@ class ProductRecommender:
                 if customization_options.get("logo_placement"):
                     customization_suggestions.append(f"Logo placement: {', '.join(customization_options['logo_placement'][:2])}")
                 
-                if match_score > 0.6:  # Only include good matches
-                    recommendations.append({
-                        "product_id": product["id"],
-                        "name": product["name"],
-                        "category": product["category"],
-                        "price_range": product["price_range"],
-                        "match_score": min(match_score, 0.95),  # Cap at 0.95
-                        "reasoning": "; ".join(reasoning) if reasoning else "Good match based on customer profile",
-                        "customization_suggestions": customization_suggestions
-                    })
+                recommendations.append({
+                    "product_id": product["id"],
+                    "name": product["name"],
+                    "category": product["category"],
+                    "price_range": product["price_range"],
+                    "match_score": float(capped_scores[index]),
+                    "reasoning": "; ".join(reasoning) if reasoning else "Good match based on customer profile",
+                    "customization_suggestions": customization_suggestions,
+                    "fallback": True
+                })
             
-            # Sort by match score and return top recommendations
-            recommendations.sort(key=lambda x: x["match_score"], reverse=True)
-            return recommendations[:8]
+            return recommendations
             
         except Exception as e:
             logger.error(f"Error in fallback recommendations: {e}")
@@ -308,33 +339,11 @@ class ProductRecommender:
                     "price_range": products[0]["price_range"] if products else "$15-$25",
                     "match_score": 0.7,
                     "reasoning": "Recommended based on general business needs",
-                    "customization_suggestions": ["Standard customization options available"]
+                    "customization_suggestions": ["Standard customization options available"],
+                    "fallback": True
                 }
             ]
     
-    def _budget_matches(self, price_range: str, budget_range: str) -> bool:
-        """Check if product price range matches customer budget"""
-        try:
-            # Extract numeric values from price and budget ranges
-            import re
-            
-            price_match = re.search(r'\$(\d+)-?\$?(\d+)?', price_range)
-            budget_match = re.search(r'\$(\d+)-?\$?(\d+)?', budget_range)
-            
-            if price_match and budget_match:
-                price_min = int(price_match.group(1))
-                price_max = int(price_match.group(2)) if price_match.group(2) else price_min
-                budget_min = int(budget_match.group(1))
-                budget_max = int(budget_match.group(2)) if budget_match.group(2) else budget_min
-                
-                # Check if there's overlap
-                return not (price_max < budget_min or price_min > budget_max)
-            
-            return True  # Default to True if parsing fails
-            
-        except Exception:
-            return True
-    
     async def get_personalized_suggestions(self, customer_data: Dict[str, Any], product: Dict[str, Any]) -> List[str]:
         """Get personalized customization suggestions for a specific product"""
         try:
@@ -0,0 +1,301 @@
+import hashlib
+import os
+import textwrap
+from collections import OrderedDict
+from string import Formatter
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from backend.services.result_cache import record_version
+
+class PromptTemplate:
+    """
+    A versioned prompt, compiled once into literal segments and placeholders
+
+    The version combines the declared version with a hash of the text, so editing a
+    template changes every cache key derived from it even if the version isn't bumped.
+    """
+
+    def __init__(self, name: str, version: str, system: str, text: str):
+        """
+        Args:
+            name: Template name, used in logs
+            version: Declared version, bump when the prompt's meaning changes
+            system: System message sent with the prompt
+            text: str.format-style template ("{{" for a literal brace)
+        """
+        self.name = name
+        self.system = system
+        self.text = textwrap.dedent(text).strip()
+        self.segments: List[Tuple[str, Optional[str]]] = [
+            (literal, field) for literal, field, _, _ in Formatter().parse(self.text)
+        ]
+        self.fields = [field for _, field in self.segments if field is not None]
+        digest = hashlib.sha256(f"{system}\n{self.text}".encode("utf-8")).hexdigest()
+        self.version = f"{version}.{digest[:8]}"
+
+    def render(self, **values: str) -> str:
+        """Fill the placeholders by joining the precompiled segments"""
+        parts = []
+        for literal, field in self.segments:
+            parts.append(literal)
+            if field is not None:
+                parts.append(values[field])
+        return "".join(parts)
+
+    def messages(self, **values: str) -> List[Dict[str, str]]:
+        """Chat messages for the rendered prompt"""
+        return [
+            {"role": "system", "content": self.system},
+            {"role": "user", "content": self.render(**values)}
+        ]
+
+class ContextBlockCache:
+    """LRU of rendered context blocks keyed by record version and block kind"""
+
+    def __init__(self, max_entries: Optional[int] = None):
+        """
+        Args:
+            max_entries: Blocks kept before least recently used ones are evicted (CONTEXT_BLOCK_CACHE_SIZE)
+        """
+        self.max_entries = max_entries or int(os.getenv("CONTEXT_BLOCK_CACHE_SIZE", 4096))
+        self._blocks: "OrderedDict[Tuple[str, Hashable], str]" = OrderedDict()
+        # id(record) -> (record, version); the reference keeps the id from being reused
+        self._versions: "OrderedDict[int, Tuple[Any, str]]" = OrderedDict()
+
+    def version_of(self, record: Any) -> str:
+        """Record version, hashed once per record object"""
+        entry = self._versions.get(id(record))
+        if entry is not None and entry[0] is record:
+            self._versions.move_to_end(id(record))
+            return entry[1]
+
+        version = record_version(record)
+        self._versions[id(record)] = (record, version)
+        while len(self._versions) > self.max_entries:
+            self._versions.popitem(last=False)
+        return version
+
+    def get(self, record: Any, kind: Hashable, build: Callable[[], str]) -> str:
+        """
+        Get the block of a kind for a record, building it on first use
+
+        Args:
+            record: Customer, product or analysis the block is rendered from
+            kind: What is rendered, e.g. ("customer", sections)
+            build: Renders the block
+        """
+        key = (self.version_of(record), kind)
+        block = self._blocks.get(key)
+        if block is not None:
+            self._blocks.move_to_end(key)
+            return block
+
+        block = build()
+        self._blocks[key] = block
+        while len(self._blocks) > self.max_entries:
+            self._blocks.popitem(last=False)
+        return block
+
+# Shared by all agents so a customer's block is rendered once per record version
+context_blocks = ContextBlockCache()
+
+ANALYSIS_PROMPT = PromptTemplate(
+    "analysis", "3",
+    "You are an expert sales analyst. Provide detailed, actionable insights in the requested JSON format.",
+    """
+    You are an expert sales analyst specializing in B2B customer analysis. Analyze the following customer data and provide insights for a promotional products company.
+
+    Customer Data:
+    {customer_context}
+
+    Please provide a comprehensive analysis in the following JSON format:
+    {{
+        "analysis": {{
+            "company_profile": "Brief analysis of the company's profile and position in their industry",
+            "decision_making_factors": "Key factors that influence their purchasing decisions",
+            "budget_analysis": "Analysis of their budget range and spending patterns",
+            "timeline_insights": "Insights about their decision timeline and urgency",
+            "communication_preferences": "Analysis of their preferred communication methods",
+            "previous_purchase_insights": "What their previous purchases reveal about their needs"
+        }},
+        "pain_points": [
+            "List 3-5 specific pain points this customer is facing",
+            "Focus on areas where promotional products could help"
+        ],
+        "opportunities": [
+            "List 3-5 specific sales opportunities",
+            "Include specific product categories or use cases"
+        ],
+        "confidence_score": 0.85
+    }}
+
+    Focus on actionable insights that would help a sales team understand how to approach this customer and what products to recommend.
+    """
+)
+
+RECOMMENDATION_PROMPT = PromptTemplate(
+    "recommendation", "5",
+    "You are an expert sales consultant. Provide detailed product recommendations in the requested JSON format.",
+    """
+    You are an expert sales consultant specializing in promotional products. Analyze the customer profile and recommend the best products from the catalog.
+
+    Customer Profile:
+    {customer_context}
+
+    Available Products:
+    {product_context}
+
+    Please provide product recommendations in the following JSON format:
+    {{
+        "recommendations": [
+            {{
+                "product_id": 1,
+                "match_score": 0.95,
+                "reasoning": "Detailed explanation of why this product is a good match",
+                "customization_suggestions": ["Specific customization recommendations"]
+            }}
+        ]
+    }}
+
+    Consider the following factors:
+    1. Industry alignment
+    2. Company size appropriateness
+    3. Budget compatibility
+    4. Pain point solutions
+    5. Previous purchase patterns
+    6. Use case relevance
+
+    Provide 5-8 recommendations with match scores between 0.0 and 1.0, where 1.0 is a perfect match.
+    Focus on actionable insights and specific customization suggestions.
+    """
+)
+
+RECOMMENDATION_PRODUCT_BLOCK = PromptTemplate(
+    "recommendation_product", "1", "",
+    """
+    Product ID: {id}
+    Name: {name}
+    Category: {category}
+    Price Range: {price_range}
+    Description: {description}
+    Target Industries: {industries}
+    Target Company Sizes: {company_sizes}
+    Use Cases: {use_cases}
+    Benefits: {benefits}
+    Customization Options: {colors}
+    """
+)
+
+EMAIL_PROMPT = PromptTemplate(
+    "email", "3",
+    "You are an expert sales professional. Generate compelling, personalized emails in the requested JSON format.",
+    """
+    You are an expert sales professional writing personalized emails for promotional products. Generate a compelling email based on the following information.
+
+    Customer Profile:
+    {customer_context}
+
+    Product Information:
+    {product_context}
+
+    Email Requirements:
+    - Style: {email_style}
+    - Style Guide: {style_guide}{template_context}{custom_context}
+
+    Please generate the email in the following JSON format:
+    {{
+        "subject": "Compelling email subject line",
+        "body": "Complete email body with proper formatting",
+        "personalization_score": 0.95,
+        "call_to_action": "Clear next step or call to action",
+        "key_points": ["List of key points covered in the email"]
+    }}
+
+    Guidelines:
+    1. Personalize using customer's name, company, and specific details
+    2. Address their pain points and recent activities
+    3. Highlight relevant product benefits
+    4. Include a clear call to action
+    5. Match the specified email style
+    6. Keep the email concise but comprehensive
+    7. Use their preferred communication style
+    8. Reference previous interactions if applicable
+
+    Make the email feel personal and relevant to this specific customer.
+    """
+)
+
+EMAIL_VARIATIONS_PROMPT = PromptTemplate(
+    "email_variations", "1",
+    EMAIL_PROMPT.system,
+    """
+    You are an expert sales professional writing personalized emails for promotional products. Write one version of the email for each of the styles below, for A/B testing.
+
+    Customer Profile:
+    {customer_context}
+
+    Product Information:
+    {product_context}
+
+    Email Styles:
+    {style_guides}{template_context}{custom_context}
+
+    Please generate the emails in the following JSON format, one entry per style in the order listed:
+    {{
+        "variations": [
+            {{
+                "style": "Style name as listed above",
+                "subject": "Compelling email subject line",
+                "body": "Complete email body with proper formatting",
+                "personalization_score": 0.95,
+                "call_to_action": "Clear next step or call to action",
+                "key_points": ["List of key points covered in the email"]
+            }}
+        ]
+    }}
+
+    Guidelines:
+    1. Personalize using customer's name, company, and specific details
+    2. Address their pain points and recent activities
+    3. Highlight relevant product benefits
+    4. Include a clear call to action
+    5. Match each version to its style and make the versions clearly distinct
+    6. Keep each email concise but comprehensive
+    7. Use their preferred communication style
+    8. Reference previous interactions if applicable
+
+    Make every email feel personal and relevant to this specific customer.
+    """
+)
+
+EMAIL_PRODUCT_BLOCK = PromptTemplate(
+    "email_product", "1", "",
+    """
+    Product: {name}
+    Category: {category}
+    Price Range: {price_range}
+    Description: {description}
+    Benefits: {benefits}
+    Target Use Cases: {use_cases}
+    """
+)
+
+EMAIL_OPTIMIZATION_PROMPT = PromptTemplate(
+    "email_optimization", "1",
+    EMAIL_PROMPT.system,
+    """
+    Optimize the following email for maximum response rate:
+
+    Customer: {company_name}
+    Industry: {industry}
+    Preferred Communication: {preferred_communication}
+
+    Focus on:
+    1. Compelling subject line that creates curiosity
+    2. Strong opening that grabs attention
+    3. Clear value proposition
+    4. Specific, actionable call to action
+    5. Social proof or urgency elements
+    6. Personalization that shows research
+    """
+)
@@ -0,0 +1,132 @@
+import json
+import logging
+import re
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Type, TypeVar
+
+from pydantic import BaseModel, ValidationError
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+OutputModel = TypeVar("OutputModel", bound=BaseModel)
+
+_STRUCTURAL = re.compile(r'[{}"\\]')
+_decoder = json.JSONDecoder()
+
+def _balanced_end(text: str, start: int) -> Tuple[Optional[int], List[Tuple[int, int]]]:
+    """
+    Match the "{" at start to its closing brace, ignoring braces inside JSON strings
+
+    Returns:
+        (end of the object or None if it is never closed, (start, end) spans of the
+        balanced objects directly inside it)
+    """
+    depth = 0
+    children = []
+    child_start = start
+    in_string = False
+    escaped_until = -1
+
+    # Jump between structural characters instead of stepping through every character
+    for match in _STRUCTURAL.finditer(text, start):
+        position = match.start()
+        char = text[position]
+        if in_string:
+            if position <= escaped_until:
+                continue
+            if char == "\\":
+                escaped_until = position + 1
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == "{":
+            depth += 1
+            if depth == 2:
+                child_start = position
+        elif char == "}":
+            depth -= 1
+            if depth == 0:
+                return position + 1, children
+            if depth == 1:
+                children.append((child_start, position + 1))
+
+    return None, children
+
+def iter_json_objects(text: str) -> Iterator[Any]:
+    """
+    Decode the top-level JSON objects embedded in free text, in order
+
+    Each "{" outside an object is first handed to the C JSON decoder. If that fails, the
+    object is skipped by brace matching in one linear pass; when a stray "{" is never
+    closed, the valid objects directly inside it are decoded instead. Unlike a greedy
+    regex this never backtracks, and braces in surrounding prose don't break extraction.
+
+    Args:
+        text: Model output, possibly with prose or code fences around the JSON
+
+    Yields:
+        Decoded JSON values
+    """
+    position = text.find("{")
+    while position != -1:
+        try:
+            value, end = _decoder.raw_decode(text, position)
+            yield value
+            position = text.find("{", end)
+            continue
+        except json.JSONDecodeError:
+            pass
+
+        end, children = _balanced_end(text, position)
+        if end is not None:
+            position = text.find("{", end)
+            continue
+
+        for child_start, child_end in children:
+            try:
+                yield json.loads(text[child_start:child_end])
+            except json.JSONDecodeError:
+                continue
+        return
+
+def parse_llm_json(text: str, model: Type[OutputModel],
+                   defaults: Optional[Dict[str, Any]] = None) -> Optional[OutputModel]:
+    """
+    Extract the JSON object in a model response that best matches a schema
+
+    Of the objects that validate, the one setting the most schema fields wins (the
+    first on ties), so a stray {} or example object in surrounding prose doesn't
+    shadow the real payload. Scanning stops at the first object that sets them all.
+
+    Args:
+        text: Model output
+        model: Pydantic model describing the expected object
+        defaults: Values for required fields an object leaves out, to salvage partial
+            output; the object must still set at least one of the model's fields
+
+    Returns:
+        Validated model instance, or None if no object in the text matches
+    """
+    fields = model.__fields__.keys()
+    best, best_count = None, 0
+    for parsed in iter_json_objects(text or ""):
+        if not isinstance(parsed, dict):
+            continue
+        count = len(parsed.keys() & fields)
+        if best is not None and count <= best_count:
+            continue
+        if defaults is not None:
+            if not count:
+                continue
+            parsed = dict(defaults, **parsed)
+
+        try:
+            best, best_count = model(**parsed), count
+        except ValidationError as e:
+            logger.warning(f"LLM output does not match {model.__name__}: {e.errors()[:3]}")
+            continue
+        if best_count == len(fields):
+            break
+
+    return best
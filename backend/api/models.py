@@ -14,6 +14,27 @@ class CustomerAnalysisResponse(BaseModel):
     confidence_score: float = Field(..., ge=0.0, le=1.0, description="AI confidence in analysis")
     timestamp: datetime = Field(default_factory=datetime.now)
 
+class CustomerFilter(BaseModel):
+    industry: Optional[str] = Field(None, description="Company industry")
+    size: Optional[str] = Field(None, description="Company size")
+    budget_range: Optional[str] = Field(None, description="Budget range")
+
+class BatchAnalysisRequest(BaseModel):
+    customer_ids: Optional[List[int]] = Field(None, description="IDs of the customers to analyze")
+    filter: Optional[CustomerFilter] = Field(None, description="Select customers by index filter instead of IDs")
+    concurrency: Optional[int] = Field(None, ge=1, le=64, description="Maximum analyses running at once")
+    tokens_per_minute: Optional[int] = Field(None, ge=1, description="LLM token budget per minute")
+
+class JobStatusResponse(BaseModel):
+    job_id: str
+    kind: str
+    status: str = Field(..., description="queued, running, succeeded or failed")
+    attempts: int
+    max_attempts: int
+    error: Optional[str] = Field(None, description="Error of the last failed attempt")
+    created_at: datetime
+    updated_at: datetime
+
 # Product Recommendation Models
 class ProductRecommendationRequest(BaseModel):
     customer_id: int = Field(..., description="ID of the customer")
@@ -34,6 +55,7 @@ class ProductRecommendationResponse(BaseModel):
     recommendations: List[ProductRecommendation] = Field(..., description="Product recommendations")
     top_recommendation: ProductRecommendation = Field(..., description="Best match product")
     timestamp: datetime = Field(default_factory=datetime.now)
+    computed_at: Optional[datetime] = Field(None, description="When the served recommendations were materialized")
 
 # Email Generation Models
 class EmailGenerationRequest(BaseModel):
@@ -52,6 +74,18 @@ class EmailGenerationResponse(BaseModel):
     call_to_action: str = Field(..., description="Generated call to action")
     timestamp: datetime = Field(default_factory=datetime.now)
 
+class EmailVariationsRequest(BaseModel):
+    customer_id: int = Field(..., description="ID of the customer")
+    product_ids: List[int] = Field(..., description="Selected product IDs")
+    styles: Optional[List[str]] = Field(None, description="Styles to generate, defaults to formal, casual, consultative and enthusiastic")
+    template_id: Optional[int] = Field(None, description="Email template ID")
+    custom_message: Optional[str] = Field(None, description="Additional custom message")
+    single_completion: bool = Field(False, description="Write all styles in one completion instead of one completion per style")
+
+class EmailVariationsResponse(BaseModel):
+    customer_id: int
+    variations: List[EmailGenerationResponse]
+
 # Mockup Creation Models
 class MockupCreationRequest(BaseModel):
     customer_id: int = Field(..., description="ID of the customer")
@@ -64,11 +98,24 @@ class MockupCreationRequest(BaseModel):
 class MockupCreationResponse(BaseModel):
     customer_id: int
     product_id: int
-    mockup_images: List[str] = Field(..., description="Base64 encoded mockup images")
+    mockup_images: List[str] = Field(..., description="URLs of the mockup images (GET /api/mockups/{id}.{png|webp})")
     variations: List[Dict[str, Any]] = Field(..., description="Different mockup variations")
     customization_applied: Dict[str, Any] = Field(..., description="Applied customizations")
     timestamp: datetime = Field(default_factory=datetime.now)
 
+# Pipeline Models
+class PipelineRequest(BaseModel):
+    customer_id: int = Field(..., description="ID of the customer")
+    email_style: str = Field("consultative", description="Email style: formal, casual, consultative, enthusiastic")
+    template_id: Optional[int] = Field(None, description="Email template ID")
+    custom_message: Optional[str] = Field(None, description="Additional custom message")
+    email_product_count: int = Field(1, ge=1, le=8, description="Top recommendations to feature in the email")
+    mockup_count: int = Field(2, ge=0, le=8, description="Top recommendations to render mockups for")
+    logo_placement: str = Field("front cover", description="Logo placement preference")
+    color_scheme: str = Field("blue", description="Color scheme preference")
+    custom_text: Optional[str] = Field(None, description="Custom text to add to mockups")
+    company_name: Optional[str] = Field(None, description="Company name for branding, defaults to the customer's")
+
 # Customer Data Models
 class CompanyInfo(BaseModel):
     name: str
@@ -153,4 +200,36 @@ class HealthResponse(BaseModel):
 class ErrorResponse(BaseModel):
     error: str
     message: str
-    timestamp: datetime = Field(default_factory=datetime.now) 
\ No newline at end of file
+    timestamp: datetime = Field(default_factory=datetime.now)
+
+# LLM Output Models (schemas the agents validate model responses against)
+class AnalysisOutput(BaseModel):
+    # Core fields are required so refusals and unrelated JSON fail validation and escalate;
+    # the analyzer fills in defaults when falling back
+    analysis: Dict[str, Any]
+    pain_points: List[str]
+    opportunities: List[str]
+    confidence_score: float = Field(..., ge=0.0, le=1.0)
+
+class RecommendationOutputItem(BaseModel):
+    product_id: int
+    match_score: float = Field(0.5, ge=0.0, le=1.0)
+    reasoning: str = "Good match based on customer profile"
+    customization_suggestions: List[str] = Field(default_factory=list)
+
+class RecommendationOutput(BaseModel):
+    recommendations: List[RecommendationOutputItem]
+
+class EmailOutput(BaseModel):
+    # Required for the same reason as in AnalysisOutput; the generator's fallback email covers failures
+    subject: str
+    body: str
+    personalization_score: float = Field(..., ge=0.0, le=1.0)
+    call_to_action: str = "Please let me know if you have any questions."
+    key_points: List[str] = Field(default_factory=list)
+
+class EmailVariationOutput(EmailOutput):
+    style: str
+
+class EmailVariationsOutput(BaseModel):
+    variations: List[EmailVariationOutput]
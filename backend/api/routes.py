@@ -1,5 +1,7 @@
-from fastapi import APIRouter, HTTPException, BackgroundTasks
-from typing import List, Dict, Any
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
+from typing import List, Dict, Any, Optional, Union
+import asyncio
 import json
 import os
 import logging
@@ -7,22 +9,35 @@ from datetime import datetime
 
 # Import models and agents
 from backend.api.models import (
-    CustomerAnalysisRequest, CustomerAnalysisResponse,
+    CustomerAnalysisRequest, CustomerAnalysisResponse, BatchAnalysisRequest, JobStatusResponse,
     ProductRecommendationRequest, ProductRecommendationResponse, ProductRecommendation,
-    EmailGenerationRequest, EmailGenerationResponse,
-    MockupCreationRequest, MockupCreationResponse,
+    EmailGenerationRequest, EmailGenerationResponse, EmailVariationsRequest, EmailVariationsResponse,
+    MockupCreationRequest, MockupCreationResponse, PipelineRequest,
     Customer, Product, EmailTemplate, HealthResponse
 )
 from backend.agents.customer_analyzer import CustomerAnalyzer
 from backend.agents.product_recommender import ProductRecommender
-from backend.agents.email_generator import EmailGenerator
+from backend.agents.email_generator import EmailGenerator, EMAIL_STYLES
 from backend.agents.mockup_creator import MockupCreator
+from backend.services.repository import get_repository
+from backend.services.result_cache import get_result_cache, make_cache_key, customer_tag
+from backend.services.rate_limit import TokenRateLimiter
+from backend.services.jobs import get_job_queue, PermanentJobError
+from backend.services.pipeline import Stage, StageSkipped, run_stages
+from backend.services.precompute import RecommendationPrecomputer
+from backend.services.mockup_store import MEDIA_TYPES, etag_matches, parse_byte_range
+from backend.services.token_budget import current_endpoint, get_token_meter
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+async def _attribute_tokens(request: Request):
+    """Report LLM tokens spent while handling a request under its route"""
+    route = request.scope.get("route")
+    current_endpoint.set(f"{request.method} {route.path if route else request.url.path}")
+
 # Create router
-router = APIRouter()
+router = APIRouter(dependencies=[Depends(_attribute_tokens)])
 
 # Initialize agents
 customer_analyzer = CustomerAnalyzer()
@@ -30,26 +45,14 @@ product_recommender = ProductRecommender()
 email_generator = EmailGenerator()
 mockup_creator = MockupCreator()
 
-# Load mock data
-def load_mock_data():
-    """Load mock data from JSON files"""
-    try:
-        # Load customers
-        with open("backend/data/mock_customers.json", "r") as f:
-            customers = json.load(f)
-        
-        # Load products
-        with open("backend/data/product_catalog.json", "r") as f:
-            products = json.load(f)
-        
-        # Load email templates
-        with open("backend/data/email_templates.json", "r") as f:
-            email_templates = json.load(f)
-        
-        return customers, products, email_templates
-    except Exception as e:
-        logger.error(f"Error loading mock data: {e}")
-        return [], [], []
+# Data repository (loaded once, reloaded when files change)
+repository = get_repository()
+
+# Result cache keyed on the inputs of each result
+result_cache = get_result_cache()
+
+# Durable queue for long-running work
+job_queue = get_job_queue()
 
 @router.get("/health", response_model=HealthResponse)
 async def health_check():
@@ -61,11 +64,11 @@ async def health_check():
     )
 
 @router.get("/customers", response_model=List[Customer])
-async def get_customers():
-    """Get all available customers"""
+async def get_customers(industry: Optional[str] = None, size: Optional[str] = None,
+                        budget_range: Optional[str] = None):
+    """Get all available customers, optionally filtered by industry, size or budget range"""
     try:
-        customers, _, _ = load_mock_data()
-        return customers
+        return repository.find_customers(industry=industry, size=size, budget_range=budget_range)
     except Exception as e:
         logger.error(f"Error getting customers: {e}")
         raise HTTPException(status_code=500, detail="Failed to load customers")
@@ -74,8 +77,7 @@ async def get_customers():
 async def get_customer(customer_id: int):
     """Get a specific customer by ID"""
     try:
-        customers, _, _ = load_mock_data()
-        customer = next((c for c in customers if c["id"] == customer_id), None)
+        customer = repository.get_customer(customer_id)
         
         if not customer:
             raise HTTPException(status_code=404, detail="Customer not found")
@@ -88,11 +90,18 @@ async def get_customer(customer_id: int):
         raise HTTPException(status_code=500, detail="Failed to load customer")
 
 @router.get("/products", response_model=List[Product])
-async def get_products():
-    """Get all available products"""
+async def get_products(category: Optional[str] = None, industry: Optional[str] = None,
+                       company_size: Optional[str] = None, price_bucket: Optional[str] = None,
+                       budget_range: Optional[str] = None):
+    """
+    Get all available products, optionally filtered by category, target industry, company size,
+    price bucket or a budget range like "$20-$40" (or "$1,000-$2,500") that the price range must overlap
+    """
     try:
-        _, products, _ = load_mock_data()
-        return products
+        return repository.find_products(
+            category=category, industry=industry, company_size=company_size, price_bucket=price_bucket,
+            budget_range=budget_range
+        )
     except Exception as e:
         logger.error(f"Error getting products: {e}")
         raise HTTPException(status_code=500, detail="Failed to load products")
@@ -101,8 +110,7 @@ async def get_products():
 async def get_product(product_id: int):
     """Get a specific product by ID"""
     try:
-        _, products, _ = load_mock_data()
-        product = next((p for p in products if p["id"] == product_id), None)
+        product = repository.get_product(product_id)
         
         if not product:
             raise HTTPException(status_code=404, detail="Product not found")
@@ -114,158 +122,391 @@ async def get_product(product_id: int):
         logger.error(f"Error getting product {product_id}: {e}")
         raise HTTPException(status_code=500, detail="Failed to load product")
 
-@router.post("/analyze-customer", response_model=CustomerAnalysisResponse)
-async def analyze_customer(request: CustomerAnalysisRequest):
-    """Analyze a customer using AI, with local cache"""
-    try:
-        customers, _, _ = load_mock_data()
-        customer = next((c for c in customers if c["id"] == request.customer_id), None)
-        
-        if not customer:
-            raise HTTPException(status_code=404, detail="Customer not found")
-        
-        # Caching logic
-        cache_dir = "backend/cache"
-        os.makedirs(cache_dir, exist_ok=True)
-        cache_path = os.path.join(cache_dir, f"customer_{request.customer_id}_analysis.json")
-        
-        if os.path.exists(cache_path):
-            try:
-                with open(cache_path, "r") as f:
-                    cached = json.load(f)
-                return CustomerAnalysisResponse(**cached)
-            except Exception as e:
-                logger.warning(f"Failed to load cache for customer {request.customer_id}: {e}")
-        
-        # Perform AI analysis
+def _analysis_cache_key(customer: Dict[str, Any]) -> str:
+    """Cache key of a customer analysis"""
+    return make_cache_key(
+        "analysis",
+        customer=customer,
+        models=customer_analyzer.models,
+        prompt_version=customer_analyzer.PROMPT_VERSION
+    )
+
+async def get_customer_analysis(customer: Dict[str, Any]) -> Dict[str, Any]:
+    """Get a customer analysis from cache or run it (concurrent identical requests share one call)"""
+    async def compute() -> Dict[str, Any]:
         analysis_result = await customer_analyzer.analyze_customer(customer)
         response = CustomerAnalysisResponse(
-            customer_id=request.customer_id,
+            customer_id=customer["id"],
             analysis=analysis_result["analysis"],
             pain_points=analysis_result["pain_points"],
             opportunities=analysis_result["opportunities"],
             confidence_score=analysis_result["confidence_score"]
         )
-        # Save to cache
-        try:
-            with open(cache_path, "w") as f:
-                json.dump(json.loads(response.json()), f, indent=2)
-        except Exception as e:
-            logger.warning(f"Failed to save cache for customer {request.customer_id}: {e}")
-        return response
+        return json.loads(response.json())
+
+    return await result_cache.get_or_compute(
+        _analysis_cache_key(customer), compute, tags=[customer_tag(customer["id"])]
+    )
+
+@router.post("/analyze-customer", response_model=CustomerAnalysisResponse)
+async def analyze_customer(request: CustomerAnalysisRequest):
+    """Analyze a customer using AI, with result cache"""
+    try:
+        customer = repository.get_customer(request.customer_id)
+        
+        if not customer:
+            raise HTTPException(status_code=404, detail="Customer not found")
+        
+        result = await get_customer_analysis(customer)
+        return CustomerAnalysisResponse(**result)
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Error analyzing customer {request.customer_id}: {e}")
         raise HTTPException(status_code=500, detail="Failed to analyze customer")
 
-@router.post("/recommend-products", response_model=ProductRecommendationResponse)
-async def recommend_products(request: ProductRecommendationRequest):
-    """Get AI-powered product recommendations for a customer"""
-    try:
-        customers, products, _ = load_mock_data()
-        customer = next((c for c in customers if c["id"] == request.customer_id), None)
+@router.post("/analyze-customers/batch")
+async def analyze_customers_batch(request: BatchAnalysisRequest):
+    """
+    Analyze many customers with bounded concurrency, streaming NDJSON results as they complete
+
+    Customers are selected by id, by index filter, or all customers when neither is given.
+    Cache hits are emitted immediately without using a concurrency slot or token budget.
+    Each line is a per-customer result; the last line is a summary.
+    """
+    if request.customer_ids is not None:
+        selected = [(customer_id, repository.get_customer(customer_id)) for customer_id in dict.fromkeys(request.customer_ids)]
+    elif request.filter is not None:
+        selected = [(c["id"], c) for c in repository.find_customers(**request.filter.dict())]
+    else:
+        selected = [(c["id"], c) for c in repository.list_customers()]
+
+    concurrency = request.concurrency or int(os.getenv("BATCH_CONCURRENCY", 8))
+    tokens_per_minute = request.tokens_per_minute or int(os.getenv("BATCH_TOKENS_PER_MINUTE", 0))
+    semaphore = asyncio.Semaphore(concurrency)
+    limiter = TokenRateLimiter(tokens_per_minute) if tokens_per_minute else None
+
+    async def analyze_one(customer_id: int, customer: Optional[Dict[str, Any]]) -> Dict[str, Any]:
         if not customer:
-            raise HTTPException(status_code=404, detail="Customer not found")
+            return {"customer_id": customer_id, "status": "error", "error": "Customer not found"}
+        try:
+            cached = await result_cache.get(_analysis_cache_key(customer))
+            if cached is not None:
+                return {"customer_id": customer_id, "status": "ok", "cached": True, "result": cached}
+
+            async with semaphore:
+                if limiter:
+                    await limiter.acquire(customer_analyzer.estimate_tokens(customer))
+                result = await get_customer_analysis(customer)
+            return {"customer_id": customer_id, "status": "ok", "cached": False, "result": result}
+        except Exception as e:
+            logger.error(f"Batch analysis failed for customer {customer_id}: {e}")
+            return {"customer_id": customer_id, "status": "error", "error": "Failed to analyze customer"}
+
+    async def stream():
+        tasks = [asyncio.ensure_future(analyze_one(customer_id, customer)) for customer_id, customer in selected]
+        summary = {"total": len(tasks), "succeeded": 0, "failed": 0, "cached": 0}
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                line = await next_done
+                if line["status"] == "ok":
+                    summary["succeeded"] += 1
+                    summary["cached"] += int(line["cached"])
+                else:
+                    summary["failed"] += 1
+                yield json.dumps(line, default=str) + "\n"
+            yield json.dumps({"summary": summary}) + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+async def get_recommendations(customer: Dict[str, Any], analysis: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Get product recommendations from cache or compute them (concurrent identical requests share one call)
+
+    Rule-based fallback recommendations returned when the LLM fails are not cached; the
+    result then carries "fallback": True.
+    """
+    cache_key = make_cache_key(
+        "recommendations",
+        customer=customer,
+        analysis=analysis and {k: v for k, v in analysis.items() if k != "timestamp"},
+        catalog_version=repository.snapshot.catalog_version,
+        models=product_recommender.models,
+        prompt_version=product_recommender.PROMPT_VERSION
+    )
 
-        # Caching logic
-        cache_dir = "backend/cache"
-        os.makedirs(cache_dir, exist_ok=True)
-        cache_path = os.path.join(cache_dir, f"customer_{request.customer_id}_recommendations.json")
-
-        if os.path.exists(cache_path):
-            try:
-                with open(cache_path, "r") as f:
-                    cached = json.load(f)
-                return ProductRecommendationResponse(**cached)
-            except Exception as e:
-                logger.warning(f"Failed to load recommendations cache for customer {request.customer_id}: {e}")
-
-        # Get product recommendations
-        recommendations = await product_recommender.recommend_products(customer, products)
+    async def compute() -> Dict[str, Any]:
+        recommendations = await product_recommender.recommend_products(customer, repository.list_products(), analysis)
         top_recommendation = max(recommendations, key=lambda x: x["match_score"])
         response = ProductRecommendationResponse(
-            customer_id=request.customer_id,
+            customer_id=customer["id"],
             recommendations=recommendations,
             top_recommendation=top_recommendation
         )
-        # Save to cache
-        try:
-            with open(cache_path, "w") as f:
-                json.dump(json.loads(response.json()), f, indent=2)
-        except Exception as e:
-            logger.warning(f"Failed to save recommendations cache for customer {request.customer_id}: {e}")
-        return response
+        return dict(json.loads(response.json()), fallback=any(rec.get("fallback", False) for rec in recommendations))
+
+    return await result_cache.get_or_compute(
+        cache_key,
+        compute,
+        tags=[customer_tag(customer["id"])],
+        cacheable=lambda result: not result.get("fallback", False)
+    )
+
+# Materialized top-N recommendations, refreshed when customers or shortlisted products change
+recommendation_precomputer = RecommendationPrecomputer(product_recommender, repository, get_recommendations)
+
+@router.post("/recommend-products", response_model=ProductRecommendationResponse)
+async def recommend_products(request: ProductRecommendationRequest):
+    """Get AI-powered product recommendations for a customer, served from the precomputed table"""
+    try:
+        customer = repository.get_customer(request.customer_id)
+        if not customer:
+            raise HTTPException(status_code=404, detail="Customer not found")
+
+        result = await recommendation_precomputer.get(customer)
+        return ProductRecommendationResponse(**result)
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Error recommending products for customer {request.customer_id}: {e}")
         raise HTTPException(status_code=500, detail="Failed to recommend products")
 
+def _email_cache_key(customer: Dict[str, Any], products: List[Dict[str, Any]], email_style: str,
+                     template: Optional[Dict[str, Any]], custom_message: Optional[str]) -> str:
+    """Cache key of a generated email"""
+    return make_cache_key(
+        "email",
+        customer=customer,
+        products=products,
+        style=email_style,
+        template=template,
+        custom_message=custom_message,
+        models=email_generator.models,
+        prompt_version=email_generator.PROMPT_VERSION
+    )
+
+def _email_response(customer: Dict[str, Any], email_style: str, email_result: Dict[str, Any]) -> Dict[str, Any]:
+    """Cacheable EmailGenerationResponse for a generated email"""
+    response = EmailGenerationResponse(
+        customer_id=customer["id"],
+        subject=email_result["subject"],
+        body=email_result["body"],
+        style=email_style,
+        personalization_score=email_result["personalization_score"],
+        call_to_action=email_result["call_to_action"]
+    )
+    return json.loads(response.json())
+
+async def get_email(customer: Dict[str, Any], products: List[Dict[str, Any]], email_style: str,
+                    template: Optional[Dict[str, Any]] = None, custom_message: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Get a generated email from cache or generate it (concurrent identical requests share one call)
+
+    Fallback emails returned when generation fails are not cached.
+    """
+    fallback = False
+
+    async def compute() -> Dict[str, Any]:
+        nonlocal fallback
+        email_result = await email_generator.generate_email(customer, products, email_style, template, custom_message)
+        fallback = email_result.get("fallback", False)
+        return _email_response(customer, email_style, email_result)
+
+    return await result_cache.get_or_compute(
+        _email_cache_key(customer, products, email_style, template, custom_message),
+        compute,
+        tags=[customer_tag(customer["id"])],
+        cacheable=lambda result: not fallback
+    )
+
+async def get_email_variations(customer: Dict[str, Any], products: List[Dict[str, Any]], styles: List[str],
+                               template: Optional[Dict[str, Any]] = None, custom_message: Optional[str] = None,
+                               single_completion: bool = False) -> List[Dict[str, Any]]:
+    """
+    Get one email per style, each cached under the same key as a single generated email
+
+    Missing styles are generated concurrently (at most email_generator.variation_concurrency
+    at a time), or together in one completion when single_completion is set. Fallback
+    emails are not cached.
+    """
+    if not single_completion:
+        semaphore = asyncio.Semaphore(email_generator.variation_concurrency)
+
+        async def generate(style: str) -> Dict[str, Any]:
+            async with semaphore:
+                return await get_email(customer, products, style, template, custom_message)
+
+        return list(await asyncio.gather(*[generate(style) for style in styles]))
+
+    cache_keys = {style: _email_cache_key(customer, products, style, template, custom_message) for style in styles}
+    cached = await asyncio.gather(*[result_cache.get(cache_keys[style]) for style in styles])
+    results = {style: result for style, result in zip(styles, cached) if result is not None}
+
+    missing = [style for style in styles if style not in results]
+    if missing:
+        emails = await email_generator.generate_email_variations(
+            customer, products, template, missing, custom_message, single_completion=True
+        )
+        for email in emails:
+            result = _email_response(customer, email["style"], email)
+            if not email.get("fallback", False):
+                await result_cache.set(cache_keys[email["style"]], result, tags=[customer_tag(customer["id"])])
+            results[email["style"]] = result
+
+    return [results[style] for style in styles]
+
+def _email_inputs(request: Union[EmailGenerationRequest, EmailVariationsRequest]):
+    """Resolve the customer, products and template of an email request"""
+    customer = repository.get_customer(request.customer_id)
+    if not customer:
+        raise HTTPException(status_code=404, detail="Customer not found")
+
+    # Get selected products
+    selected_products = [p for p in map(repository.get_product, dict.fromkeys(request.product_ids)) if p]
+    if not selected_products:
+        raise HTTPException(status_code=400, detail="No valid products selected")
+
+    # Get email template if specified
+    template = None
+    if request.template_id:
+        template = repository.get_email_template(request.template_id)
+
+    return customer, selected_products, template
+
 @router.post("/generate-email", response_model=EmailGenerationResponse)
 async def generate_email(request: EmailGenerationRequest):
     """Generate a personalized email for a customer"""
     try:
-        customers, products, email_templates = load_mock_data()
-        customer = next((c for c in customers if c["id"] == request.customer_id), None)
-        if not customer:
-            raise HTTPException(status_code=404, detail="Customer not found")
+        customer, selected_products, template = _email_inputs(request)
+        result = await get_email(customer, selected_products, request.email_style, template, request.custom_message)
+        return EmailGenerationResponse(**result)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error generating email for customer {request.customer_id}: {e}")
+        raise HTTPException(status_code=500, detail="Failed to generate email")
 
-        # Caching logic
-        cache_dir = "backend/cache"
-        os.makedirs(cache_dir, exist_ok=True)
-        cache_path = os.path.join(cache_dir, f"customer_{request.customer_id}_email.json")
-
-        if os.path.exists(cache_path):
-            try:
-                with open(cache_path, "r") as f:
-                    cached = json.load(f)
-                return EmailGenerationResponse(**cached)
-            except Exception as e:
-                logger.warning(f"Failed to load email cache for customer {request.customer_id}: {e}")
-
-        # Get selected products
-        selected_products = [p for p in products if p["id"] in request.product_ids]
-        if not selected_products:
-            raise HTTPException(status_code=400, detail="No valid products selected")
-
-        # Get email template if specified
-        template = None
-        if request.template_id:
-            template = next((t for t in email_templates if t["id"] == request.template_id), None)
-
-        # Generate email
-        email_result = await email_generator.generate_email(
-            customer, selected_products, request.email_style, template, request.custom_message
+@router.post("/generate-email/variations", response_model=EmailVariationsResponse)
+async def generate_email_variations(request: EmailVariationsRequest):
+    """Generate A/B variations of an email, one per style"""
+    try:
+        customer, selected_products, template = _email_inputs(request)
+        styles = list(dict.fromkeys(request.styles or EMAIL_STYLES))
+        results = await get_email_variations(
+            customer, selected_products, styles, template, request.custom_message, request.single_completion
         )
-        response = EmailGenerationResponse(
-            customer_id=request.customer_id,
-            subject=email_result["subject"],
-            body=email_result["body"],
-            style=request.email_style,
-            personalization_score=email_result["personalization_score"],
-            call_to_action=email_result["call_to_action"]
+        return EmailVariationsResponse(
+            customer_id=customer["id"],
+            variations=[EmailGenerationResponse(**result) for result in results]
         )
-        # Save to cache
-        try:
-            with open(cache_path, "w") as f:
-                json.dump(json.loads(response.json()), f, indent=2)
-        except Exception as e:
-            logger.warning(f"Failed to save email cache for customer {request.customer_id}: {e}")
-        return response
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error generating email for customer {request.customer_id}: {e}")
-        raise HTTPException(status_code=500, detail="Failed to generate email")
+        logger.error(f"Error generating email variations for customer {request.customer_id}: {e}")
+        raise HTTPException(status_code=500, detail="Failed to generate email variations")
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    """Format a Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+@router.post("/generate-email/stream")
+async def generate_email_stream(request: EmailGenerationRequest):
+    """
+    Generate a personalized email, streaming it as Server-Sent Events
+
+    "subject" and "body" events carry {"delta": text} as the model writes each field.
+    The closing "email" event carries the EmailGenerationResponse, which is also stored
+    in the result cache unless it is the fallback email; a cached email is sent as the
+    "email" event straight away.
+    """
+    customer, selected_products, template = _email_inputs(request)
+    cache_key = _email_cache_key(customer, selected_products, request.email_style, template, request.custom_message)
+
+    async def stream():
+        try:
+            cached = await result_cache.get(cache_key)
+            if cached is not None:
+                yield _sse("email", cached)
+                return
+
+            async for event in email_generator.stream_email(
+                customer, selected_products, request.email_style, template, request.custom_message
+            ):
+                if "email" in event:
+                    result = _email_response(customer, request.email_style, event["email"])
+                    if not event["email"].get("fallback", False):
+                        await result_cache.set(cache_key, result, tags=[customer_tag(customer["id"])])
+                    yield _sse("email", result)
+                else:
+                    yield _sse(event["field"], {"delta": event["delta"]})
+        except Exception as e:
+            logger.error(f"Error streaming email for customer {request.customer_id}: {e}")
+            yield _sse("error", {"detail": "Failed to generate email"})
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def _mockup_cache_key(customer: Dict[str, Any], product: Dict[str, Any], logo_placement: str, color_scheme: str,
+                      custom_text: Optional[str], company_name: str) -> str:
+    """Cache key of a set of rendered mockups"""
+    return make_cache_key(
+        "mockup",
+        product=product,
+        # Variations are branded with the customer's company name
+        customer_company=customer.get("company", {}).get("name"),
+        company_name=company_name,
+        logo_placement=logo_placement,
+        color_scheme=color_scheme,
+        custom_text=custom_text,
+        image_format=mockup_creator.image_format,
+        renderer_version=mockup_creator.RENDERER_VERSION,
+        font_path=mockup_creator.font_path
+    )
+
+async def get_mockup(customer: Dict[str, Any], product: Dict[str, Any], logo_placement: str, color_scheme: str,
+                     custom_text: Optional[str], company_name: str) -> MockupCreationResponse:
+    """
+    Get branded mockups for a product from cache or render them
+
+    Cached results only hold image URLs; the encoded images live in the mockup store. An
+    entry whose images have since been removed from the store is rendered again. Fallback
+    mockups returned when rendering fails are not cached.
+    """
+    async def compute() -> Dict[str, Any]:
+        mockup_result = await mockup_creator.create_mockup(
+            product, customer, logo_placement, color_scheme, custom_text, company_name
+        )
+        response = MockupCreationResponse(
+            customer_id=customer["id"],
+            product_id=product["id"],
+            mockup_images=mockup_result["mockup_images"],
+            variations=mockup_result["variations"],
+            customization_applied=mockup_result["customization_applied"]
+        )
+        return dict(json.loads(response.json()), fallback=mockup_result.get("fallback", False))
+
+    cache_key = _mockup_cache_key(customer, product, logo_placement, color_scheme, custom_text, company_name)
+    tags = [customer_tag(customer["id"])]
+    cacheable = lambda result: not result.get("fallback", False)
+    result = await result_cache.get_or_compute(cache_key, compute, tags=tags, cacheable=cacheable)
+    if not result.get("fallback", False) and not await asyncio.to_thread(mockup_creator.images_available, result["mockup_images"]):
+        await result_cache.invalidate(cache_key)
+        result = await result_cache.get_or_compute(cache_key, compute, tags=tags, cacheable=cacheable)
+
+    return MockupCreationResponse(**{key: value for key, value in result.items() if key != "fallback"})
 
 @router.post("/create-mockup", response_model=MockupCreationResponse)
 async def create_mockup(request: MockupCreationRequest):
     """Create branded mockups for a product"""
     try:
-        customers, products, _ = load_mock_data()
-        customer = next((c for c in customers if c["id"] == request.customer_id), None)
-        product = next((p for p in products if p["id"] == request.product_id), None)
+        customer = repository.get_customer(request.customer_id)
+        product = repository.get_product(request.product_id)
         
         if not customer:
             raise HTTPException(status_code=404, detail="Customer not found")
@@ -273,31 +514,115 @@ async def create_mockup(request: MockupCreationRequest):
         if not product:
             raise HTTPException(status_code=404, detail="Product not found")
         
-        # Create mockup
-        mockup_result = await mockup_creator.create_mockup(
-            product, customer, request.logo_placement, request.color_scheme, 
+        return await get_mockup(
+            customer, product, request.logo_placement, request.color_scheme,
             request.custom_text, request.company_name
         )
-        
-        return MockupCreationResponse(
-            customer_id=request.customer_id,
-            product_id=request.product_id,
-            mockup_images=mockup_result["mockup_images"],
-            variations=mockup_result["variations"],
-            customization_applied=mockup_result["customization_applied"]
-        )
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Error creating mockup for customer {request.customer_id}, product {request.product_id}: {e}")
         raise HTTPException(status_code=500, detail="Failed to create mockup")
 
+@router.get("/mockups/{mockup_id}.{image_format}")
+async def get_mockup_image(mockup_id: str, image_format: str, request: Request):
+    """
+    Serve a stored mockup image
+
+    Ids are content hashes, so responses are immutable: they carry a strong ETag and
+    a year-long Cache-Control, and single byte ranges are honoured.
+    """
+    data = await asyncio.to_thread(mockup_creator.store.read, mockup_id, image_format)
+    if data is None:
+        raise HTTPException(status_code=404, detail="Mockup not found")
+
+    etag = f'"{mockup_id}.{image_format}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "public, max-age=31536000, immutable",
+        "Accept-Ranges": "bytes"
+    }
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    byte_range = None
+    if request.headers.get("if-range", etag) == etag:
+        try:
+            byte_range = parse_byte_range(request.headers.get("range"), len(data))
+        except ValueError:
+            return Response(status_code=416, headers=dict(headers, **{"Content-Range": f"bytes */{len(data)}"}))
+
+    if byte_range is None:
+        return Response(content=data, media_type=MEDIA_TYPES[image_format], headers=headers)
+
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{len(data)}"
+    return Response(content=data[start:end + 1], status_code=206, media_type=MEDIA_TYPES[image_format], headers=headers)
+
+@router.post("/pipeline")
+async def run_pipeline(request: PipelineRequest):
+    """
+    Run analysis, recommendations, email and mockups for a customer in one call
+
+    Stages run as a DAG: the analysis feeds the recommender, then the email and the
+    mockups for the top recommendations are produced concurrently. Each stage result
+    is streamed as an NDJSON line as soon as it finishes, followed by a "done" line.
+    """
+    customer = repository.get_customer(request.customer_id)
+    if not customer:
+        raise HTTPException(status_code=404, detail="Customer not found")
+
+    template = repository.get_email_template(request.template_id) if request.template_id else None
+    company_name = request.company_name or customer.get("company", {}).get("name", "")
+
+    def top_products(results: Dict[str, Any], count: int) -> List[Dict[str, Any]]:
+        recommended = results["recommendations"]["recommendations"]
+        return [p for p in (repository.get_product(r["product_id"]) for r in recommended[:count]) if p]
+
+    async def analysis_stage(results: Dict[str, Any]) -> Dict[str, Any]:
+        return await get_customer_analysis(customer)
+
+    async def recommendations_stage(results: Dict[str, Any]) -> Dict[str, Any]:
+        result = await get_recommendations(customer, results["analysis"])
+        return {key: value for key, value in result.items() if key != "fallback"}
+
+    async def email_stage(results: Dict[str, Any]) -> Dict[str, Any]:
+        products = top_products(results, request.email_product_count)
+        if not products:
+            raise ValueError("No recommended products to write about")
+        return await get_email(customer, products, request.email_style, template, request.custom_message)
+
+    async def mockups_stage(results: Dict[str, Any]) -> List[Dict[str, Any]]:
+        mockups = await asyncio.gather(*[
+            get_mockup(customer, product, request.logo_placement, request.color_scheme, request.custom_text, company_name)
+            for product in top_products(results, request.mockup_count)
+        ])
+        return [json.loads(mockup.json()) for mockup in mockups]
+
+    stages = [
+        Stage("analysis", analysis_stage),
+        Stage("recommendations", recommendations_stage, depends_on=["analysis"]),
+        Stage("email", email_stage, depends_on=["recommendations"]),
+        Stage("mockups", mockups_stage, depends_on=["recommendations"]),
+    ]
+
+    async def stream():
+        async for name, result, error in run_stages(stages):
+            if error is None:
+                line = {"stage": name, "status": "ok", "result": result}
+            else:
+                status = "skipped" if isinstance(error, StageSkipped) else "error"
+                line = {"stage": name, "status": status, "error": str(error)}
+            yield json.dumps(line, default=str) + "\n"
+        yield json.dumps({"stage": "done", "customer_id": request.customer_id}) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
 @router.get("/email-templates", response_model=List[EmailTemplate])
-async def get_email_templates():
-    """Get all available email templates"""
+async def get_email_templates(style: Optional[str] = None):
+    """Get all available email templates, optionally filtered by style"""
     try:
-        _, _, email_templates = load_mock_data()
-        return email_templates
+        return repository.find_email_templates(style=style)
     except Exception as e:
         logger.error(f"Error getting email templates: {e}")
         raise HTTPException(status_code=500, detail="Failed to load email templates")
@@ -306,8 +631,7 @@ async def get_email_templates():
 async def get_email_template(template_id: int):
     """Get a specific email template by ID"""
     try:
-        _, _, email_templates = load_mock_data()
-        template = next((t for t in email_templates if t["id"] == template_id), None)
+        template = repository.get_email_template(template_id)
         
         if not template:
             raise HTTPException(status_code=404, detail="Email template not found")
@@ -319,22 +643,88 @@ async def get_email_template(template_id: int):
         logger.error(f"Error getting email template {template_id}: {e}")
         raise HTTPException(status_code=500, detail="Failed to load email template")
 
-# Background task for processing
-async def process_customer_analysis(customer_id: int):
-    """Background task for customer analysis"""
+@router.delete("/cache")
+async def clear_cache():
+    """Remove every cached result"""
+    await result_cache.clear()
+    await recommendation_precomputer.store.delete()
+    return {"message": "Cache cleared"}
+
+@router.delete("/cache/customers/{customer_id}")
+async def invalidate_customer_cache(customer_id: int):
+    """Remove every cached result derived from a customer"""
+    removed = await result_cache.invalidate_tag(customer_tag(customer_id))
+    await recommendation_precomputer.store.delete(customer_id)
+    return {"message": "Customer cache invalidated", "customer_id": customer_id, "removed": removed}
+
+@router.get("/metrics/tokens")
+async def get_token_metrics():
+    """LLM token usage per endpoint since the process started"""
+    return get_token_meter().snapshot()
+
+# Background jobs
+def _job_status(job: Dict[str, Any]) -> JobStatusResponse:
+    return JobStatusResponse(
+        job_id=job["id"],
+        kind=job["kind"],
+        status=job["status"],
+        attempts=job["attempts"],
+        max_attempts=job["max_attempts"],
+        error=job["error"],
+        created_at=datetime.fromtimestamp(job["created_at"]),
+        updated_at=datetime.fromtimestamp(job["updated_at"])
+    )
+
+async def process_customer_analysis(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Job handler for customer analysis; the result is also stored in the result cache"""
+    customer_id = payload["customer_id"]
+    customer = repository.get_customer(customer_id)
+    if not customer:
+        raise PermanentJobError(f"Customer {customer_id} not found")
+
+    analysis_result = await get_customer_analysis(customer)
+    logger.info(f"Background analysis completed for customer {customer_id}")
+    return analysis_result
+
+job_queue.register("analyze_customer", process_customer_analysis)
+
+@router.post("/analyze-customer-async")
+async def analyze_customer_async(request: CustomerAnalysisRequest):
+    """Queue a customer analysis and return a job id to poll"""
+    if not repository.get_customer(request.customer_id):
+        raise HTTPException(status_code=404, detail="Customer not found")
+
     try:
-        customers, _, _ = load_mock_data()
-        customer = next((c for c in customers if c["id"] == customer_id), None)
-        
-        if customer:
-            analysis_result = await customer_analyzer.analyze_customer(customer)
-            logger.info(f"Background analysis completed for customer {customer_id}")
-            return analysis_result
+        job = await job_queue.submit("analyze_customer", {"customer_id": request.customer_id})
     except Exception as e:
-        logger.error(f"Background analysis failed for customer {customer_id}: {e}")
+        logger.error(f"Error queueing analysis for customer {request.customer_id}: {e}")
+        raise HTTPException(status_code=500, detail="Failed to queue customer analysis")
 
-@router.post("/analyze-customer-async")
-async def analyze_customer_async(request: CustomerAnalysisRequest, background_tasks: BackgroundTasks):
-    """Analyze a customer asynchronously"""
-    background_tasks.add_task(process_customer_analysis, request.customer_id)
-    return {"message": "Customer analysis started in background", "customer_id": request.customer_id} 
\ No newline at end of file
+    return {
+        "message": "Customer analysis queued",
+        "customer_id": request.customer_id,
+        "job_id": job["id"],
+        "status": job["status"],
+        "status_url": f"/api/jobs/{job['id']}",
+        "result_url": f"/api/jobs/{job['id']}/result"
+    }
+
+@router.get("/jobs/{job_id}", response_model=JobStatusResponse)
+async def get_job(job_id: str):
+    """Get the status of a background job"""
+    job = await job_queue.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return _job_status(job)
+
+@router.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    """Get the result of a finished background job"""
+    job = await job_queue.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] == "failed":
+        raise HTTPException(status_code=409, detail=f"Job failed: {job['error']}")
+    if job["status"] != "succeeded":
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+    return job["result"]
@@ -1,13 +1,19 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse
+import asyncio
 import os
 import logging
 from dotenv import load_dotenv
 
 # Import API routes
-from backend.api.routes import router as api_router
+from backend.api.routes import router as api_router, recommendation_precomputer
+from backend.agents.mockup_renderer import shutdown_render_pool, warm_render_pool
+from backend.services.llm_client import get_llm_client
+from backend.services.repository import get_repository
+from backend.services.result_cache import get_result_cache
+from backend.services.jobs import get_job_queue
 
 # Load environment variables
 load_dotenv()
@@ -58,16 +64,40 @@ async def health_check():
         "version": "1.0.0"
     }
 
+@app.on_event("startup")
+async def startup_event():
+    """Load data and start background services"""
+    get_repository().start_watcher()
+    get_job_queue().start()
+    recommendation_precomputer.start_scheduler()
+    await asyncio.to_thread(warm_render_pool, get_repository().list_products())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Release shared resources"""
+    await get_job_queue().stop()
+    await recommendation_precomputer.stop_scheduler()
+    await get_repository().stop_watcher()
+    await get_result_cache().close()
+    await get_llm_client().aclose()
+    await asyncio.to_thread(shutdown_render_pool)
+
 @app.exception_handler(404)
 async def not_found_handler(request, exc):
-    """Handle 404 errors"""
-    return {"error": "Endpoint not found", "message": "Please check the API documentation at /docs"}
+    """Handle 404 errors; a route's own detail (e.g. "Customer not found") is passed through"""
+    detail = getattr(exc, "detail", None)
+    if detail and detail != "Not Found":
+        return JSONResponse(status_code=404, content={"detail": detail}, headers=getattr(exc, "headers", None))
+    return JSONResponse(
+        status_code=404,
+        content={"error": "Endpoint not found", "message": "Please check the API documentation at /docs"}
+    )
 
 @app.exception_handler(500)
 async def internal_error_handler(request, exc):
     """Handle 500 errors"""
     logger.error(f"Internal server error: {exc}")
-    return {"error": "Internal server error", "message": "Please try again later"}
+    return JSONResponse(status_code=500, content={"error": "Internal server error", "message": "Please try again later"})
 
 if __name__ == "__main__":
     import uvicorn
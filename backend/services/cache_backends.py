@@ -0,0 +1,311 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import logging
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, Iterable, Any, Optional, Set, Tuple
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+class CacheBackend(ABC):
+    """Storage interface for cached results (JSON-serializable dicts)"""
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Stored value, or None if missing or expired"""
+
+    @abstractmethod
+    async def set(self, key: str, value: Dict[str, Any], ttl: Optional[float] = None, tags: Iterable[str] = ()):
+        """Store a value under a key with an optional time to live and invalidation tags"""
+
+    @abstractmethod
+    async def delete(self, key: str) -> bool:
+        """Remove a key, returns whether it existed"""
+
+    @abstractmethod
+    async def delete_tag(self, tag: str) -> int:
+        """Remove every key carrying a tag, returns how many"""
+
+    @abstractmethod
+    async def clear(self):
+        """Remove every entry"""
+
+    async def close(self):
+        pass
+
+class MemoryLRUBackend(CacheBackend):
+    """In-process LRU store with per-entry expiry and tag index"""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[Optional[float], Dict[str, Any], Tuple[str, ...]]]" = OrderedDict()
+        self._tags: Dict[str, Set[str]] = {}
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, value, _ = entry
+        if expires_at is not None and expires_at <= time.time():
+            self._remove(key)
+            return None
+
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: Dict[str, Any], ttl: Optional[float] = None, tags: Iterable[str] = ()):
+        expires_at = time.time() + ttl if ttl else None
+        tags = tuple(tags)
+
+        self._remove(key)
+        self._entries[key] = (expires_at, value, tags)
+        for tag in tags:
+            self._tags.setdefault(tag, set()).add(key)
+
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    async def delete(self, key: str) -> bool:
+        return self._remove(key)
+
+    async def delete_tag(self, tag: str) -> int:
+        keys = list(self._tags.get(tag, ()))
+        for key in keys:
+            self._remove(key)
+        return len(keys)
+
+    async def clear(self):
+        self._entries.clear()
+        self._tags.clear()
+
+    def _remove(self, key: str) -> bool:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+
+        for tag in entry[2]:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+        return True
+
+class SQLiteBackend(CacheBackend):
+    """
+    Persistent store in a local SQLite file, shared by every worker on the host
+
+    Writes purge the file at most every purge_interval seconds: expired rows are deleted,
+    then the oldest written rows beyond max_entries.
+    """
+
+    def __init__(self, path: str, max_entries: Optional[int] = None, purge_interval: Optional[float] = None):
+        """
+        Args:
+            path: SQLite database file
+            max_entries: Rows kept by a purge (CACHE_SQLITE_MAX_ENTRIES)
+            purge_interval: Minimum seconds between purges (CACHE_SQLITE_PURGE_INTERVAL)
+        """
+        self.path = path
+        self.max_entries = max_entries or int(os.getenv("CACHE_SQLITE_MAX_ENTRIES", 100000))
+        self.purge_interval = (purge_interval if purge_interval is not None
+                               else float(os.getenv("CACHE_SQLITE_PURGE_INTERVAL", 300)))
+        self._last_purge = 0.0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache_entries (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS cache_tags (tag TEXT NOT NULL, key TEXT NOT NULL, PRIMARY KEY (tag, key))")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS cache_tags_key ON cache_tags (key)")
+
+    async def _run(self, fn, *args):
+        return await asyncio.to_thread(self._locked, fn, *args)
+
+    def _locked(self, fn, *args):
+        with self._lock:
+            return fn(*args)
+
+    def _get(self, key: str) -> Optional[Dict[str, Any]]:
+        row = self._conn.execute("SELECT value, expires_at FROM cache_entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        if row[1] is not None and row[1] <= time.time():
+            self._delete(key)
+            return None
+        return json.loads(row[0])
+
+    def _set(self, key: str, value: Dict[str, Any], ttl: Optional[float], tags: Tuple[str, ...]):
+        expires_at = time.time() + ttl if ttl else None
+        with self._conn:
+            self._conn.execute("BEGIN")
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache_entries (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), expires_at)
+            )
+            self._conn.execute("DELETE FROM cache_tags WHERE key = ?", (key,))
+            self._conn.executemany("INSERT OR IGNORE INTO cache_tags (tag, key) VALUES (?, ?)", [(tag, key) for tag in tags])
+
+        if time.time() - self._last_purge >= self.purge_interval:
+            self._purge()
+
+    def _purge(self) -> int:
+        """Delete expired rows, then the oldest written rows over max_entries; returns the number deleted"""
+        now = time.time()
+        self._last_purge = now
+        with self._conn:
+            self._conn.execute("BEGIN")
+            removed = self._conn.execute(
+                "DELETE FROM cache_entries WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,)
+            ).rowcount
+            # INSERT OR REPLACE gives a rewritten row a new rowid, so rowid order is write order
+            excess = self._conn.execute("SELECT COUNT(*) FROM cache_entries").fetchone()[0] - self.max_entries
+            if excess > 0:
+                removed += self._conn.execute(
+                    "DELETE FROM cache_entries WHERE rowid IN (SELECT rowid FROM cache_entries ORDER BY rowid LIMIT ?)",
+                    (excess,)
+                ).rowcount
+            if removed:
+                self._conn.execute("DELETE FROM cache_tags WHERE key NOT IN (SELECT key FROM cache_entries)")
+
+        if removed:
+            logger.info(f"Purged {removed} entries from {self.path}")
+        return removed
+
+    def _delete(self, key: str) -> bool:
+        with self._conn:
+            self._conn.execute("BEGIN")
+            self._conn.execute("DELETE FROM cache_tags WHERE key = ?", (key,))
+            return self._conn.execute("DELETE FROM cache_entries WHERE key = ?", (key,)).rowcount > 0
+
+    def _delete_tag(self, tag: str) -> int:
+        with self._conn:
+            self._conn.execute("BEGIN")
+            keys = [row[0] for row in self._conn.execute("SELECT key FROM cache_tags WHERE tag = ?", (tag,))]
+            self._conn.executemany("DELETE FROM cache_entries WHERE key = ?", [(key,) for key in keys])
+            self._conn.executemany("DELETE FROM cache_tags WHERE key = ?", [(key,) for key in keys])
+        return len(keys)
+
+    def _clear(self):
+        with self._conn:
+            self._conn.execute("BEGIN")
+            self._conn.execute("DELETE FROM cache_entries")
+            self._conn.execute("DELETE FROM cache_tags")
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return await self._run(self._get, key)
+
+    async def set(self, key: str, value: Dict[str, Any], ttl: Optional[float] = None, tags: Iterable[str] = ()):
+        await self._run(self._set, key, value, ttl, tuple(tags))
+
+    async def delete(self, key: str) -> bool:
+        return await self._run(self._delete, key)
+
+    async def delete_tag(self, tag: str) -> int:
+        return await self._run(self._delete_tag, tag)
+
+    async def clear(self):
+        await self._run(self._clear)
+
+    async def close(self):
+        await self._run(self._conn.close)
+
+class RedisBackend(CacheBackend):
+    """
+    Shared store on a Redis-protocol server, usable across workers and nodes
+
+    Tag sets expire with the longest-lived entry added to them (PEXPIRE NX/GT, Redis 7+);
+    adding an entry without a TTL removes the expiry of its tag sets.
+    """
+
+    def __init__(self, url: Optional[str] = None, client: Any = None, prefix: str = "ai-sales-agent:"):
+        """
+        Initialize the backend
+
+        Args:
+            url: Redis URL, used when no client is given
+            client: Existing redis.asyncio-compatible client (e.g. fakeredis.aioredis.FakeRedis)
+            prefix: Namespace for every key written by this backend
+        """
+        if client is None:
+            try:
+                import redis.asyncio as redis_asyncio
+            except ImportError:
+                raise RuntimeError("The redis package is required for CACHE_BACKEND=redis")
+            client = redis_asyncio.Redis.from_url(url)
+
+        self._redis = client
+        self.prefix = prefix
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}entry:{key}"
+
+    def _tag(self, tag: str) -> str:
+        return f"{self.prefix}tag:{tag}"
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        raw = await self._redis.get(self._key(key))
+        return json.loads(raw) if raw is not None else None
+
+    async def set(self, key: str, value: Dict[str, Any], ttl: Optional[float] = None, tags: Iterable[str] = ()):
+        pipe = self._redis.pipeline()
+        pipe.set(self._key(key), json.dumps(value), px=int(ttl * 1000) if ttl else None)
+        for tag in tags:
+            pipe.sadd(self._tag(tag), key)
+            if ttl:
+                # Start the new set's expiry, or push an existing one out to cover this entry
+                pipe.pexpire(self._tag(tag), int(ttl * 1000), nx=True)
+                pipe.pexpire(self._tag(tag), int(ttl * 1000), gt=True)
+            else:
+                pipe.persist(self._tag(tag))
+        await pipe.execute()
+
+    async def delete(self, key: str) -> bool:
+        return await self._redis.delete(self._key(key)) > 0
+
+    async def delete_tag(self, tag: str) -> int:
+        keys = [k.decode() if isinstance(k, bytes) else k for k in await self._redis.smembers(self._tag(tag))]
+        if keys:
+            await self._redis.delete(*[self._key(key) for key in keys])
+        await self._redis.delete(self._tag(tag))
+        return len(keys)
+
+    async def clear(self):
+        keys = [key async for key in self._redis.scan_iter(match=f"{self.prefix}*")]
+        if keys:
+            await self._redis.delete(*keys)
+
+    async def close(self):
+        close = getattr(self._redis, "aclose", None) or self._redis.close
+        await close()
+
+def create_persistent_backend(kind: Optional[str] = None) -> Optional[CacheBackend]:
+    """
+    Create the persistent cache tier from configuration
+
+    Args:
+        kind: "sqlite", "redis" or "memory" (CACHE_BACKEND); "memory" disables the persistent tier
+
+    Returns:
+        Backend instance, or None for memory-only caching
+    """
+    kind = (kind or os.getenv("CACHE_BACKEND", "sqlite")).lower()
+    if kind == "sqlite":
+        return SQLiteBackend(os.getenv("CACHE_SQLITE_PATH", "backend/cache/results.db"))
+    if kind == "redis":
+        return RedisBackend(url=os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+    if kind == "memory":
+        return None
+    raise ValueError(f"Unknown cache backend: {kind}")
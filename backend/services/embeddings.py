@@ -0,0 +1,207 @@
+import json
+import os
+import re
+import zlib
+import logging
+from typing import Dict, Iterable, List, Any, Optional, Sequence, Tuple
+
+import numpy as np
+
+from backend.services.result_cache import record_version
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+INDEX_FORMAT_VERSION = 1
+
+STOP_WORDS = frozenset(
+    "a an and are as at be by for from in into is it its of on or our the their to with your you".split()
+)
+
+class HashingVectorizer:
+    """Offline text vectorizer: hashed word and character trigram features with TF-IDF weights"""
+
+    def __init__(self, dim: int = 1024):
+        """
+        Args:
+            dim: Number of hashed feature buckets
+        """
+        self.dim = dim
+        self.idf = np.ones(dim, dtype=np.float32)
+
+    def _features(self, text: str) -> List[str]:
+        features = []
+        for word in re.findall(r"[a-z0-9]+", text.lower()):
+            if word in STOP_WORDS:
+                continue
+            features.append(f"w:{word}")
+            # Character trigrams let related word forms match ("visible" / "visibility")
+            padded = f"<{word}>"
+            features.extend(f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2))
+        return features
+
+    def _counts(self, text: str) -> np.ndarray:
+        counts = np.zeros(self.dim, dtype=np.float32)
+        for feature in self._features(text):
+            # crc32 is stable across processes, unlike hash()
+            counts[zlib.crc32(feature.encode("utf-8")) % self.dim] += 1.0
+        return counts
+
+    def fit(self, documents: Sequence[str]) -> "HashingVectorizer":
+        """Learn inverse document frequencies from a corpus"""
+        document_frequency = np.zeros(self.dim, dtype=np.float32)
+        for document in documents:
+            document_frequency += self._counts(document) > 0
+        self.idf = (np.log((1.0 + len(documents)) / (1.0 + document_frequency)) + 1.0).astype(np.float32)
+        return self
+
+    def transform(self, documents: Sequence[str]) -> np.ndarray:
+        """L2-normalized TF-IDF vectors, float32 array (documents, dim)"""
+        vectors = np.zeros((len(documents), self.dim), dtype=np.float32)
+        for row, document in enumerate(documents):
+            vectors[row] = np.log1p(self._counts(document)) * self.idf
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+def product_document(product: Dict[str, Any]) -> str:
+    """Text embedded for a product: name, description, benefits and use cases"""
+    parts = [product.get("name", ""), product.get("description", "")]
+    parts.extend(product.get("benefits", []))
+    parts.extend(product.get("target_audience", {}).get("use_cases", []))
+    return ". ".join(part for part in parts if part)
+
+class EmbeddingIndex:
+    """Product vectors for cosine nearest-neighbour search, persisted as a memory-mapped .npy file"""
+
+    def __init__(self, product_ids: List[int], vectors: np.ndarray, vectorizer: HashingVectorizer, fingerprint: str):
+        self.product_ids = product_ids
+        self.vectors = vectors
+        self.vectorizer = vectorizer
+        self.fingerprint = fingerprint
+
+    @classmethod
+    def build(cls, products: List[Dict[str, Any]], dim: Optional[int] = None) -> "EmbeddingIndex":
+        """
+        Embed every product of a catalog
+
+        Args:
+            products: Product records
+            dim: Vector size (EMBEDDING_DIM)
+        """
+        documents = [product_document(product) for product in products]
+        vectorizer = HashingVectorizer(dim or int(os.getenv("EMBEDDING_DIM", 1024))).fit(documents)
+        return cls([product["id"] for product in products], vectorizer.transform(documents), vectorizer,
+                   catalog_fingerprint(products))
+
+    def save(self, directory: str):
+        """Write vectors.npy, idf.npy and meta.json, replacing any previous index atomically per file"""
+        os.makedirs(directory, exist_ok=True)
+        for name, array in (("vectors", self.vectors), ("idf", self.vectorizer.idf)):
+            temp_path = os.path.join(directory, f"{name}.tmp.npy")
+            np.save(temp_path, np.ascontiguousarray(array, dtype=np.float32))
+            os.replace(temp_path, os.path.join(directory, f"{name}.npy"))
+
+        meta = {
+            "format_version": INDEX_FORMAT_VERSION,
+            "fingerprint": self.fingerprint,
+            "dim": self.vectorizer.dim,
+            "product_ids": self.product_ids,
+        }
+        temp_path = os.path.join(directory, "meta.json.tmp")
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(temp_path, os.path.join(directory, "meta.json"))
+
+    @classmethod
+    def load(cls, directory: str) -> Optional["EmbeddingIndex"]:
+        """Open a saved index with the vectors memory-mapped, or None if missing or unreadable"""
+        try:
+            with open(os.path.join(directory, "meta.json"), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("format_version") != INDEX_FORMAT_VERSION:
+                return None
+
+            vectorizer = HashingVectorizer(meta["dim"])
+            vectorizer.idf = np.load(os.path.join(directory, "idf.npy"))
+            vectors = np.load(os.path.join(directory, "vectors.npy"), mmap_mode="r")
+            if vectors.shape != (len(meta["product_ids"]), meta["dim"]):
+                return None
+            return cls(meta["product_ids"], vectors, vectorizer, meta["fingerprint"])
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Failed to load embedding index from {directory}: {e}")
+            return None
+
+    def similarities(self, texts: Iterable[str]) -> np.ndarray:
+        """Cosine similarity of every product to the combined texts (zeros if there are none)"""
+        texts = [text for text in texts if text]
+        if not texts:
+            return np.zeros(len(self.product_ids), dtype=np.float32)
+
+        query = self.vectorizer.transform(texts).sum(axis=0)
+        query /= max(float(np.linalg.norm(query)), 1e-12)
+        return self.vectors @ query
+
+    def search(self, texts: Iterable[str], k: int = 5) -> List[Tuple[int, float]]:
+        """
+        Nearest products to a set of texts, e.g. a customer's pain points
+
+        Args:
+            texts: Query texts, combined into one query vector
+            k: Number of products to return
+
+        Returns:
+            (product id, cosine similarity) pairs, most similar first, excluding zero similarity
+        """
+        scores = self.similarities(texts)
+        k = min(k, len(scores))
+        if k <= 0:
+            return []
+
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(self.product_ids[i], float(scores[i])) for i in top if scores[i] > 0]
+
+def catalog_fingerprint(products: List[Dict[str, Any]]) -> str:
+    """Version of the embedded catalog text, so a stale index on disk is rebuilt"""
+    return record_version([[product.get("id"), product_document(product)] for product in products])
+
+_index: Optional[Tuple[List[Dict[str, Any]], EmbeddingIndex]] = None
+
+def get_embedding_index(products: List[Dict[str, Any]], directory: Optional[str] = None) -> EmbeddingIndex:
+    """
+    Get the embedding index for a catalog
+
+    The index saved on disk is reused when its fingerprint matches the catalog; otherwise it
+    is rebuilt and saved. The result is memoized for the last product list only, so
+    callers pass the catalog itself, never a sublist.
+
+    Args:
+        products: Product records
+        directory: Index directory (EMBEDDING_INDEX_DIR)
+    """
+    global _index
+    if _index is not None and _index[0] is products:
+        return _index[1]
+
+    directory = directory or os.getenv("EMBEDDING_INDEX_DIR", "backend/cache/embeddings")
+    dim = int(os.getenv("EMBEDDING_DIM", 1024))
+    index = EmbeddingIndex.load(directory)
+    if index is None or index.fingerprint != catalog_fingerprint(products) or index.vectorizer.dim != dim:
+        index = EmbeddingIndex.build(products, dim)
+        try:
+            index.save(directory)
+            logger.info(f"Saved embedding index for {len(products)} products to {directory}")
+        except Exception as e:
+            logger.warning(f"Failed to save embedding index to {directory}: {e}")
+
+    _index = (products, index)
+    return index
+
+if __name__ == "__main__":
+    # Build the index ahead of time: python -m backend.services.embeddings
+    from backend.services.repository import get_repository
+
+    logging.basicConfig(level=logging.INFO)
+    get_embedding_index(get_repository().list_products())
@@ -0,0 +1,177 @@
+import re
+from bisect import bisect_right
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List, Any, Optional, Tuple
+
+import numpy as np
+
+# Price buckets by minimum unit price: (upper bound exclusive, label)
+PRICE_BUCKETS = [
+    (10, "under-10"),
+    (25, "10-25"),
+    (50, "25-50"),
+    (float("inf"), "50-plus"),
+]
+
+# A dollar amount, optionally with thousands separators ("$25" or "$10,000")
+_AMOUNT = r'(\d{1,3}(?:,\d{3})+|\d+)'
+_PRICE_RANGE = re.compile(r'\$' + _AMOUNT + r'(?:\s*-\s*\$?' + _AMOUNT + r')?')
+_SCORING_PRICE_RANGE = re.compile(r'\$(\d+)-?\$?(\d+)?')
+
+@lru_cache(maxsize=4096)
+def parse_price_range(text: str) -> Optional[Tuple[int, int]]:
+    """
+    Parse a range like "$15-$25" or "$10,000-$25,000" (or a single "$20") into (min, max)
+
+    Returns:
+        (min, max), or None if the text has no "$" amount
+    """
+    match = _PRICE_RANGE.search(text or "")
+    if not match:
+        return None
+
+    low = int(match.group(1).replace(",", ""))
+    high = int(match.group(2).replace(",", "")) if match.group(2) else low
+    return low, high
+
+@lru_cache(maxsize=4096)
+def parse_scoring_price_range(text: str) -> Optional[Tuple[int, int]]:
+    """
+    Parse a price or budget range the way the rule-based scorer always has
+
+    Only the digits right after each "$" are read, so "$10,000-$25,000" parses as
+    (10, 10). Kept so recommendation scores don't shift; use parse_price_range for
+    filtering.
+
+    Returns:
+        (min, max), or None if the text has no "$" amount
+    """
+    match = _SCORING_PRICE_RANGE.search(text or "")
+    if not match:
+        return None
+
+    low = int(match.group(1))
+    high = int(match.group(2)) if match.group(2) else low
+    return low, high
+
+def price_bucket(price_range: str) -> Optional[str]:
+    """Get the price bucket label for a price range like "$15-$25" or "$10,000-$12,000\""""
+    bounds = parse_price_range(price_range)
+    if bounds is None:
+        return None
+
+    price_min = bounds[0]
+    for upper, label in PRICE_BUCKETS:
+        if price_min < upper:
+            return label
+    return None
+
+def _one(value: Any) -> List[str]:
+    return [value] if value else []
+
+PRODUCT_INDEX_KEYS: Dict[str, Callable[[Dict[str, Any]], Iterable[str]]] = {
+    "category": lambda p: _one(p.get("category")),
+    "industry": lambda p: p.get("target_audience", {}).get("industries", []),
+    "company_size": lambda p: p.get("target_audience", {}).get("company_size", []),
+    "price_bucket": lambda p: _one(price_bucket(p.get("price_range", ""))),
+}
+
+CUSTOMER_INDEX_KEYS: Dict[str, Callable[[Dict[str, Any]], Iterable[str]]] = {
+    "industry": lambda c: _one(c.get("company", {}).get("industry")),
+    "size": lambda c: _one(c.get("company", {}).get("size")),
+    "budget_range": lambda c: _one(c.get("behavioral_data", {}).get("budget_range")),
+}
+
+EMAIL_TEMPLATE_INDEX_KEYS: Dict[str, Callable[[Dict[str, Any]], Iterable[str]]] = {
+    "style": lambda t: _one(t.get("style")),
+}
+
+class RecordIndex:
+    """Id map plus case-insensitive secondary indexes over a set of records"""
+
+    def __init__(self, records: Dict[int, Dict[str, Any]], keys: Dict[str, Callable[[Dict[str, Any]], Iterable[str]]]):
+        """
+        Build the indexes
+
+        Args:
+            records: Records keyed by id, in display order
+            keys: Index name -> function returning the index values of a record
+        """
+        self.by_id = records
+        self._order = {record_id: position for position, record_id in enumerate(records)}
+        self._indexes: Dict[str, Dict[str, List[int]]] = {name: {} for name in keys}
+
+        for record_id, record in records.items():
+            for name, extract in keys.items():
+                for value in dict.fromkeys(v.lower() for v in extract(record)):
+                    self._indexes[name].setdefault(value, []).append(record_id)
+
+    @property
+    def fields(self) -> List[str]:
+        return list(self._indexes)
+
+    def get(self, record_id: int) -> Optional[Dict[str, Any]]:
+        return self.by_id.get(record_id)
+
+    def values(self, field: str) -> List[str]:
+        """Distinct (lowercased) values of a secondary index"""
+        return list(self._indexes[field])
+
+    def ids(self, field: str, value: str) -> List[int]:
+        """Record ids with the given value for a secondary index"""
+        return self._indexes[field].get(value.lower(), [])
+
+    def lookup(self, field: str, value: str) -> List[Dict[str, Any]]:
+        """Records with the given value for a secondary index"""
+        return [self.by_id[record_id] for record_id in self.ids(field, value)]
+
+    def find(self, **filters: Optional[str]) -> List[Dict[str, Any]]:
+        """
+        Records matching all given index filters, in display order
+
+        Filters set to None are ignored. Unknown filter names raise KeyError.
+        """
+        active = [(field, value) for field, value in filters.items() if value is not None]
+        if not active:
+            return list(self.by_id.values())
+
+        id_lists = sorted((self.ids(field, value) for field, value in active), key=len)
+        others = [set(ids) for ids in id_lists[1:]]
+        matched = [record_id for record_id in id_lists[0] if all(record_id in ids for ids in others)]
+        matched.sort(key=self._order.__getitem__)
+
+        return [self.by_id[record_id] for record_id in matched]
+
+class PriceIntervalIndex:
+    """Price (min, max) intervals sorted by minimum, for budget overlap queries"""
+
+    def __init__(self, ranges: Dict[int, Optional[Tuple[int, int]]]):
+        """
+        Build the index
+
+        Args:
+            ranges: Record id -> parsed price range (None if unparseable), in display order
+        """
+        self._order = {record_id: position for position, record_id in enumerate(ranges)}
+        # Records without a parseable price match every budget, as in the rule-based scorer
+        self._unbounded = [record_id for record_id, bounds in ranges.items() if bounds is None]
+
+        bounded = sorted(
+            ((bounds[0], bounds[1], record_id) for record_id, bounds in ranges.items() if bounds is not None),
+            key=lambda item: item[0]
+        )
+        self._mins = [low for low, _, _ in bounded]
+        self._maxes = np.array([high for _, high, _ in bounded], dtype=np.int64)
+        self._ids = np.array([record_id for _, _, record_id in bounded], dtype=np.int64)
+
+    def overlapping(self, low: int, high: int) -> List[int]:
+        """
+        Record ids whose interval overlaps [low, high], in display order
+
+        Intervals starting above high are cut off by binary search on the sorted
+        minimums; the remaining prefix is filtered on its maximums in one array pass.
+        """
+        end = bisect_right(self._mins, high)
+        matched = self._ids[:end][self._maxes[:end] >= low].tolist() + self._unbounded
+        matched.sort(key=self._order.__getitem__)
+        return matched
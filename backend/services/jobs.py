@@ -0,0 +1,284 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import logging
+from typing import Awaitable, Callable, Dict, List, Any, Optional, Set
+
+from backend.services.token_budget import current_endpoint
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+JobHandler = Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+class PermanentJobError(Exception):
+    """Raised by a job handler when retrying cannot succeed"""
+
+class JobQueue:
+    """Durable SQLite-backed job queue with a worker pool, retries and exponential backoff"""
+
+    def __init__(self, path: Optional[str] = None, workers: Optional[int] = None,
+                 max_attempts: Optional[int] = None, retry_backoff: Optional[float] = None,
+                 lease_seconds: Optional[float] = None, poll_interval: Optional[float] = None):
+        """
+        Initialize the queue
+
+        Args:
+            path: SQLite database file (JOBS_DB_PATH)
+            workers: Number of concurrent worker tasks in this process (JOB_WORKERS)
+            max_attempts: Attempts before a job is marked failed (JOB_MAX_ATTEMPTS)
+            retry_backoff: Base delay in seconds, doubled on every retry (JOB_RETRY_BACKOFF)
+            lease_seconds: Time after which a running job whose worker died is picked up again (JOB_LEASE_SECONDS);
+                the lease is renewed every third of it while the handler runs
+            poll_interval: Seconds between queue polls when idle (JOB_POLL_INTERVAL)
+        """
+        self.path = path or os.getenv("JOBS_DB_PATH", "backend/cache/jobs.db")
+        self.workers = workers or int(os.getenv("JOB_WORKERS", 2))
+        self.max_attempts = max_attempts or int(os.getenv("JOB_MAX_ATTEMPTS", 3))
+        self.retry_backoff = retry_backoff if retry_backoff is not None else float(os.getenv("JOB_RETRY_BACKOFF", 2))
+        self.lease_seconds = lease_seconds or float(os.getenv("JOB_LEASE_SECONDS", 300))
+        self.poll_interval = poll_interval or float(os.getenv("JOB_POLL_INTERVAL", 1))
+
+        self._handlers: Dict[str, JobHandler] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._active: Set[str] = set()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    max_attempts INTEGER NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    run_after REAL NOT NULL,
+                    lease_expires_at REAL,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, run_after)")
+            self._conn = conn
+        return self._conn
+
+    async def _run(self, fn, *args):
+        return await asyncio.to_thread(self._locked, fn, *args)
+
+    def _locked(self, fn, *args):
+        with self._lock:
+            return fn(self._connect(), *args)
+
+    def register(self, kind: str, handler: JobHandler):
+        """Register the coroutine that processes jobs of a kind"""
+        self._handlers[kind] = handler
+
+    async def submit(self, kind: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Enqueue a job
+
+        Args:
+            kind: Registered job kind
+            payload: JSON-serializable job input
+
+        Returns:
+            The stored job
+        """
+        if kind not in self._handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+
+        job_id = uuid.uuid4().hex
+        await self._run(self._insert, job_id, kind, payload)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return await self.get(job_id)
+
+    def _insert(self, conn: sqlite3.Connection, job_id: str, kind: str, payload: Dict[str, Any]):
+        now = time.time()
+        conn.execute(
+            "INSERT INTO jobs (id, kind, payload, status, max_attempts, run_after, created_at, updated_at) "
+            "VALUES (?, ?, ?, 'queued', ?, ?, ?, ?)",
+            (job_id, kind, json.dumps(payload), self.max_attempts, now, now, now)
+        )
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Get a job by id, or None if unknown"""
+        return await self._run(self._select, job_id)
+
+    def _select(self, conn: sqlite3.Connection, job_id: str) -> Optional[Dict[str, Any]]:
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_job(row) if row else None
+
+    def _to_job(self, row: sqlite3.Row) -> Dict[str, Any]:
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def _claim(self, conn: sqlite3.Connection) -> Optional[Dict[str, Any]]:
+        """
+        Atomically take the oldest ready job (or one whose worker lease expired)
+
+        A job whose lease expired after its last attempt is marked failed instead, so a
+        job that kills its worker every time is not leased forever.
+        """
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', error = 'Worker stopped responding on the last attempt', "
+                "lease_expires_at = NULL, updated_at = ? "
+                "WHERE status = 'running' AND lease_expires_at <= ? AND attempts >= max_attempts",
+                (now, now)
+            )
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE (status = 'queued' AND run_after <= ?) "
+                "OR (status = 'running' AND lease_expires_at <= ?) ORDER BY created_at LIMIT 1",
+                (now, now)
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+
+            conn.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, lease_expires_at = ?, updated_at = ? WHERE id = ?",
+                (now + self.lease_seconds, now, row["id"])
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        job = self._to_job(row)
+        job["attempts"] += 1
+        return job
+
+    def _renew_lease(self, conn: sqlite3.Connection, job_id: str):
+        now = time.time()
+        conn.execute(
+            "UPDATE jobs SET lease_expires_at = ?, updated_at = ? WHERE id = ? AND status = 'running'",
+            (now + self.lease_seconds, now, job_id)
+        )
+
+    async def _heartbeat(self, job_id: str):
+        """Keep a running job's lease from expiring while its handler runs"""
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                await self._run(self._renew_lease, job_id)
+            except Exception as e:
+                logger.error(f"Error renewing lease of job {job_id}: {e}")
+
+    def _complete(self, conn: sqlite3.Connection, job_id: str, result: Dict[str, Any]):
+        conn.execute(
+            "UPDATE jobs SET status = 'succeeded', result = ?, error = NULL, lease_expires_at = NULL, updated_at = ? WHERE id = ?",
+            (json.dumps(result, default=str), time.time(), job_id)
+        )
+
+    def _fail(self, conn: sqlite3.Connection, job: Dict[str, Any], error: str, permanent: bool):
+        now = time.time()
+        if permanent or job["attempts"] >= job["max_attempts"]:
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, lease_expires_at = NULL, updated_at = ? WHERE id = ?",
+                (error, now, job["id"])
+            )
+        else:
+            delay = self.retry_backoff * 2 ** (job["attempts"] - 1)
+            conn.execute(
+                "UPDATE jobs SET status = 'queued', error = ?, run_after = ?, lease_expires_at = NULL, updated_at = ? WHERE id = ?",
+                (error, now + delay, now, job["id"])
+            )
+
+    def _requeue(self, conn: sqlite3.Connection, job_ids: List[str]):
+        conn.executemany(
+            "UPDATE jobs SET status = 'queued', lease_expires_at = NULL, updated_at = ? WHERE id = ? AND status = 'running'",
+            [(time.time(), job_id) for job_id in job_ids]
+        )
+
+    async def _process(self, job: Dict[str, Any]):
+        handler = self._handlers.get(job["kind"])
+        self._active.add(job["id"])
+        # LLM tokens spent by the handler are reported under the job kind
+        current_endpoint.set(f"job:{job['kind']}")
+        heartbeat = asyncio.create_task(self._heartbeat(job["id"]))
+        try:
+            if handler is None:
+                raise PermanentJobError(f"No handler for job kind {job['kind']}")
+            result = await handler(job["payload"])
+            await self._run(self._complete, job["id"], result)
+            logger.info(f"Job {job['id']} ({job['kind']}) succeeded")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            permanent = isinstance(e, PermanentJobError)
+            logger.warning(f"Job {job['id']} ({job['kind']}) attempt {job['attempts']} failed: {e}")
+            await self._run(self._fail, job, str(e), permanent)
+        finally:
+            heartbeat.cancel()
+            self._active.discard(job["id"])
+
+    async def _worker(self):
+        while True:
+            try:
+                job = await self._run(self._claim)
+            except Exception as e:
+                logger.error(f"Error claiming job: {e}")
+                job = None
+
+            if job is not None:
+                await self._process(job)
+                continue
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        """Start the worker pool"""
+        if self._tasks:
+            return
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        logger.info(f"Started {self.workers} job workers")
+
+    async def stop(self):
+        """Stop the worker pool and put interrupted jobs back on the queue"""
+        interrupted = list(self._active)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if interrupted:
+            await self._run(self._requeue, interrupted)
+        if self._conn is not None:
+            await self._run(lambda conn: conn.close())
+            self._conn = None
+
+_job_queue: Optional[JobQueue] = None
+
+def get_job_queue() -> JobQueue:
+    """Get the process-wide job queue"""
+    global _job_queue
+    if _job_queue is None:
+        _job_queue = JobQueue()
+    return _job_queue
@@ -0,0 +1,158 @@
+import asyncio
+import os
+import logging
+from typing import AsyncIterator, Dict, List, Optional
+
+import httpx
+import openai
+from dotenv import load_dotenv
+
+from backend.services.token_budget import count_message_tokens, count_tokens, get_token_meter
+
+# Load environment variables
+load_dotenv()
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+class LLMClient:
+    """Shared async OpenAI client with a pooled HTTP connection and concurrency limits"""
+
+    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None,
+                 max_connections: Optional[int] = None, max_concurrency: Optional[int] = None,
+                 timeout: Optional[float] = None, max_retries: Optional[int] = None):
+        """
+        Initialize the LLM client configuration
+
+        Every setting falls back to an environment variable so deployments can tune the
+        pool without code changes. Pointing OPENAI_BASE_URL at a local stub server makes
+        the whole agent fleet testable offline.
+
+        Args:
+            api_key: OpenAI API key (OPENAI_API_KEY)
+            base_url: Alternative API base URL (OPENAI_BASE_URL)
+            max_connections: Size of the shared HTTP connection pool (LLM_MAX_CONNECTIONS)
+            max_concurrency: Maximum in-flight completions per process (LLM_MAX_CONCURRENCY)
+            timeout: Per-request timeout in seconds (LLM_TIMEOUT)
+            max_retries: Retries on transient API errors (LLM_MAX_RETRIES)
+        """
+        self.api_key = api_key or os.getenv("OPENAI_API_KEY")
+        self.base_url = base_url or os.getenv("OPENAI_BASE_URL") or None
+        self.max_connections = max_connections or int(os.getenv("LLM_MAX_CONNECTIONS", 20))
+        self.max_concurrency = max_concurrency or int(os.getenv("LLM_MAX_CONCURRENCY", 10))
+        self.timeout = timeout or float(os.getenv("LLM_TIMEOUT", 60))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("LLM_MAX_RETRIES", 2))
+
+        self._client: Optional[openai.AsyncOpenAI] = None
+        self._http_client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def _get_client(self) -> openai.AsyncOpenAI:
+        """Create the pooled async client on first use"""
+        if self._client is None:
+            self._http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections
+                ),
+                timeout=httpx.Timeout(self.timeout)
+            )
+            self._client = openai.AsyncOpenAI(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                timeout=self.timeout,
+                max_retries=self.max_retries,
+                http_client=self._http_client
+            )
+        return self._client
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        """Create the concurrency limiter on first use"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def chat(self, model: str, messages: List[Dict[str, str]], temperature: float = 0.3,
+                   max_tokens: int = 1500) -> str:
+        """
+        Run a chat completion without blocking the event loop
+
+        Args:
+            model: Model name to use
+            messages: Chat messages in OpenAI format
+            temperature: Sampling temperature
+            max_tokens: Maximum tokens to generate
+
+        Returns:
+            Content of the first completion choice
+        """
+        client = self._get_client()
+        async with self._get_semaphore():
+            response = await client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens
+            )
+
+        content = response.choices[0].message.content
+        # Prefer the API's own accounting, count locally when the server doesn't report usage
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            get_token_meter().record(usage.prompt_tokens, usage.completion_tokens)
+        else:
+            get_token_meter().record(count_message_tokens(messages, model), count_tokens(content or "", model))
+        return content
+
+    async def stream_chat(self, model: str, messages: List[Dict[str, str]], temperature: float = 0.3,
+                          max_tokens: int = 1500) -> AsyncIterator[str]:
+        """
+        Run a chat completion, yielding content deltas as they arrive
+
+        The concurrency slot is held until the stream is exhausted or closed.
+
+        Args:
+            model: Model name to use
+            messages: Chat messages in OpenAI format
+            temperature: Sampling temperature
+            max_tokens: Maximum tokens to generate
+
+        Yields:
+            Non-empty content fragments of the first completion choice
+        """
+        client = self._get_client()
+        async with self._get_semaphore():
+            stream = await client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                stream=True
+            )
+            # Streamed responses carry no usage, so both sides are counted locally
+            fragments = []
+            try:
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        fragments.append(chunk.choices[0].delta.content)
+                        yield chunk.choices[0].delta.content
+            finally:
+                await stream.response.aclose()
+                get_token_meter().record(count_message_tokens(messages, model), count_tokens("".join(fragments), model))
+
+    async def aclose(self):
+        """Close the pooled HTTP connections"""
+        if self._http_client is not None:
+            await self._http_client.aclose()
+        self._client = None
+        self._http_client = None
+        self._semaphore = None
+
+_llm_client: Optional[LLMClient] = None
+
+def get_llm_client() -> LLMClient:
+    """Get the process-wide shared LLM client"""
+    global _llm_client
+    if _llm_client is None:
+        _llm_client = LLMClient()
+    return _llm_client
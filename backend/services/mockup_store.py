@@ -0,0 +1,193 @@
+import hashlib
+import io
+import os
+import re
+import threading
+import logging
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from PIL import Image
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+MEDIA_TYPES = {"png": "image/png", "webp": "image/webp"}
+
+_MOCKUP_ID = re.compile(r"^[0-9a-f]{32}$")
+_BYTE_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+class MockupStore:
+    """
+    Content-addressed store of rendered mockup images on local disk
+
+    Images are identified by a hash of their pixels, so rendering the same mockup twice
+    reuses the stored file and every id always names the same bytes. PNG is written when
+    an image is stored; WebP is encoded from it on first request. Recently used encoded
+    images are also kept in memory, up to a total size.
+    """
+
+    def __init__(self, directory: Optional[str] = None, max_memory_bytes: Optional[int] = None):
+        """
+        Args:
+            directory: Directory holding the images (MOCKUP_STORE_DIR)
+            max_memory_bytes: Encoded bytes kept in memory, 0 disables the memory tier (MOCKUP_MEMORY_CACHE_BYTES)
+        """
+        self.directory = directory or os.getenv("MOCKUP_STORE_DIR", "backend/cache/mockups")
+        self.max_memory_bytes = (
+            max_memory_bytes if max_memory_bytes is not None
+            else int(os.getenv("MOCKUP_MEMORY_CACHE_BYTES", 32 * 1024 * 1024))
+        )
+        self._memory: "OrderedDict[Tuple[str, str], bytes]" = OrderedDict()
+        self._memory_bytes = 0
+        # Reads and writes run in worker threads
+        self._lock = threading.Lock()
+
+    def _path(self, mockup_id: str, image_format: str) -> str:
+        return os.path.join(self.directory, mockup_id[:2], f"{mockup_id}.{image_format}")
+
+    def _remember(self, key: Tuple[str, str], data: bytes):
+        if len(data) > self.max_memory_bytes:
+            return
+
+        with self._lock:
+            previous = self._memory.pop(key, None)
+            if previous is not None:
+                self._memory_bytes -= len(previous)
+            self._memory[key] = data
+            self._memory_bytes += len(data)
+            while self._memory_bytes > self.max_memory_bytes:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= len(evicted)
+
+    def _recall(self, key: Tuple[str, str]) -> Optional[bytes]:
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+            return data
+
+    def _write(self, mockup_id: str, image: Image.Image, image_format: str) -> bytes:
+        buffer = io.BytesIO()
+        if image_format == "webp":
+            image.save(buffer, format="WEBP", lossless=True)
+        else:
+            image.save(buffer, format="PNG")
+        data = buffer.getvalue()
+
+        path = self._path(mockup_id, image_format)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+        self._remember((mockup_id, image_format), data)
+        return data
+
+    def exists(self, mockup_id: str) -> bool:
+        """Whether an image with this id is stored"""
+        return self._recall((mockup_id, "png")) is not None or os.path.exists(self._path(mockup_id, "png"))
+
+    def put(self, image: Image.Image) -> str:
+        """
+        Store an image, returns its id
+
+        Encoding is skipped when an identical image is already stored.
+        """
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+
+        digest = hashlib.sha256(f"{image.mode}:{image.size}:".encode("utf-8"))
+        digest.update(image.tobytes())
+        mockup_id = digest.hexdigest()[:32]
+
+        if not self.exists(mockup_id):
+            self._write(mockup_id, image, "png")
+        return mockup_id
+
+    def read(self, mockup_id: str, image_format: str) -> Optional[bytes]:
+        """
+        Encoded image bytes
+
+        Returns:
+            The image in the requested format, or None if the id or format is unknown
+        """
+        if image_format not in MEDIA_TYPES or not _MOCKUP_ID.match(mockup_id):
+            return None
+
+        data = self._recall((mockup_id, image_format))
+        if data is not None:
+            return data
+
+        path = self._path(mockup_id, image_format)
+        if not os.path.exists(path):
+            source = self._path(mockup_id, "png")
+            if image_format == "png" or not os.path.exists(source):
+                return None
+            with Image.open(source) as image:
+                return self._write(mockup_id, image, image_format)
+
+        with open(path, "rb") as f:
+            data = f.read()
+        self._remember((mockup_id, image_format), data)
+        return data
+
+def parse_byte_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single-range HTTP Range header
+
+    Args:
+        header: Range header value, e.g. "bytes=0-1023", "bytes=1024-" or "bytes=-500"
+        size: Size of the full content
+
+    Returns:
+        Inclusive (start, end) offsets, or None to send the full content (no header,
+        multiple ranges or a syntax this parser doesn't handle)
+
+    Raises:
+        ValueError: If the range cannot be satisfied
+    """
+    match = _BYTE_RANGE.match((header or "").strip())
+    if not match or match.groups() == ("", ""):
+        return None
+
+    first, last = match.groups()
+    if first == "":
+        length = int(last)
+        if length == 0:
+            raise ValueError("Empty suffix range")
+        return max(size - length, 0), size - 1
+
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size:
+        raise ValueError(f"Range {header} not satisfiable for {size} bytes")
+    return start, end
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    """
+    Whether an If-None-Match header matches an entity tag
+
+    Args:
+        header: If-None-Match value, "*" or a comma-separated list of (possibly weak) tags
+        etag: Quoted entity tag of the current representation
+
+    Returns:
+        True if the header is "*" or lists the tag; weak tags compare by their opaque value
+    """
+    tags = [tag.strip() for tag in (header or "").split(",")]
+    if "*" in tags:
+        return True
+    return any((tag[2:] if tag.startswith("W/") else tag) == etag for tag in tags)
+
+_mockup_store: Optional[MockupStore] = None
+
+def get_mockup_store() -> MockupStore:
+    """Get the process-wide mockup store"""
+    global _mockup_store
+    if _mockup_store is None:
+        _mockup_store = MockupStore()
+    return _mockup_store
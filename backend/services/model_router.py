@@ -0,0 +1,127 @@
+import os
+import logging
+from typing import Callable, Dict, List, Optional, Type
+
+from dotenv import load_dotenv
+from pydantic import BaseModel
+
+from backend.agents.structured_output import parse_llm_json
+from backend.services.llm_client import LLMClient, get_llm_client
+from backend.services.token_budget import prompt_budget
+
+# Load environment variables
+load_dotenv()
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+Confidence = Callable[[BaseModel], float]
+
+class ModelRouter:
+    """
+    Picks the models used for each agent task and escalates between them
+
+    A task runs through a cascade of models, cheapest first. The output of each model is
+    validated against the task's Pydantic schema and scored; the next, larger model is only
+    called when validation fails, the confidence is too low or the request errors.
+    """
+
+    def __init__(self, llm: Optional[LLMClient] = None, cheap_model: Optional[str] = None,
+                 large_model: Optional[str] = None, min_confidence: Optional[float] = None):
+        """
+        Args:
+            llm: Client used for completions, defaults to the shared LLM client
+            cheap_model: First model tried for every task (LLM_CHEAP_MODEL)
+            large_model: Model escalated to (LLM_LARGE_MODEL)
+            min_confidence: Confidence below which output is escalated (LLM_MIN_CONFIDENCE)
+        """
+        self.llm = llm or get_llm_client()
+        self.cheap_model = cheap_model or os.getenv("LLM_CHEAP_MODEL", "gpt-3.5-turbo")
+        self.large_model = large_model or os.getenv("LLM_LARGE_MODEL", "gpt-4")
+        self.min_confidence = min_confidence if min_confidence is not None else float(os.getenv("LLM_MIN_CONFIDENCE", 0.6))
+
+    def models(self, task: str) -> List[str]:
+        """
+        Cascade of models for a task, cheapest first
+
+        LLM_MODELS_<TASK> (e.g. LLM_MODELS_EMAIL=gpt-4) overrides the cheap/large pair
+        with a comma-separated list; a single model disables escalation for that task.
+        """
+        configured = os.getenv(f"LLM_MODELS_{task.upper()}")
+        if configured:
+            return [model.strip() for model in configured.split(",") if model.strip()]
+        return list(dict.fromkeys([self.cheap_model, self.large_model]))
+
+    def confidence_threshold(self, task: str) -> float:
+        """Minimum confidence for a task (LLM_MIN_CONFIDENCE_<TASK> overrides the default)"""
+        return float(os.getenv(f"LLM_MIN_CONFIDENCE_{task.upper()}", self.min_confidence))
+
+    def prompt_budget(self, task: str, max_tokens: int) -> int:
+        """Prompt token budget that fits every model of a task's cascade"""
+        return min(prompt_budget(model, max_tokens) for model in self.models(task))
+
+    def rejection_reason(self, task: str, text: str, output_model: Type[BaseModel],
+                         confidence: Optional[Confidence] = None) -> Optional[str]:
+        """
+        Check a model's output for a task
+
+        Returns:
+            Why the output should be escalated, or None if it is acceptable
+        """
+        output = parse_llm_json(text, output_model)
+        if output is None:
+            return f"failed {output_model.__name__} validation"
+
+        if confidence is not None:
+            score = confidence(output)
+            threshold = self.confidence_threshold(task)
+            if score < threshold:
+                return f"confidence {score:.2f} below {threshold:.2f}"
+        return None
+
+    async def complete(self, task: str, messages: List[Dict[str, str]], output_model: Type[BaseModel],
+                       temperature: float = 0.3, max_tokens: int = 1500, confidence: Optional[Confidence] = None,
+                       models: Optional[List[str]] = None) -> str:
+        """
+        Run a chat completion through the task's cascade
+
+        Args:
+            task: Task name, e.g. "analysis" (selects the models and threshold)
+            messages: Chat messages in OpenAI format
+            output_model: Pydantic schema the response must contain as JSON
+            temperature: Sampling temperature
+            max_tokens: Maximum tokens to generate
+            confidence: Scores validated output between 0.0 and 1.0
+            models: Cascade to use instead of the task's configured one
+
+        Returns:
+            Response of the first acceptable model, or of the last model if none is
+        """
+        models = models or self.models(task)
+        for position, model in enumerate(models):
+            last = position == len(models) - 1
+            try:
+                text = await self.llm.chat(model=model, messages=messages, temperature=temperature, max_tokens=max_tokens)
+            except Exception as e:
+                if last:
+                    raise
+                logger.warning(f"Routing {task}: {model} failed ({e}), escalating to {models[position + 1]}")
+                continue
+
+            reason = self.rejection_reason(task, text, output_model, confidence)
+            if reason is None:
+                logger.info(f"Routing {task}: accepted {model} output")
+                return text
+            if last:
+                logger.info(f"Routing {task}: {model} output {reason}, no larger model to escalate to")
+                return text
+            logger.info(f"Routing {task}: {model} output {reason}, escalating to {models[position + 1]}")
+
+_model_router: Optional[ModelRouter] = None
+
+def get_model_router() -> ModelRouter:
+    """Get the process-wide model router"""
+    global _model_router
+    if _model_router is None:
+        _model_router = ModelRouter()
+    return _model_router
@@ -0,0 +1,69 @@
+import asyncio
+import logging
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Any, Optional, Sequence, Tuple
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+class StageSkipped(Exception):
+    """A stage did not run because one of its dependencies failed"""
+
+class Stage:
+    """A named unit of pipeline work and the stages whose results it needs"""
+
+    def __init__(self, name: str, run: Callable[[Dict[str, Any]], Awaitable[Any]], depends_on: Sequence[str] = ()):
+        """
+        Args:
+            name: Unique stage name, also the key of its result
+            run: Coroutine function receiving the results of completed stages by name
+            depends_on: Stages that must succeed before this one starts
+        """
+        self.name = name
+        self.run = run
+        self.depends_on = tuple(depends_on)
+
+async def run_stages(stages: List[Stage]) -> AsyncIterator[Tuple[str, Any, Optional[Exception]]]:
+    """
+    Run stages as a DAG, starting each one as soon as its dependencies succeed
+
+    Independent stages run concurrently. Results are yielded in completion order as
+    (name, result, error); stages downstream of a failure are yielded with StageSkipped.
+
+    Args:
+        stages: Stages in any order; dependencies must name other stages in the list
+    """
+    pending = {stage.name: stage for stage in stages}
+    results: Dict[str, Any] = {}
+    failed: set = set()
+    running: Dict[asyncio.Task, str] = {}
+
+    try:
+        while pending or running:
+            for name, stage in list(pending.items()):
+                if any(dep in failed for dep in stage.depends_on):
+                    del pending[name]
+                    failed.add(name)
+                    yield name, None, StageSkipped(f"Skipped because a dependency of {name} failed")
+                elif all(dep in results for dep in stage.depends_on):
+                    del pending[name]
+                    running[asyncio.ensure_future(stage.run(dict(results)))] = name
+
+            if not running:
+                if pending:
+                    raise ValueError(f"Unsatisfiable stage dependencies: {', '.join(pending)}")
+                break
+
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                name = running.pop(task)
+                error = task.exception()
+                if error is not None:
+                    logger.error(f"Pipeline stage {name} failed: {error}")
+                    failed.add(name)
+                    yield name, None, error
+                else:
+                    results[name] = task.result()
+                    yield name, results[name], None
+    finally:
+        for task in running:
+            task.cancel()
@@ -0,0 +1,287 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import logging
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Any, Optional
+
+from backend.services.result_cache import record_version
+from backend.services.token_budget import current_endpoint
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+class RecommendationStore:
+    """Materialized top-N recommendations per customer in a local SQLite table"""
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        Args:
+            path: SQLite database file (PRECOMPUTE_DB_PATH)
+        """
+        self.path = path or os.getenv("PRECOMPUTE_DB_PATH", "backend/cache/recommendations.db")
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS recommendations (
+                    customer_id INTEGER PRIMARY KEY,
+                    customer_version TEXT NOT NULL,
+                    catalog_version TEXT NOT NULL,
+                    input_version TEXT NOT NULL,
+                    result TEXT NOT NULL,
+                    computed_at REAL NOT NULL
+                )
+            """)
+            self._conn = conn
+        return self._conn
+
+    async def _run(self, fn, *args):
+        return await asyncio.to_thread(self._locked, fn, *args)
+
+    def _locked(self, fn, *args):
+        with self._lock:
+            return fn(self._connect(), *args)
+
+    async def get(self, customer_id: int) -> Optional[Dict[str, Any]]:
+        """Stored row for a customer, or None"""
+        return await self._run(self._select, customer_id)
+
+    def _select(self, conn: sqlite3.Connection, customer_id: int) -> Optional[Dict[str, Any]]:
+        row = conn.execute("SELECT * FROM recommendations WHERE customer_id = ?", (customer_id,)).fetchone()
+        return self._to_row(row) if row else None
+
+    async def versions(self) -> Dict[int, Dict[str, Any]]:
+        """Version columns of every stored row, keyed by customer id"""
+        return await self._run(self._select_versions)
+
+    def _select_versions(self, conn: sqlite3.Connection) -> Dict[int, Dict[str, Any]]:
+        rows = conn.execute("SELECT customer_id, customer_version, catalog_version, input_version FROM recommendations")
+        return {row["customer_id"]: dict(row) for row in rows}
+
+    def _to_row(self, row: sqlite3.Row) -> Dict[str, Any]:
+        stored = dict(row)
+        stored["result"] = json.loads(stored["result"])
+        return stored
+
+    async def put(self, customer_id: int, customer_version: str, catalog_version: str, input_version: str,
+                  result: Dict[str, Any]) -> float:
+        """Store a customer's recommendations, returns the computed_at timestamp"""
+        computed_at = time.time()
+        await self._run(self._upsert, customer_id, customer_version, catalog_version, input_version, result, computed_at)
+        return computed_at
+
+    def _upsert(self, conn: sqlite3.Connection, customer_id: int, customer_version: str, catalog_version: str,
+                input_version: str, result: Dict[str, Any], computed_at: float):
+        conn.execute(
+            "INSERT OR REPLACE INTO recommendations "
+            "(customer_id, customer_version, catalog_version, input_version, result, computed_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (customer_id, customer_version, catalog_version, input_version, json.dumps(result, default=str), computed_at)
+        )
+
+    async def touch(self, customer_id: int, catalog_version: str):
+        """Mark a row as valid for a new catalog version whose change did not affect its inputs"""
+        await self._run(self._update_catalog_version, customer_id, catalog_version)
+
+    def _update_catalog_version(self, conn: sqlite3.Connection, customer_id: int, catalog_version: str):
+        conn.execute("UPDATE recommendations SET catalog_version = ? WHERE customer_id = ?", (catalog_version, customer_id))
+
+    async def delete_except(self, customer_ids: List[int]) -> int:
+        """Remove rows of customers that no longer exist, returns the number removed"""
+        return await self._run(self._delete_except, customer_ids)
+
+    def _delete_except(self, conn: sqlite3.Connection, customer_ids: List[int]) -> int:
+        keep = set(customer_ids)
+        stale = [row[0] for row in conn.execute("SELECT customer_id FROM recommendations") if row[0] not in keep]
+        conn.executemany("DELETE FROM recommendations WHERE customer_id = ?", [(customer_id,) for customer_id in stale])
+        return len(stale)
+
+    async def delete(self, customer_id: Optional[int] = None):
+        """Remove one customer's row, or every row when customer_id is None"""
+        await self._run(self._delete, customer_id)
+
+    def _delete(self, conn: sqlite3.Connection, customer_id: Optional[int]):
+        if customer_id is None:
+            conn.execute("DELETE FROM recommendations")
+        else:
+            conn.execute("DELETE FROM recommendations WHERE customer_id = ?", (customer_id,))
+
+    async def close(self):
+        if self._conn is not None:
+            await self._run(lambda conn: conn.close())
+            self._conn = None
+
+RecommendationCompute = Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+class RecommendationPrecomputer:
+    """
+    Keeps the materialized recommendation table in step with the customer and product data
+
+    A row is fresh while the customer record and catalog are unchanged. When the catalog
+    changes, a row stays valid if the products shortlisted for that customer (the only
+    products the recommender sees) are unchanged, so only affected customers are recomputed.
+    """
+
+    def __init__(self, recommender: Any, repository: Any, compute: RecommendationCompute,
+                 store: Optional[RecommendationStore] = None, concurrency: Optional[int] = None,
+                 top_n: Optional[int] = None, interval: Optional[float] = None):
+        """
+        Args:
+            recommender: ProductRecommender, used for its shortlist, models and prompt version
+            repository: Data repository providing customers, products and the catalog version
+            compute: Coroutine function producing a ProductRecommendationResponse dict for a customer,
+                with "fallback": True when it is a degraded result that must not be stored
+            store: Materialized table, defaults to a RecommendationStore
+            concurrency: Customers recomputed in parallel (PRECOMPUTE_CONCURRENCY)
+            top_n: Recommendations kept per customer (PRECOMPUTE_TOP_N)
+            interval: Seconds between scheduled refreshes, 0 disables the scheduler (PRECOMPUTE_INTERVAL)
+        """
+        self.recommender = recommender
+        self.repository = repository
+        self.compute = compute
+        self.store = store or RecommendationStore()
+        self.concurrency = concurrency or int(os.getenv("PRECOMPUTE_CONCURRENCY", 4))
+        self.top_n = top_n or int(os.getenv("PRECOMPUTE_TOP_N", 8))
+        self.interval = interval if interval is not None else float(os.getenv("PRECOMPUTE_INTERVAL", 0))
+        self._scheduler: Optional[asyncio.Task] = None
+
+    def input_version(self, customer: Dict[str, Any], products: List[Dict[str, Any]]) -> str:
+        """Hash of everything the recommender's output depends on for a customer"""
+        return record_version({
+            "customer": customer,
+            "shortlist": self.recommender.shortlist_products(customer, products),
+            "models": self.recommender.models,
+            "prompt_version": self.recommender.PROMPT_VERSION
+        })
+
+    def _is_fresh(self, row: Dict[str, Any], customer_version: str, catalog_version: str) -> bool:
+        return row["customer_version"] == customer_version and row["catalog_version"] == catalog_version
+
+    async def _refresh(self, customer: Dict[str, Any], row: Optional[Dict[str, Any]], force: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Bring one customer's row up to date
+
+        Returns:
+            The stored result with computed_at, or None if the existing row was already fresh.
+            A fallback result is returned with "fallback": True but not stored, so the next
+            read or scheduled run computes it again.
+        """
+        snapshot = self.repository.snapshot
+        customer_version = record_version(customer)
+        if row is not None and not force and self._is_fresh(row, customer_version, snapshot.catalog_version):
+            return None
+
+        input_version = self.input_version(customer, snapshot.product_list)
+        if row is not None and not force and row["customer_version"] == customer_version and row["input_version"] == input_version:
+            await self.store.touch(customer["id"], snapshot.catalog_version)
+            return None
+
+        result = await self.compute(customer)
+        result = dict(result, recommendations=result["recommendations"][:self.top_n])
+        if result.pop("fallback", False):
+            logger.warning(f"Not storing fallback recommendations for customer {customer['id']}")
+            return dict(result, computed_at=datetime.now(), fallback=True)
+
+        computed_at = await self.store.put(customer["id"], customer_version, snapshot.catalog_version, input_version, result)
+        return dict(result, computed_at=datetime.fromtimestamp(computed_at))
+
+    async def get(self, customer: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Recommendations for a customer from the table, recomputing them first if stale
+
+        Returns:
+            ProductRecommendationResponse fields plus computed_at
+        """
+        row = await self.store.get(customer["id"])
+        refreshed = await self._refresh(customer, row)
+        if refreshed is not None:
+            return refreshed
+        return dict(row["result"], computed_at=datetime.fromtimestamp(row["computed_at"]))
+
+    async def run(self, force: bool = False) -> Dict[str, int]:
+        """
+        Recompute every customer whose row is missing or stale
+
+        Args:
+            force: Recompute every customer regardless of stored versions
+
+        Returns:
+            Counts of customers checked, recomputed, unchanged, failed (including fallback
+            results, which are not stored) and rows removed
+        """
+        customers = self.repository.list_customers()
+        removed = await self.store.delete_except([customer["id"] for customer in customers])
+        rows = await self.store.versions()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        summary = {"customers": len(customers), "recomputed": 0, "unchanged": 0, "failed": 0, "removed": removed}
+
+        async def refresh_one(customer: Dict[str, Any]):
+            async with semaphore:
+                try:
+                    refreshed = await self._refresh(customer, rows.get(customer["id"]), force)
+                    if refreshed is None:
+                        summary["unchanged"] += 1
+                    else:
+                        summary["failed" if refreshed.get("fallback", False) else "recomputed"] += 1
+                except Exception as e:
+                    logger.error(f"Error precomputing recommendations for customer {customer['id']}: {e}")
+                    summary["failed"] += 1
+
+        await asyncio.gather(*[refresh_one(customer) for customer in customers])
+        logger.info(f"Recommendation precompute finished: {summary}")
+        return summary
+
+    async def _schedule(self):
+        current_endpoint.set("precompute")
+        while True:
+            try:
+                await self.run()
+            except Exception as e:
+                logger.error(f"Error in scheduled recommendation precompute: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start_scheduler(self):
+        """Refresh the table every interval seconds in the background (no-op when interval is 0)"""
+        if self.interval > 0 and self._scheduler is None:
+            self._scheduler = asyncio.create_task(self._schedule())
+
+    async def stop_scheduler(self):
+        if self._scheduler is not None:
+            self._scheduler.cancel()
+            try:
+                await self._scheduler
+            except asyncio.CancelledError:
+                pass
+            self._scheduler = None
+        await self.store.close()
+
+async def _main(force: bool):
+    from backend.api.routes import recommendation_precomputer, result_cache
+    from backend.services.llm_client import get_llm_client
+
+    try:
+        print(json.dumps(await recommendation_precomputer.run(force=force)))
+    finally:
+        await recommendation_precomputer.stop_scheduler()
+        await result_cache.close()
+        await get_llm_client().aclose()
+
+if __name__ == "__main__":
+    # Refresh the materialized table: python -m backend.services.precompute [--force]
+    import sys
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main("--force" in sys.argv[1:]))
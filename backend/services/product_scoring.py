@@ -0,0 +1,215 @@
+import logging
+from typing import Dict, List, Any, Optional, Sequence, Tuple
+
+import numpy as np
+
+from backend.services.indexes import parse_scoring_price_range
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Score contributions, applied in this order (same as the original rule-based scorer)
+BASE_SCORE = 0.5
+INDUSTRY_WEIGHT = 0.2
+SIZE_WEIGHT = 0.15
+BUDGET_WEIGHT = 0.15
+PAIN_POINT_WEIGHT = 0.1
+PURCHASE_WEIGHT = 0.1
+
+class _TokenFeature:
+    """Product -> token sets stored as a vocabulary plus flat (product, token id) pairs"""
+
+    def __init__(self, token_lists: Sequence[Sequence[str]]):
+        vocabulary: Dict[str, int] = {}
+        rows, ids = [], []
+        for row, tokens in enumerate(token_lists):
+            for token in dict.fromkeys(tokens):
+                rows.append(row)
+                ids.append(vocabulary.setdefault(token, len(vocabulary)))
+
+        self.vocabulary = list(vocabulary)
+        self.num_rows = len(token_lists)
+        self.ids = np.asarray(ids, dtype=np.int64)
+        # Offsets of each product's tokens in ids (ids are grouped by product)
+        self.indptr = np.zeros(self.num_rows + 1, dtype=np.int64)
+        np.add.at(self.indptr, np.asarray(rows, dtype=np.int64) + 1, 1)
+        np.cumsum(self.indptr, out=self.indptr)
+
+    def any_match(self, masks: np.ndarray) -> np.ndarray:
+        """
+        For each mask row, which products have at least one token selected by the mask
+
+        Args:
+            masks: Boolean array (n, vocabulary size)
+
+        Returns:
+            Boolean array (n, products)
+        """
+        selected = np.zeros((masks.shape[0], len(self.ids) + 1), dtype=np.int32)
+        np.cumsum(masks[:, self.ids], axis=1, out=selected[:, 1:])
+        return selected[:, self.indptr[1:]] > selected[:, self.indptr[:-1]]
+
+class CatalogScores:
+    """Rule-based scores of one customer against every product, with the matches behind them"""
+
+    def __init__(self, scores: np.ndarray, industry: np.ndarray, size: np.ndarray, budget: np.ndarray,
+                 pain_point_hits: np.ndarray, purchase_hits: np.ndarray, pain_points: List[str]):
+        self.scores = scores
+        self.industry = industry
+        self.size = size
+        self.budget = budget
+        self.pain_point_hits = pain_point_hits
+        self.purchase_hits = purchase_hits
+        self.pain_points = pain_points
+
+    def reasons(self, index: int) -> List[str]:
+        """Reasons that contributed to the score of the product at index"""
+        reasoning = []
+        if self.industry[index]:
+            reasoning.append("Industry alignment")
+        if self.size[index]:
+            reasoning.append("Company size appropriate")
+        if self.budget[index]:
+            reasoning.append("Budget compatible")
+        for pain_point, hit in zip(self.pain_points, self.pain_point_hits[:, index]):
+            if hit:
+                reasoning.append(f"Addresses pain point: {pain_point}")
+        reasoning.extend(["Similar to previous purchases"] * int(self.purchase_hits[:, index].sum()))
+        return reasoning
+
+class CatalogScorer:
+    """
+    Product catalog compiled into arrays for vectorized rule-based scoring
+
+    Each product's target industries, company sizes, benefits and name words are stored as
+    token ids over a catalog vocabulary. A customer is encoded by testing its attributes
+    against the vocabulary once (the same substring rules as before), after which scoring
+    every product is a handful of array operations.
+    """
+
+    def __init__(self, products: List[Dict[str, Any]]):
+        """
+        Compile a catalog
+
+        Args:
+            products: Product records; scores are returned in this order
+        """
+        self.products = products
+        self.industries = _TokenFeature([
+            [i.lower() for i in p.get("target_audience", {}).get("industries", [])] for p in products
+        ])
+        self.sizes = _TokenFeature([
+            [s.lower() for s in p.get("target_audience", {}).get("company_size", [])] for p in products
+        ])
+        self.benefits = _TokenFeature([[b.lower() for b in p.get("benefits", [])] for p in products])
+        self.name_words = _TokenFeature([p.get("name", "").lower().split() for p in products])
+
+        price_ranges = [parse_scoring_price_range(p.get("price_range", "")) for p in products]
+        self.has_price = np.array([r is not None for r in price_ranges], dtype=bool)
+        self.price_min = np.array([r[0] if r else 0 for r in price_ranges], dtype=np.float64)
+        self.price_max = np.array([r[1] if r else 0 for r in price_ranges], dtype=np.float64)
+
+    def _masks(self, feature: _TokenFeature, values: Sequence[str], symmetric: bool = False) -> np.ndarray:
+        """Vocabulary masks: token in value (or value in token when symmetric), one row per value"""
+        masks = np.zeros((len(values), len(feature.vocabulary)), dtype=bool)
+        for row, value in enumerate(values):
+            for column, token in enumerate(feature.vocabulary):
+                if token in value or (symmetric and value in token):
+                    masks[row, column] = True
+        return masks
+
+    def _budget(self, budgets: Sequence[str]) -> np.ndarray:
+        """Boolean (customers, products): price range overlaps the budget, or either is unparseable"""
+        parsed = [parse_scoring_price_range(budget) for budget in budgets]
+        has_budget = np.array([r is not None for r in parsed], dtype=bool)[:, None]
+        budget_min = np.array([r[0] if r else 0 for r in parsed], dtype=np.float64)[:, None]
+        budget_max = np.array([r[1] if r else 0 for r in parsed], dtype=np.float64)[:, None]
+
+        overlaps = ~((self.price_max < budget_min) | (self.price_min > budget_max))
+        return overlaps | ~has_budget | ~self.has_price
+
+    def _segment_counts(self, hits: np.ndarray, lengths: Sequence[int]) -> np.ndarray:
+        """Sum consecutive row segments of hits (one segment per customer)"""
+        totals = np.zeros((hits.shape[0] + 1, hits.shape[1]), dtype=np.int64)
+        np.cumsum(hits, axis=0, out=totals[1:])
+        bounds = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        return totals[bounds[1:]] - totals[bounds[:-1]]
+
+    def _components(self, signals: Sequence[Dict[str, Any]]):
+        industry = self.industries.any_match(self._masks(self.industries, [s["industry"] for s in signals]))
+        size = self.sizes.any_match(self._masks(self.sizes, [s["size"] for s in signals]))
+        budget = self._budget([s["budget"] for s in signals])
+
+        pain_points = [p for s in signals for p in s["pain_points"]]
+        purchases = [p for s in signals for p in s["previous_purchases"]]
+        pain_point_hits = self.benefits.any_match(self._masks(self.benefits, pain_points, symmetric=True))
+        purchase_hits = self.name_words.any_match(self._masks(self.name_words, purchases))
+        return industry, size, budget, pain_point_hits, purchase_hits
+
+    def _total(self, industry, size, budget, pain_point_counts, purchase_counts) -> np.ndarray:
+        # Add contributions one at a time so scores equal the sequential float sums exactly
+        scores = np.full(industry.shape, BASE_SCORE)
+        scores += np.where(industry, INDUSTRY_WEIGHT, 0.0)
+        scores += np.where(size, SIZE_WEIGHT, 0.0)
+        scores += np.where(budget, BUDGET_WEIGHT, 0.0)
+        for count, weight in ((pain_point_counts, PAIN_POINT_WEIGHT), (purchase_counts, PURCHASE_WEIGHT)):
+            for step in range(int(count.max(initial=0))):
+                scores += np.where(count > step, weight, 0.0)
+        return scores
+
+    def score(self, signals: Dict[str, Any]) -> CatalogScores:
+        """
+        Score one customer against every product
+
+        Args:
+            signals: Lower-cased customer attributes (industry, size, budget, pain_points, previous_purchases)
+
+        Returns:
+            Uncapped scores in catalog order, with the matches needed to explain them
+        """
+        industry, size, budget, pain_point_hits, purchase_hits = self._components([signals])
+        scores = self._total(
+            industry[0], size[0], budget[0], pain_point_hits.sum(axis=0), purchase_hits.sum(axis=0)
+        )
+        return CatalogScores(
+            scores, industry[0], size[0], budget[0], pain_point_hits, purchase_hits, list(signals["pain_points"])
+        )
+
+    def score_batch(self, signals: Sequence[Dict[str, Any]]) -> np.ndarray:
+        """
+        Score many customers against every product
+
+        Memory grows with customers x products, so score very large batches in chunks.
+
+        Args:
+            signals: Customer attributes as for score
+
+        Returns:
+            Float array (customers, products) of uncapped scores
+        """
+        industry, size, budget, pain_point_hits, purchase_hits = self._components(signals)
+        pain_point_counts = self._segment_counts(pain_point_hits, [len(s["pain_points"]) for s in signals])
+        purchase_counts = self._segment_counts(purchase_hits, [len(s["previous_purchases"]) for s in signals])
+        return self._total(industry, size, budget, pain_point_counts, purchase_counts)
+
+def rank(scores: np.ndarray, limit: Optional[int] = None) -> np.ndarray:
+    """Product indexes by descending score, catalog order on ties"""
+    order = np.argsort(-scores, kind="stable")
+    return order[:limit] if limit is not None else order
+
+_compiled: Optional[Tuple[List[Dict[str, Any]], CatalogScorer]] = None
+
+def get_catalog_scorer(products: List[Dict[str, Any]]) -> CatalogScorer:
+    """
+    Get the compiled scorer for a catalog, compiling it once per product list
+
+    The repository builds a new product list whenever the catalog changes, so the
+    list's identity is the cache key. Only one list is kept: pass the catalog (and
+    pick out a subset from the scores), never a sublist, or the catalog is recompiled
+    on the next request.
+    """
+    global _compiled
+    if _compiled is None or _compiled[0] is not products:
+        _compiled = (products, CatalogScorer(products))
+        logger.info(f"Compiled scoring arrays for {len(products)} products")
+    return _compiled[1]
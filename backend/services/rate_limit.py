@@ -0,0 +1,39 @@
+import asyncio
+import time
+import logging
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+class TokenRateLimiter:
+    """Token bucket limiting LLM token spend per minute"""
+
+    def __init__(self, tokens_per_minute: int):
+        """
+        Initialize the limiter with a full bucket
+
+        Args:
+            tokens_per_minute: Sustained token budget; also the maximum burst
+        """
+        self.capacity = float(tokens_per_minute)
+        self.rate = tokens_per_minute / 60.0
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, tokens: int):
+        """Wait until the budget allows spending the given number of tokens"""
+        tokens = min(float(tokens), self.capacity)
+        async with self._lock:
+            self._refill()
+            while self._tokens < tokens:
+                wait = (tokens - self._tokens) / self.rate
+                logger.debug(f"Token budget exhausted, waiting {wait:.1f}s")
+                await asyncio.sleep(wait)
+                self._refill()
+            self._tokens -= tokens
@@ -0,0 +1,244 @@
+import asyncio
+import json
+import os
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Type
+
+from pydantic import BaseModel, ValidationError
+
+from backend.api.models import Customer, Product, EmailTemplate
+from backend.services.result_cache import record_version
+from backend.services.indexes import (
+    RecordIndex, PriceIntervalIndex, parse_price_range,
+    CUSTOMER_INDEX_KEYS, PRODUCT_INDEX_KEYS, EMAIL_TEMPLATE_INDEX_KEYS
+)
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+DATA_FILES = {
+    "customers": ("mock_customers.json", Customer),
+    "products": ("product_catalog.json", Product),
+    "email_templates": ("email_templates.json", EmailTemplate),
+}
+
+class DataSnapshot:
+    """Immutable view of the data files, indexed by record id"""
+
+    def __init__(self, customers: Dict[int, Dict[str, Any]], products: Dict[int, Dict[str, Any]],
+                 email_templates: Dict[int, Dict[str, Any]], mtimes: Dict[str, float]):
+        self.customers = customers
+        self.products = products
+        self.email_templates = email_templates
+        self.mtimes = mtimes
+        self.loaded_at = datetime.now()
+
+        # Ordered lists are built once so list endpoints don't copy per request
+        self.customer_list = list(customers.values())
+        self.product_list = list(products.values())
+        self.email_template_list = list(email_templates.values())
+
+        # Content hash of the catalog, part of every cache key derived from it
+        self.catalog_version = record_version(self.product_list)
+
+        # Secondary indexes are rebuilt together with the snapshot
+        self.customer_index = RecordIndex(customers, CUSTOMER_INDEX_KEYS)
+        self.product_index = RecordIndex(products, PRODUCT_INDEX_KEYS)
+        self.email_template_index = RecordIndex(email_templates, EMAIL_TEMPLATE_INDEX_KEYS)
+
+        # Price strings are parsed once per load, never per request
+        self.product_prices = {
+            product_id: parse_price_range(product.get("price_range", "")) for product_id, product in products.items()
+        }
+        self.product_price_index = PriceIntervalIndex(self.product_prices)
+
+class DataRepository:
+    """In-memory repository for customers, products and email templates with hot reload"""
+
+    def __init__(self, data_dir: Optional[str] = None, reload_interval: Optional[float] = None):
+        """
+        Initialize the repository
+
+        Args:
+            data_dir: Directory holding the JSON data files (DATA_DIR)
+            reload_interval: Seconds between file change checks, 0 disables (DATA_RELOAD_INTERVAL)
+        """
+        self.data_dir = data_dir or os.getenv("DATA_DIR", "backend/data")
+        self.reload_interval = reload_interval if reload_interval is not None else float(os.getenv("DATA_RELOAD_INTERVAL", 5))
+        self._snapshot: Optional[DataSnapshot] = None
+        self._watcher: Optional[asyncio.Task] = None
+        # Modification times of files that failed to load, retried only once they change again
+        self._failed_mtimes: Dict[str, float] = {}
+        self._reload_lock = threading.Lock()
+
+    @property
+    def snapshot(self) -> DataSnapshot:
+        """Current data snapshot, loaded on first access"""
+        if self._snapshot is None:
+            self.reload()
+        return self._snapshot
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.data_dir, DATA_FILES[name][0])
+
+    def _mtime(self, name: str) -> float:
+        try:
+            return os.path.getmtime(self._path(name))
+        except OSError:
+            return 0.0
+
+    def _load_file(self, name: str) -> Dict[int, Dict[str, Any]]:
+        """Load a data file and validate every record against its model once"""
+        filename, model = DATA_FILES[name]
+        with open(self._path(name), "r") as f:
+            records = json.load(f)
+
+        indexed = {}
+        for record in records:
+            if self._is_valid(record, model):
+                indexed[record["id"]] = record
+            else:
+                logger.warning(f"Skipping invalid record in {filename}: id={record.get('id')}")
+        return indexed
+
+    def _is_valid(self, record: Dict[str, Any], model: Type[BaseModel]) -> bool:
+        try:
+            model(**record)
+            return True
+        except ValidationError as e:
+            logger.debug(f"Validation error: {e}")
+            return False
+
+    def _changed_files(self) -> List[str]:
+        if self._snapshot is None:
+            return list(DATA_FILES)
+        return [
+            name for name in DATA_FILES
+            if self._mtime(name) not in (self._snapshot.mtimes.get(name), self._failed_mtimes.get(name))
+        ]
+
+    def reload(self, force: bool = False) -> bool:
+        """
+        Reload data files that changed on disk
+
+        Only changed files are re-parsed. The new snapshot is swapped in atomically, so
+        concurrent readers see either the old or the new data, never a mix. If a file
+        fails to load the previous data for it is kept, and it is not retried until it
+        changes again. Safe to call from a worker thread.
+
+        Args:
+            force: Re-parse every file regardless of modification time
+
+        Returns:
+            True if a new snapshot was installed
+        """
+        with self._reload_lock:
+            return self._reload(force)
+
+    def _reload(self, force: bool) -> bool:
+        changed = list(DATA_FILES) if force else self._changed_files()
+        if not changed:
+            return False
+
+        previous = self._snapshot
+        data = {}
+        mtimes = {}
+        loaded = []
+        for name in DATA_FILES:
+            mtime = self._mtime(name)
+            if name in changed:
+                try:
+                    data[name] = self._load_file(name)
+                    mtimes[name] = mtime
+                    self._failed_mtimes.pop(name, None)
+                    loaded.append(name)
+                    continue
+                except Exception as e:
+                    logger.error(f"Error loading {DATA_FILES[name][0]}: {e}")
+                    self._failed_mtimes[name] = mtime
+            data[name] = getattr(previous, name) if previous else {}
+            mtimes[name] = previous.mtimes.get(name, 0.0) if previous else mtime
+
+        if previous is not None and not loaded:
+            return False
+
+        self._snapshot = DataSnapshot(data["customers"], data["products"], data["email_templates"], mtimes)
+        logger.info(f"Loaded data snapshot ({', '.join(loaded) or 'nothing'} loaded)")
+        return True
+
+    async def _watch(self):
+        """Poll data file modification times and reload on change, parsing off the event loop"""
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            try:
+                await asyncio.to_thread(self.reload)
+            except Exception as e:
+                logger.error(f"Error reloading data: {e}")
+
+    def start_watcher(self):
+        """Start the background file watcher"""
+        if self._snapshot is None:
+            self.reload()
+        if self.reload_interval > 0 and self._watcher is None:
+            self._watcher = asyncio.create_task(self._watch())
+
+    async def stop_watcher(self):
+        """Stop the background file watcher"""
+        if self._watcher is not None:
+            self._watcher.cancel()
+            try:
+                await self._watcher
+            except asyncio.CancelledError:
+                pass
+            self._watcher = None
+
+    def list_customers(self) -> List[Dict[str, Any]]:
+        return self.snapshot.customer_list
+
+    def get_customer(self, customer_id: int) -> Optional[Dict[str, Any]]:
+        return self.snapshot.customers.get(customer_id)
+
+    def find_customers(self, industry: Optional[str] = None, size: Optional[str] = None,
+                       budget_range: Optional[str] = None) -> List[Dict[str, Any]]:
+        return self.snapshot.customer_index.find(industry=industry, size=size, budget_range=budget_range)
+
+    def list_products(self) -> List[Dict[str, Any]]:
+        return self.snapshot.product_list
+
+    def get_product(self, product_id: int) -> Optional[Dict[str, Any]]:
+        return self.snapshot.products.get(product_id)
+
+    def find_products(self, category: Optional[str] = None, industry: Optional[str] = None,
+                      company_size: Optional[str] = None, price_bucket: Optional[str] = None,
+                      budget_range: Optional[str] = None) -> List[Dict[str, Any]]:
+        snapshot = self.snapshot
+        products = snapshot.product_index.find(
+            category=category, industry=industry, company_size=company_size, price_bucket=price_bucket
+        )
+
+        budget = parse_price_range(budget_range) if budget_range else None
+        if budget is None:
+            return products
+
+        affordable = set(snapshot.product_price_index.overlapping(*budget))
+        return [product for product in products if product["id"] in affordable]
+
+    def list_email_templates(self) -> List[Dict[str, Any]]:
+        return self.snapshot.email_template_list
+
+    def get_email_template(self, template_id: int) -> Optional[Dict[str, Any]]:
+        return self.snapshot.email_templates.get(template_id)
+
+    def find_email_templates(self, style: Optional[str] = None) -> List[Dict[str, Any]]:
+        return self.snapshot.email_template_index.find(style=style)
+
+_repository: Optional[DataRepository] = None
+
+def get_repository() -> DataRepository:
+    """Get the process-wide data repository"""
+    global _repository
+    if _repository is None:
+        _repository = DataRepository()
+    return _repository
@@ -0,0 +1,167 @@
+import hashlib
+import json
+import os
+import logging
+from typing import Awaitable, Callable, Dict, Iterable, Any, Optional
+
+from backend.services.cache_backends import CacheBackend, MemoryLRUBackend, create_persistent_backend
+from backend.services.single_flight import SingleFlight
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+def canonical_json(value: Any) -> str:
+    """Serialize a value deterministically (sorted keys, no whitespace)"""
+    return json.dumps(value, sort_keys=True, separators=(",", ":"), default=str)
+
+def record_version(record: Any) -> str:
+    """Content hash of a record, changes whenever any field changes"""
+    return hashlib.sha256(canonical_json(record).encode("utf-8")).hexdigest()
+
+def make_cache_key(namespace: str, **inputs: Any) -> str:
+    """
+    Build a cache key from the canonical form of every input that affects a result
+
+    Args:
+        namespace: Result type, e.g. "analysis" or "email"
+        **inputs: Records, options, prompt version and model used to produce the result
+
+    Returns:
+        Key of the form "<namespace>:<sha256 of inputs>"
+    """
+    return f"{namespace}:{record_version(inputs)}"
+
+def customer_tag(customer_id: int) -> str:
+    """Invalidation tag for every result derived from a customer"""
+    return f"customer:{customer_id}"
+
+class ResultCache:
+    """Input-addressed result cache: in-process LRU tier in front of a shared persistent tier"""
+
+    def __init__(self, max_entries: Optional[int] = None, ttl: Optional[float] = None,
+                 memory_ttl: Optional[float] = None, backend: Optional[CacheBackend] = None):
+        """
+        Initialize the cache
+
+        Args:
+            max_entries: Entries kept in process before least recently used ones are evicted (RESULT_CACHE_MAX_ENTRIES)
+            ttl: Default time to live in seconds, 0 keeps entries forever (RESULT_CACHE_TTL)
+            memory_ttl: Upper bound on how long the in-process tier may serve an entry without
+                consulting the persistent tier (RESULT_CACHE_MEMORY_TTL)
+            backend: Persistent tier, None for memory-only caching
+        """
+        self.max_entries = max_entries or int(os.getenv("RESULT_CACHE_MAX_ENTRIES", 1024))
+        self.ttl = ttl if ttl is not None else float(os.getenv("RESULT_CACHE_TTL", 86400))
+        self.memory_ttl = memory_ttl if memory_ttl is not None else float(os.getenv("RESULT_CACHE_MEMORY_TTL", 300))
+        self.memory = MemoryLRUBackend(self.max_entries)
+        self.backend = backend
+        self.in_flight = SingleFlight()
+
+    def _memory_ttl(self, ttl: float) -> Optional[float]:
+        if self.backend is None:
+            return ttl
+        return min(ttl, self.memory_ttl) if ttl > 0 else self.memory_ttl
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Get a cached result, or None if missing or expired"""
+        value = await self.memory.get(key)
+        if value is not None or self.backend is None:
+            return value
+
+        try:
+            value = await self.backend.get(key)
+        except Exception as e:
+            logger.warning(f"Failed to read cache entry {key}: {e}")
+            return None
+
+        if value is not None:
+            await self.memory.set(key, value, ttl=self._memory_ttl(self.ttl))
+        return value
+
+    async def set(self, key: str, value: Dict[str, Any], ttl: Optional[float] = None, tags: Iterable[str] = ()):
+        """
+        Store a result
+
+        Args:
+            key: Cache key from make_cache_key
+            value: JSON-serializable result
+            ttl: Time to live in seconds, defaults to the cache TTL
+            tags: Invalidation tags, e.g. customer_tag(customer_id)
+        """
+        ttl = self.ttl if ttl is None else ttl
+        tags = tuple(tags)
+        await self.memory.set(key, value, ttl=self._memory_ttl(ttl), tags=tags)
+
+        if self.backend is not None:
+            try:
+                await self.backend.set(key, value, ttl=ttl, tags=tags)
+            except Exception as e:
+                logger.warning(f"Failed to save cache entry {key}: {e}")
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[Dict[str, Any]]],
+                             ttl: Optional[float] = None, tags: Iterable[str] = (),
+                             cacheable: Optional[Callable[[Dict[str, Any]], bool]] = None) -> Dict[str, Any]:
+        """
+        Get a cached result, computing and storing it on a miss
+
+        Concurrent misses for the same key share a single computation, so a burst of
+        identical requests costs one LLM call instead of one per request.
+
+        Args:
+            key: Cache key from make_cache_key
+            compute: Coroutine function producing the JSON-serializable result
+            ttl: Time to live in seconds, defaults to the cache TTL
+            tags: Invalidation tags for the stored result
+            cacheable: Whether a computed result may be stored; degraded fallbacks are
+                returned but not cached, so the next request computes again
+
+        Returns:
+            Cached or freshly computed result
+        """
+        value = await self.get(key)
+        if value is not None:
+            return value
+
+        async def compute_and_store() -> Dict[str, Any]:
+            value = await compute()
+            if cacheable is None or cacheable(value):
+                await self.set(key, value, ttl=ttl, tags=tags)
+            else:
+                logger.info(f"Not caching degraded result for {key}")
+            return value
+
+        return await self.in_flight.do(key, compute_and_store)
+
+    async def invalidate(self, key: str) -> bool:
+        """Remove a single entry"""
+        removed = await self.memory.delete(key)
+        if self.backend is not None:
+            removed = await self.backend.delete(key) or removed
+        return removed
+
+    async def invalidate_tag(self, tag: str) -> int:
+        """Remove every entry carrying a tag, returns the number removed"""
+        removed = await self.memory.delete_tag(tag)
+        if self.backend is not None:
+            removed = max(removed, await self.backend.delete_tag(tag))
+        return removed
+
+    async def clear(self):
+        """Remove every entry"""
+        await self.memory.clear()
+        if self.backend is not None:
+            await self.backend.clear()
+
+    async def close(self):
+        """Release the persistent tier"""
+        if self.backend is not None:
+            await self.backend.close()
+
+_result_cache: Optional[ResultCache] = None
+
+def get_result_cache() -> ResultCache:
+    """Get the process-wide result cache"""
+    global _result_cache
+    if _result_cache is None:
+        _result_cache = ResultCache(backend=create_persistent_backend())
+    return _result_cache
@@ -0,0 +1,200 @@
+import os
+import re
+import logging
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Context window of known models (longest prefix wins); others use LLM_CONTEXT_WINDOW
+CONTEXT_WINDOWS = {
+    "gpt-3.5-turbo": 16385,
+    "gpt-4": 8192,
+    "gpt-4-32k": 32768,
+    "gpt-4-turbo": 128000,
+    "gpt-4o": 128000,
+}
+
+# Chat formatting overhead: tokens per message and tokens priming the reply
+TOKENS_PER_MESSAGE = 3
+REPLY_PRIMING_TOKENS = 3
+
+# Fallback when tiktoken is unavailable: BPE vocabularies mostly split words into pieces of
+# up to ~6 letters, numbers into groups of up to 3 digits and punctuation into single tokens
+_APPROXIMATE_PIECES = re.compile(r"[A-Za-z]{1,6}|\d{1,3}|[^\sA-Za-z\d]")
+
+@lru_cache(maxsize=None)
+def _encoding(model: str) -> Any:
+    """tiktoken encoding for a model, or None to use the approximation"""
+    try:
+        import tiktoken
+    except ImportError:
+        logger.info("tiktoken is not installed, approximating token counts")
+        return None
+
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning(f"Failed to load tiktoken encoding for {model}, approximating token counts: {e}")
+        return None
+
+def count_tokens(text: str, model: str = "gpt-4") -> int:
+    """Number of tokens in a text for a model"""
+    if not text:
+        return 0
+
+    encoding = _encoding(model)
+    if encoding is None:
+        return len(_APPROXIMATE_PIECES.findall(text))
+    return len(encoding.encode(text, disallowed_special=()))
+
+def tokenizer_name(model: str = "gpt-4") -> str:
+    """"tiktoken" if counts for a model are exact, "approximate" if they use the fallback"""
+    return "approximate" if _encoding(model) is None else "tiktoken"
+
+def count_message_tokens(messages: List[Dict[str, str]], model: str = "gpt-4") -> int:
+    """Number of prompt tokens a list of chat messages costs, including formatting overhead"""
+    return sum(TOKENS_PER_MESSAGE + count_tokens(message.get("content") or "", model) for message in messages) + REPLY_PRIMING_TOKENS
+
+def context_window(model: str) -> int:
+    """Context window of a model in tokens (LLM_CONTEXT_WINDOW overrides the built-in table)"""
+    configured = int(os.getenv("LLM_CONTEXT_WINDOW", 0))
+    if configured:
+        return configured
+
+    for name in sorted(CONTEXT_WINDOWS, key=len, reverse=True):
+        if model.startswith(name):
+            return CONTEXT_WINDOWS[name]
+    return 8192
+
+def prompt_budget(model: str, max_tokens: int) -> int:
+    """
+    Tokens a prompt may use: the context window minus the completion allowance,
+    capped by PROMPT_TOKEN_BUDGET when set
+    """
+    budget = context_window(model) - max_tokens
+    configured = int(os.getenv("PROMPT_TOKEN_BUDGET", 0))
+    return min(budget, configured) if configured else budget
+
+class FittedPrompt(NamedTuple):
+    prompt: str
+    tokens: int
+    activities: int
+    items: int
+
+def fit_prompt(render: Callable[[int, int], str], system: str, model: str, budget: int,
+               activities: int = 0, items: int = 0) -> FittedPrompt:
+    """
+    Render a prompt, dropping the lowest-priority context until it fits a token budget
+
+    Older activities are dropped first, one at a time, then the lowest-ranked items
+    (found by binary search). At least one item is always kept; if the prompt still
+    doesn't fit it is sent as is and a warning is logged.
+
+    Args:
+        render: Renders the user prompt keeping the given numbers of (most recent activities, leading items)
+        system: System message sent with the prompt
+        model: Model the prompt is counted for
+        budget: Maximum prompt tokens, including the system message
+        activities: Number of activities available
+        items: Number of ranked items (e.g. products) available
+
+    Returns:
+        The prompt, its token count and the numbers of activities and items kept
+    """
+    fixed = 2 * TOKENS_PER_MESSAGE + REPLY_PRIMING_TOKENS + count_tokens(system, model)
+
+    def measure(kept_activities: int, kept_items: int) -> FittedPrompt:
+        prompt = render(kept_activities, kept_items)
+        return FittedPrompt(prompt, fixed + count_tokens(prompt, model), kept_activities, kept_items)
+
+    full = fitted = measure(activities, items)
+    while fitted.tokens > budget and fitted.activities > 0:
+        fitted = measure(fitted.activities - 1, items)
+
+    if fitted.tokens > budget and items > 1:
+        low, high = 1, items - 1
+        best = measure(fitted.activities, low)
+        while low < high:
+            middle = (low + high + 1) // 2
+            candidate = measure(fitted.activities, middle)
+            if candidate.tokens <= budget:
+                best, low = candidate, middle
+            else:
+                high = middle - 1
+        fitted = best
+
+    if fitted.tokens > budget:
+        logger.warning(f"Prompt of {fitted.tokens} tokens exceeds the budget of {budget} after trimming")
+    if fitted is not full:
+        get_token_meter().record_trimmed(full.tokens - fitted.tokens)
+        logger.info(
+            f"Trimmed prompt from {full.tokens} to {fitted.tokens} tokens "
+            f"({activities - fitted.activities} activities, {items - fitted.items} items dropped)"
+        )
+    return fitted
+
+# Label LLM usage is attributed to, set per request (e.g. "POST /api/analyze-customer")
+current_endpoint: ContextVar[str] = ContextVar("current_endpoint", default="unattributed")
+
+class TokenMeter:
+    """In-process token usage totals per endpoint"""
+
+    FIELDS = ("calls", "prompt_tokens", "completion_tokens", "trimmed_tokens")
+
+    def __init__(self):
+        self._usage: Dict[str, Dict[str, int]] = {}
+
+    def _entry(self, endpoint: Optional[str]) -> Dict[str, int]:
+        endpoint = endpoint or current_endpoint.get()
+        if endpoint not in self._usage:
+            self._usage[endpoint] = dict.fromkeys(self.FIELDS, 0)
+        return self._usage[endpoint]
+
+    def record(self, prompt_tokens: int, completion_tokens: int, endpoint: Optional[str] = None):
+        """Add one completion's usage to an endpoint (the current one by default)"""
+        entry = self._entry(endpoint)
+        entry["calls"] += 1
+        entry["prompt_tokens"] += prompt_tokens
+        entry["completion_tokens"] += completion_tokens
+
+    def record_trimmed(self, tokens: int, endpoint: Optional[str] = None):
+        """Add prompt tokens saved by trimming context to an endpoint"""
+        self._entry(endpoint)["trimmed_tokens"] += tokens
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Usage so far
+
+        Returns:
+            {"endpoints": {endpoint: usage}, "totals": usage, "tokenizer": name}, where usage
+            holds calls, prompt, completion, total and trimmed token counts. Counts made
+            locally (trimmed tokens, streamed completions) are estimates when the tokenizer
+            is "approximate"
+        """
+        totals = dict.fromkeys(self.FIELDS, 0)
+        endpoints = {}
+        for endpoint, entry in sorted(self._usage.items()):
+            endpoints[endpoint] = dict(entry, total_tokens=entry["prompt_tokens"] + entry["completion_tokens"])
+            for field in self.FIELDS:
+                totals[field] += entry[field]
+
+        totals["total_tokens"] = totals["prompt_tokens"] + totals["completion_tokens"]
+        return {"endpoints": endpoints, "totals": totals, "tokenizer": tokenizer_name()}
+
+    def reset(self):
+        self._usage.clear()
+
+_token_meter: Optional[TokenMeter] = None
+
+def get_token_meter() -> TokenMeter:
+    """Get the process-wide token meter"""
+    global _token_meter
+    if _token_meter is None:
+        _token_meter = TokenMeter()
+    return _token_meter
@@ -0,0 +1,56 @@
+"""
+Benchmark JSON extraction from LLM responses: greedy regex (previous approach) vs the
+balanced-brace scanner used by the agents.
+
+Run from the repository root:
+    python -m benchmarks.json_extraction
+"""
+import json
+import re
+import timeit
+
+from backend.agents.structured_output import parse_llm_json
+from backend.api.models import RecommendationOutput
+
+def greedy_regex(text: str):
+    """Previous approach: first "{" to last "}" in one greedy match"""
+    match = re.search(r'\{.*\}', text, re.DOTALL)
+    if not match:
+        return None
+    try:
+        return RecommendationOutput(**json.loads(match.group()))
+    except Exception:
+        return None
+
+def balanced_scanner(text: str):
+    return parse_llm_json(text, RecommendationOutput)
+
+def make_response(recommendations: int) -> str:
+    payload = {"recommendations": [
+        {
+            "product_id": i,
+            "match_score": 0.9,
+            "reasoning": "Matches the {industry} focus and \"brand visibility\" goal " * 3,
+            "customization_suggestions": ["Logo on front", "Navy and white"]
+        }
+        for i in range(recommendations)
+    ]}
+    return f"Here are my recommendations:\n```json\n{json.dumps(payload, indent=2)}\n```\nLet me know if you need more."
+
+CASES = {
+    "typical (8 recommendations)": make_response(8),
+    "large (5,000 recommendations)": make_response(5000),
+    "truncated (no closing braces)": make_response(500)[:-200],
+    "malformed (2,000 unclosed braces)": "Consider {" * 2000 + " the options.",
+    "stray braces before the JSON": "Use {company} and {name}. " * 200 + make_response(8),
+    "stray braces after the JSON": make_response(8) + " Placeholders: {company}, {name}.",
+}
+
+if __name__ == "__main__":
+    print(f"{'case':40} {'regex ms':>10} {'scanner ms':>11} {'regex ok':>9} {'scanner ok':>11}")
+    for name, text in CASES.items():
+        runs = 5
+        regex_ms = timeit.timeit(lambda: greedy_regex(text), number=runs) / runs * 1000
+        scanner_ms = timeit.timeit(lambda: balanced_scanner(text), number=runs) / runs * 1000
+        print(f"{name:40} {regex_ms:10.2f} {scanner_ms:11.2f} "
+              f"{str(greedy_regex(text) is not None):>9} {str(balanced_scanner(text) is not None):>11}")
@@ -112,6 +112,44 @@ class APIClient {
         return this.post('/create-mockup', data);
     }
 
+    // Mockup images are returned as server paths (/api/mockups/<id>.png); resolve them against the API origin
+    resolveUrl(path) {
+        return new URL(path, this.baseURL).href;
+    }
+
+    // Run analysis, recommendations, email and mockups in one call.
+    // The server streams one JSON line per finished stage; onStage is called for each.
+    async runPipeline(customerId, onStage, options = {}) {
+        const url = `${this.baseURL}/pipeline`;
+        const response = await fetch(url, {
+            method: 'POST',
+            headers: this.defaultHeaders,
+            body: JSON.stringify({ customer_id: customerId, ...options })
+        });
+
+        if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+
+        while (true) {
+            const { done, value } = await reader.read();
+            buffer += decoder.decode(value || new Uint8Array(), { stream: !done });
+
+            let newline;
+            while ((newline = buffer.indexOf('\n')) >= 0) {
+                const line = buffer.slice(0, newline).trim();
+                buffer = buffer.slice(newline + 1);
+                if (line) onStage(JSON.parse(line));
+            }
+
+            if (done) break;
+        }
+    }
+
     // Test API connection
     async testConnection() {
         try {
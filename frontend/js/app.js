@@ -328,39 +328,49 @@ async function startAnalysis() {
     try {
         showLoading('Starting AI Analysis', 'Initializing customer intelligence analysis...');
         
-        // Step 1: Customer Analysis
+        // All steps run server-side as one pipeline; stages stream back as they finish
         updateProcessingStatus('statusProfile', 'processing');
         updateLoading('Analyzing Customer Profile', 'Extracting company insights and behavioral patterns...');
         
-        currentAnalysis = await api.analyzeCustomer(currentCustomer);
-        updateProcessingStatus('statusProfile', 'complete');
-        
-        // Step 2: Product Recommendations
-        updateProcessingStatus('statusAnalysis', 'processing');
-        updateLoading('Generating Product Recommendations', 'Matching customer needs with optimal solutions...');
-        
-        currentRecommendations = await api.getProductRecommendations(currentCustomer);
-        updateProcessingStatus('statusAnalysis', 'complete');
-        
-        // Step 3: Email Generation
-        updateProcessingStatus('statusProducts', 'processing');
-        updateLoading('Preparing Email Generation', 'Setting up personalized email templates...');
-        
-        // Auto-generate email with first recommendation
-        if (currentRecommendations.recommendations.length > 0) {
-            const topProduct = currentRecommendations.recommendations[0];
-            selectedProducts.add(topProduct.product_id);
-            
-            const emailResult = await api.generateEmail(
-                currentCustomer, 
-                [topProduct.product_id], 
-                'consultative'
-            );
-            
-            updateProcessingStatus('statusProducts', 'complete');
-            updateProcessingStatus('statusEmail', 'complete');
+        let emailResult = null;
+        await api.runPipeline(currentCustomer, (event) => {
+            if (event.status && event.status !== 'ok') {
+                // Analysis and recommendations are required; email and mockups are best effort
+                if (event.stage === 'analysis' || event.stage === 'recommendations') {
+                    throw new Error(`Pipeline stage ${event.stage} failed: ${event.error}`);
+                }
+                return;
+            }
             
-            // Display results
+            if (event.stage === 'analysis') {
+                // Step 1: Customer Analysis
+                currentAnalysis = event.result;
+                updateProcessingStatus('statusProfile', 'complete');
+                updateProcessingStatus('statusAnalysis', 'processing');
+                updateLoading('Generating Product Recommendations', 'Matching customer needs with optimal solutions...');
+            } else if (event.stage === 'recommendations') {
+                // Step 2: Product Recommendations
+                currentRecommendations = event.result;
+                updateProcessingStatus('statusAnalysis', 'complete');
+                updateProcessingStatus('statusProducts', 'processing');
+                updateLoading('Preparing Email Generation', 'Setting up personalized email templates...');
+                
+                if (currentRecommendations.recommendations.length > 0) {
+                    selectedProducts.add(currentRecommendations.recommendations[0].product_id);
+                }
+            } else if (event.stage === 'email') {
+                // Step 3: Email Generation (for the top recommendation)
+                emailResult = event.result;
+                updateProcessingStatus('statusProducts', 'complete');
+                updateProcessingStatus('statusEmail', 'complete');
+            } else if (event.stage === 'mockups' && event.result.length > 0) {
+                // Mockups for the top recommendation render alongside the email
+                displayMockups(event.result[0]);
+            }
+        }, { email_style: 'consultative', email_product_count: 1, mockup_count: 1 });
+        
+        // Display results
+        if (emailResult) {
             displayResults(emailResult);
         }
         
@@ -529,12 +539,12 @@ async function generateMockups() {
 function displayMockups(mockupResult) {
     const gallery = document.getElementById('mockupGallery');
     
-    const mockupsHTML = mockupResult.mockup_images.map((imageData, index) => {
+    const mockupsHTML = mockupResult.mockup_images.map((imageUrl, index) => {
         const variation = mockupResult.variations[index] || { type: 'main', description: 'Main mockup' };
         
         return `
             <div class="mockup-item">
-                <img src="${imageData}" alt="Mockup ${index + 1}" class="mockup-image">
+                <img src="${api.resolveUrl(imageUrl)}" alt="Mockup ${index + 1}" class="mockup-image" loading="lazy">
                 <div class="mockup-info">
                     <div class="mockup-type">${variation.type}</div>
                     <div class="mockup-description">${variation.description}</div>